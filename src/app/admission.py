@@ -0,0 +1,315 @@
+import asyncio
+import math
+import os
+import time
+from typing import Optional
+
+from fastapi import HTTPException
+from starlette.responses import JSONResponse
+
+from src.app.jobs import GENERATE_GROUP, GENERATE_STREAM
+from src.app.metrics import ADMISSION_REJECTED
+from src.logger import log
+
+# Допуск запросов к /upload и /generate: ограничение частоты по клиенту
+# (token bucket в Redis - общий для всех процессов API), одновременных
+# загрузок в процессе и глубины очереди генерации. Отказ - 429 (клиент
+# превысил свою долю) или 503 (перегружен сервис) с Retry-After
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "1").lower() in ("1", "true", "yes")
+
+# Запросов в минуту на клиента и запас для всплеска; 0 - без ограничения
+RATE_LIMIT_UPLOAD_PER_MIN = float(os.getenv("RATE_LIMIT_UPLOAD_PER_MIN", "60"))
+RATE_LIMIT_UPLOAD_BURST = int(os.getenv("RATE_LIMIT_UPLOAD_BURST", "20"))
+RATE_LIMIT_GENERATE_PER_MIN = float(
+    os.getenv("RATE_LIMIT_GENERATE_PER_MIN", "120")
+)
+RATE_LIMIT_GENERATE_BURST = int(os.getenv("RATE_LIMIT_GENERATE_BURST", "40"))
+# Заголовок с идентификатором клиента; без него - адрес клиента
+RATE_LIMIT_CLIENT_HEADER = os.getenv("RATE_LIMIT_CLIENT_HEADER", "x-client-id")
+
+# Полосы: короткие документы (тело загрузки до SHORT_UPLOAD_BYTES, текст
+# до SHORT_DOCUMENT_CHARS) имеют свой лимит загрузок и принимаются
+# в очередь дольше длинных, поэтому поток больших файлов их не вытесняет
+SHORT_UPLOAD_BYTES = int(os.getenv("SHORT_UPLOAD_BYTES", str(1024 * 1024)))
+SHORT_DOCUMENT_CHARS = int(os.getenv("SHORT_DOCUMENT_CHARS", "8000"))
+UPLOAD_MAX_IN_FLIGHT_SHORT = int(os.getenv("UPLOAD_MAX_IN_FLIGHT_SHORT", "16"))
+UPLOAD_MAX_IN_FLIGHT_LONG = int(os.getenv("UPLOAD_MAX_IN_FLIGHT_LONG", "4"))
+
+# Очередь генерации: задач в ожидании и в работе у воркеров не больше
+# QUEUE_MAX_DEPTH, а оценка ожидания (глубина / измеренная скорость
+# выдачи задач воркерам) - не больше QUEUE_MAX_WAIT секунд (0 - без
+# оценки). Длинным документам достаётся доля QUEUE_LONG_SHARE лимитов
+QUEUE_MAX_DEPTH = int(os.getenv("QUEUE_MAX_DEPTH", "1000"))
+QUEUE_MAX_WAIT = float(os.getenv("QUEUE_MAX_WAIT", "120"))
+QUEUE_LONG_SHARE = float(os.getenv("QUEUE_LONG_SHARE", "0.5"))
+# Как часто (сек) перечитываем состояние очереди из Redis
+QUEUE_SAMPLE_INTERVAL = float(os.getenv("QUEUE_SAMPLE_INTERVAL", "1"))
+
+# Retry-After для отказов без оценки времени и верхняя граница оценки
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "2"))
+ADMISSION_MAX_RETRY_AFTER = int(os.getenv("ADMISSION_MAX_RETRY_AFTER", "60"))
+
+LANE_SHORT = "short"
+LANE_LONG = "long"
+
+RATE_KEY_PREFIX = "ratelimit:"
+
+# Token bucket: ведро пополняется со скоростью ARGV[1] токенов/с до
+# ёмкости ARGV[2], запрос забирает ARGV[3] токенов. Время - часы Redis,
+# одни на все процессы. KEYS[1] - ведро клиента.
+# Возвращает {1, 0} или {0, секунд до нужного числа токенов}
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+local wait = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+else
+    wait = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000) + 1000)
+return {allowed, tostring(wait)}
+"""
+
+
+def retry_after(seconds: float) -> str:
+    return str(min(ADMISSION_MAX_RETRY_AFTER, max(1, math.ceil(seconds))))
+
+
+def rejection(status_code: int, detail: str, seconds: float) -> HTTPException:
+    return HTTPException(
+        status_code=status_code,
+        detail=detail,
+        headers={"Retry-After": retry_after(seconds)},
+    )
+
+
+class AdmissionController:
+    """
+    Решение о приёме запроса. Состояние очереди (XINFO GROUPS) кэшируется
+    на QUEUE_SAMPLE_INTERVAL; по приросту entries-read между замерами
+    оценивается, сколько задач в секунду забирают воркеры, - пока очередь
+    не пуста, это и есть фактическая пропускная способность генерации
+    """
+
+    def __init__(
+        self,
+        redis_client,
+        max_depth: int = QUEUE_MAX_DEPTH,
+        max_wait: float = QUEUE_MAX_WAIT,
+        long_share: float = QUEUE_LONG_SHARE,
+    ):
+        self.redis = redis_client
+        self.max_depth = max_depth
+        self.max_wait = max_wait
+        self.long_share = long_share
+        self.limits = {
+            "upload": (RATE_LIMIT_UPLOAD_PER_MIN, RATE_LIMIT_UPLOAD_BURST),
+            "generate": (
+                RATE_LIMIT_GENERATE_PER_MIN, RATE_LIMIT_GENERATE_BURST
+            ),
+        }
+        self.max_in_flight = {
+            LANE_SHORT: UPLOAD_MAX_IN_FLIGHT_SHORT,
+            LANE_LONG: UPLOAD_MAX_IN_FLIGHT_LONG,
+        }
+        self.in_flight = {LANE_SHORT: 0, LANE_LONG: 0}
+        self._bucket = redis_client.register_script(TOKEN_BUCKET_SCRIPT)
+        self._sample_lock = asyncio.Lock()
+        self._sampled_at = 0.0
+        self._entries_read: Optional[int] = None
+        self.depth = 0
+        # Задач в секунду; None - ещё не измерено
+        self.drain_rate: Optional[float] = None
+
+    async def check_rate(self, route: str, client: str) -> None:
+        """429, если клиент исчерпал своё ведро для route"""
+        per_minute, burst = self.limits[route]
+        if per_minute <= 0:
+            return
+        try:
+            allowed, wait = await self._bucket(
+                keys=[f"{RATE_KEY_PREFIX}{route}:{client}"],
+                args=[per_minute / 60, max(1, burst), 1],
+            )
+        except Exception as e:
+            # Недоступный Redis не должен останавливать приём запросов
+            log.warning(f"Ограничение частоты недоступно: {e}")
+            return
+        if not int(allowed):
+            ADMISSION_REJECTED.inc(route=route, reason="rate_limit")
+            raise rejection(
+                429, "Слишком много запросов, повторите позже", float(wait)
+            )
+
+    def acquire_upload(self, lane: str) -> None:
+        """Место для загрузки в полосе lane; 503, если полоса заполнена"""
+        if self.in_flight[lane] >= self.max_in_flight[lane]:
+            ADMISSION_REJECTED.inc(route="upload", reason="in_flight", lane=lane)
+            raise rejection(
+                503, "Сервер перегружен, повторите загрузку позже",
+                ADMISSION_RETRY_AFTER,
+            )
+        self.in_flight[lane] += 1
+
+    def release_upload(self, lane: str) -> None:
+        self.in_flight[lane] -= 1
+
+    async def check_queue(self, lane: str, jobs: int = 1) -> None:
+        """503, если очередь генерации не примет jobs задач полосы lane"""
+        await self._sample()
+        share = 1.0 if lane == LANE_SHORT else self.long_share
+        max_depth = self.max_depth * share
+        depth = self.depth + jobs
+        if depth > max_depth:
+            ADMISSION_REJECTED.inc(route="generate", reason="depth", lane=lane)
+            raise rejection(
+                503, "Очередь генерации переполнена, повторите позже",
+                self._wait_for(depth - max_depth),
+            )
+        if self.max_wait and self.drain_rate:
+            max_wait = self.max_wait * share
+            if depth / self.drain_rate > max_wait:
+                ADMISSION_REJECTED.inc(
+                    route="generate", reason="wait", lane=lane
+                )
+                raise rejection(
+                    503, "Очередь генерации переполнена, повторите позже",
+                    depth / self.drain_rate - max_wait,
+                )
+
+    def _wait_for(self, jobs: float) -> float:
+        """Сколько секунд воркеры будут разбирать jobs задач"""
+        if not self.drain_rate:
+            return ADMISSION_RETRY_AFTER
+        return jobs / self.drain_rate
+
+    async def _sample(self) -> None:
+        if time.monotonic() - self._sampled_at < QUEUE_SAMPLE_INTERVAL:
+            return
+        async with self._sample_lock:
+            now = time.monotonic()
+            if now - self._sampled_at < QUEUE_SAMPLE_INTERVAL:
+                return  # замерил другой запрос, пока ждали
+            try:
+                groups = await self.redis.xinfo_groups(GENERATE_STREAM)
+            except Exception as e:
+                # Без Redis решение принимает сама запись задачи
+                log.warning(f"Состояние очереди недоступно: {e}")
+                return
+            group = next(
+                (g for g in groups if g["name"] == GENERATE_GROUP), None
+            )
+            if group is None:
+                return
+            entries_read = group.get("entries-read")
+            depth = int(group["pending"]) + int(group.get("lag") or 0)
+            if (
+                entries_read is not None
+                and self._entries_read is not None
+                and self.depth > 0
+            ):
+                # Скорость меряем, только пока воркерам было что брать:
+                # простой из-за пустой очереди - не предел мощности
+                rate = (entries_read - self._entries_read) / (
+                    now - self._sampled_at
+                )
+                self.drain_rate = rate if self.drain_rate is None else (
+                    0.7 * self.drain_rate + 0.3 * rate
+                )
+            self._entries_read = entries_read
+            self.depth = depth
+            self._sampled_at = now
+
+    def stats(self) -> dict:
+        return {
+            "enabled": ADMISSION_ENABLED,
+            "queue_depth": self.depth,
+            "drain_rate": self.drain_rate,
+            "max_depth": self.max_depth,
+            "max_wait": self.max_wait,
+            "in_flight": dict(self.in_flight),
+            "max_in_flight": dict(self.max_in_flight),
+        }
+
+
+def upload_lane(content_length: Optional[int]) -> str:
+    """Полоса загрузки по размеру тела (без content-length - длинная)"""
+    if content_length is not None and content_length <= SHORT_UPLOAD_BYTES:
+        return LANE_SHORT
+    return LANE_LONG
+
+
+def document_lane(text_length: Optional[int]) -> str:
+    """Полоса генерации по длине текста документа"""
+    if text_length is not None and text_length <= SHORT_DOCUMENT_CHARS:
+        return LANE_SHORT
+    return LANE_LONG
+
+
+def client_id(scope) -> str:
+    headers = dict(scope["headers"])
+    client = headers.get(RATE_LIMIT_CLIENT_HEADER.lower().encode())
+    if client:
+        return client.decode("latin-1")[:128]
+    return scope["client"][0] if scope.get("client") else "unknown"
+
+
+class AdmissionMiddleware:
+    """
+    Допуск POST /upload, /upload/batch и /generate до чтения тела:
+    отказ не стоит ни разбора multipart, ни обращения к документу.
+    Очередь генерации проверяет сам /generate - полоса зависит от длины
+    документа
+    """
+
+    ROUTES = {
+        "/upload": "upload",
+        "/upload/batch": "upload",
+        "/generate": "generate",
+    }
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        route = self.ROUTES.get(scope.get("path")) if (
+            scope["type"] == "http" and scope["method"] == "POST"
+        ) else None
+        controller = getattr(scope["app"].state, "admission", None) if (
+            route and ADMISSION_ENABLED
+        ) else None
+        if controller is None:
+            await self.app(scope, receive, send)
+            return
+
+        lane = None
+        try:
+            await controller.check_rate(route, client_id(scope))
+            if route == "upload":
+                length = dict(scope["headers"]).get(b"content-length")
+                lane = upload_lane(int(length) if length else None)
+                controller.acquire_upload(lane)
+        except HTTPException as e:
+            response = JSONResponse(
+                {"detail": e.detail}, status_code=e.status_code,
+                headers=e.headers,
+            )
+            await response(scope, receive, send)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            if lane:
+                controller.release_upload(lane)
@@ -1,22 +1,138 @@
-from typing import Dict
-from transformers import AutoModelForCausalLM, AutoTokenizer, BitsAndBytesConfig
+import copy
+import time
+from typing import Dict, List, Optional, Tuple
+from transformers import AutoTokenizer, DynamicCache
+from transformers.generation.streamers import BaseStreamer
 
 import torch
 import gc
 
+from src.app import metrics
+from src.app.backends import InferenceBackend, select_backend
+# Параметры генерации живут в модуле без torch; здесь они доступны
+# по-прежнему для кода, которому модель нужна в любом случае
+from src.app.generation_config import (
+    SUMMARY_PROMPT,
+    ANSWER_PROMPT,
+    MODEL_NAME,
+    MODEL_CACHE_DIR,
+    TINY_MODEL,
+    TINY_MODEL_NAME,
+    MAX_INPUT_TOKENS,
+    PREFIX_CACHE,
+    MEMORY_PRESSURE_THRESHOLD,
+    SAMPLING_KWARGS,
+    GREEDY_KWARGS,
+    DECODING_GREEDY,
+    GENERATION_KWARGS,
+    DECODING_MODES,
+    DECODING_MODE,
+    PROMPT_LOOKUP_TOKENS,
+    PROMPT_LOOKUP_MAX_NGRAM,
+    DRAFT_MODEL_NAME,
+    TokenCallback,
+)
 from src.logger import log
 
-# TODO: Настройка параметров генерации - длина ответа и стиль
-# TODO: RAG + FAISS
+
+class BatchTokenStreamer(BaseStreamer):
+    """
+    Стример для пакетной генерации: раскладывает новые токены по строкам
+    пачки и отдаёт готовые фрагменты текста в колбэк каждой строки.
+    Фрагменты режутся по пробелам, чтобы не отдавать половину слова.
+    """
+
+    def __init__(self, tokenizer, callbacks: List[Optional[TokenCallback]]):
+        self.tokenizer = tokenizer
+        self.callbacks = callbacks
+        self._tokens: List[List[int]] = [[] for _ in callbacks]
+        self._printed = [0] * len(callbacks)
+        self._prompt_skipped = False
+
+    def put(self, value):
+        # Первым вызовом generate передаёт сам промпт
+        if not self._prompt_skipped:
+            self._prompt_skipped = True
+            return
+        if value.dim() == 1:
+            value = value.unsqueeze(-1)
+        for row, callback in enumerate(self.callbacks):
+            if callback is None:
+                continue
+            self._tokens[row].extend(value[row].tolist())
+            text = self.tokenizer.decode(
+                self._tokens[row], skip_special_tokens=True
+            )
+            if text.endswith("\n"):
+                chunk = text[self._printed[row]:]
+                self._tokens[row] = []
+                self._printed[row] = 0
+            else:
+                chunk = text[self._printed[row]:text.rfind(" ") + 1]
+                self._printed[row] += len(chunk)
+            if chunk:
+                callback(chunk)
+
+    def end(self):
+        for row, callback in enumerate(self.callbacks):
+            if callback is None or not self._tokens[row]:
+                continue
+            text = self.tokenizer.decode(
+                self._tokens[row], skip_special_tokens=True
+            )
+            chunk = text[self._printed[row]:]
+            self._tokens[row] = []
+            self._printed[row] = 0
+            if chunk:
+                callback(chunk)
+
+
+class TimingStreamer(BaseStreamer):
+    """
+    Засекает появление первого нового токена - границу prefill и
+    декодирования - и передаёт токены дальше вложенному стримеру
+    """
+
+    def __init__(self, streamer: Optional[BaseStreamer] = None):
+        self.streamer = streamer
+        self.started = time.perf_counter()
+        self.first_token: Optional[float] = None
+        self._prompt_skipped = False
+
+    def put(self, value):
+        if not self._prompt_skipped:
+            self._prompt_skipped = True
+        elif self.first_token is None:
+            self.first_token = time.perf_counter()
+        if self.streamer is not None:
+            self.streamer.put(value)
+
+    def end(self):
+        if self.streamer is not None:
+            self.streamer.end()
 
 
 class ModelManager:
-    def __init__(self, model_name: str = "HuggingFaceTB/SmolLM3-3B"):
+    def __init__(
+        self,
+        model_name: Optional[str] = None,
+        backend: Optional[InferenceBackend] = None,
+    ):
         self.model = None
-        self.model_name = model_name
+        self.model_name = model_name or (
+            TINY_MODEL_NAME if TINY_MODEL else MODEL_NAME
+        )
         self.tokenizer = None
         self.is_loaded = False
-        self.device = "cuda"
+        self.backend = backend or select_backend()
+        self.device = self.backend.device
+        self.generation_kwargs = dict(GENERATION_KWARGS)
+        self.draft_model = None
+        self.draft_tokenizer = None
+        self._assisted_kwargs: dict = {}
+        # Шаблон промпта -> токены префикса и его KV-кэш
+        self._prefixes: Dict[str, Tuple[List[int], DynamicCache]] = {}
+        self.cache_flushes = 0
 
     def load_model(self):
         """Загрузка модели с кэшированием"""
@@ -24,113 +140,298 @@ class ModelManager:
             return
 
         try:
-            log.info(f"Загрузка модели: {self.model_name}")
-
-            # Конфигурация квантования
-            bnb_config = BitsAndBytesConfig(
-                load_in_4bit=True,
-                bnb_4bit_use_double_quant=True,
-                bnb_4bit_quant_type="nf4",
-                bnb_4bit_compute_dtype=torch.float16,
+            log.info(
+                f"Загрузка модели: {self.model_name} "
+                f"(бэкенд {self.backend.name})"
             )
 
-            self.model = AutoModelForCausalLM.from_pretrained(
-                self.model_name,
-                cache_dir="/model_data/smolLM3",
-                quantization_config=bnb_config,
-                low_cpu_mem_usage=True,
-                torch_dtype=torch.float16,
-                use_safetensors=True,
-            ).to("cuda")
+            self.model = self.backend.load(self.model_name, MODEL_CACHE_DIR)
 
             self.tokenizer = AutoTokenizer.from_pretrained(
                 self.model_name,
-                cache_dir="/model_data/smolLM3",
-                torch_dtype=torch.float16,
+                cache_dir=MODEL_CACHE_DIR,
             )
 
             self.device = next(self.model.parameters()).device
             self.is_loaded = True
 
             log.info(f"Модель загружена на устройство: {self.device}")
-            log.info(
-                f"VRAM: {torch.cuda.memory_allocated() / 1024**3:.2f} GB"
-            )
+            log.info(self.backend.memory_report())
 
         except Exception as e:
             log.error(f"Ошибка загрузки модели: {e}")
             raise
 
-    def _clear_cache(self):
-        """Очистка GPU кэша после инференса"""
-        if torch.cuda.is_available():
-            torch.cuda.empty_cache()
-            gc.collect()
+    def _clear_cache(self, force: bool = False):
+        """
+        Очистка кэша устройства и сборка мусора - только при нехватке
+        памяти (или force): на каждый запрос это лишняя синхронизация
+        и повторные выделения памяти в следующей генерации
+        """
+        if not force and (
+            self.backend.memory_pressure() < MEMORY_PRESSURE_THRESHOLD
+        ):
+            return
+        self.backend.clear_cache()
+        gc.collect()
+        self.cache_flushes += 1
 
     def _prepare_input(
         self,
-        text: str,
-        max_length: int = 2048,
+        texts: List[str],
+        max_length: int = MAX_INPUT_TOKENS,
     ) -> Dict[str, torch.Tensor]:
         """Подготовка входных данных с правильной токенизацией"""
+        # Для пакетной генерации паддинг слева, иначе генерация
+        # продолжится после pad-токенов
+        self.tokenizer.padding_side = "left"
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
         # Токенизация с учетом максимальной длины
         tokens = self.tokenizer(
-            text,
+            texts,
             return_tensors="pt",
             truncation=True,
             max_length=max_length,
-            padding=False,
+            padding=len(texts) > 1,
         )
         return {k: v.to(self.device) for k, v in tokens.items()}
 
+    def _fit_texts(
+        self,
+        texts: List[str],
+        template: str,
+        max_length: int = MAX_INPUT_TOKENS,
+    ) -> List[str]:
+        """
+        Обрезает тексты так, чтобы промпт влез в max_length целиком:
+        иначе усечение токенизатором срезает конец шаблона с маркером ответа
+        """
+        overhead = len(self.tokenizer(
+            template.format(text=""), add_special_tokens=True
+        )["input_ids"])
+        budget = max(1, max_length - overhead)
+        encoded = self.tokenizer(list(texts), add_special_tokens=False)
+        return [
+            text if len(ids) <= budget else self.tokenizer.decode(ids[:budget])
+            for text, ids in zip(texts, encoded["input_ids"])
+        ]
+
+    def _prefix(self, template: str) -> Tuple[List[int], DynamicCache]:
+        """Токены и KV-кэш части шаблона до {text} (считаются один раз)"""
+        if template not in self._prefixes:
+            prefix = template.split("{text}", 1)[0]
+            ids = self.tokenizer(prefix, add_special_tokens=True)["input_ids"]
+            cache = DynamicCache()
+            with torch.no_grad():
+                self.model(
+                    torch.tensor([ids], device=self.device),
+                    past_key_values=cache,
+                    use_cache=True,
+                )
+            self._prefixes[template] = (ids, cache)
+        return self._prefixes[template]
+
+    def _prepare_prefixed(
+        self,
+        texts: List[str],
+        template: str,
+        max_length: int = MAX_INPUT_TOKENS,
+    ) -> Dict[str, object]:
+        """
+        Вход генерации поверх закэшированного префикса шаблона.
+        Паддинг ставится между префиксом и текстом (маска внимания 0):
+        префикс у всех строк пачки на одних позициях, поэтому один кэш
+        префикса подходит всем строкам, а позиции текста идут сразу за ним
+        """
+        prefix_ids, prefix_cache = self._prefix(template)
+        # Текст и хвост шаблона кодируем отдельно: обрезается только текст,
+        # а маркер ответа в конце шаблона сохраняется
+        tail = template.split("{text}", 1)[1]
+        tail_ids = self.tokenizer(tail, add_special_tokens=False)["input_ids"]
+        budget = max(1, max_length - len(prefix_ids) - len(tail_ids))
+        suffixes = [
+            ids[:budget] + tail_ids
+            for ids in self.tokenizer(
+                list(texts), add_special_tokens=False
+            )["input_ids"]
+        ]
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        longest = max(len(ids) for ids in suffixes)
+        input_ids, attention_mask = [], []
+        for ids in suffixes:
+            pad = longest - len(ids)
+            input_ids.append(
+                prefix_ids + [self.tokenizer.pad_token_id] * pad + ids
+            )
+            attention_mask.append(
+                [1] * len(prefix_ids) + [0] * pad + [1] * len(ids)
+            )
+        # generate дописывает в кэш - работаем с копией
+        cache = copy.deepcopy(prefix_cache)
+        if len(texts) > 1:
+            cache.batch_repeat_interleave(len(texts))
+        return {
+            "input_ids": torch.tensor(input_ids, device=self.device),
+            "attention_mask": torch.tensor(attention_mask, device=self.device),
+            "past_key_values": cache,
+        }
+
+    def _load_draft(self):
+        """Черновая модель для assisted декодирования (при первом запросе)"""
+        if self.draft_model is not None:
+            return
+        log.info(f"Загрузка черновой модели: {DRAFT_MODEL_NAME}")
+        self.draft_model = self.backend.load(DRAFT_MODEL_NAME, MODEL_CACHE_DIR)
+        self.draft_tokenizer = AutoTokenizer.from_pretrained(
+            DRAFT_MODEL_NAME,
+            cache_dir=MODEL_CACHE_DIR,
+        )
+        self._assisted_kwargs = {"assistant_model": self.draft_model}
+        if self.draft_tokenizer.get_vocab() != self.tokenizer.get_vocab():
+            # Разные словари: transformers перекодирует кандидатов
+            # через текст (universal assisted decoding)
+            self._assisted_kwargs["tokenizer"] = self.tokenizer
+            self._assisted_kwargs["assistant_tokenizer"] = self.draft_tokenizer
+
+    def _decoding_kwargs(self, mode: str) -> dict:
+        """Аргументы generate для режима декодирования"""
+        if mode == "default":
+            return {}
+        if mode == "prompt_lookup":
+            return {
+                "prompt_lookup_num_tokens": PROMPT_LOOKUP_TOKENS,
+                "max_matching_ngram_size": PROMPT_LOOKUP_MAX_NGRAM,
+            }
+        if mode == "assisted":
+            self._load_draft()
+            return self._assisted_kwargs
+        raise ValueError(f"Неизвестный режим декодирования: {mode}")
+
+    def count_tokens(
+        self,
+        texts: List[str],
+        prompt: Optional[str] = None,
+    ) -> List[int]:
+        """Длина промптов в токенах (для группировки по длине)"""
+        if not self.is_loaded:
+            self.load_model()
+        template = prompt or SUMMARY_PROMPT
+        encoded = self.tokenizer(
+            [template.format(text=text) for text in texts],
+            add_special_tokens=True,
+        )
+        return [len(ids) for ids in encoded["input_ids"]]
+
     def summarize(self, text: str, max_new_tokens: int = 150) -> str:
         """Генерация краткого содержания"""
+        return self.summarize_batch([text], max_new_tokens)[0]
+
+    def summarize_batch(
+        self,
+        texts: List[str],
+        max_new_tokens: int = 150,
+        callbacks: Optional[List[Optional[TokenCallback]]] = None,
+        prompt: Optional[str] = None,
+        decoding: Optional[str] = None,
+    ) -> List[str]:
+        """
+        Генерация кратких содержаний пачкой за один вызов generate.
+        callbacks - по колбэку на текст (или None) для потоковой выдачи.
+        prompt - шаблон с {text} вместо SUMMARY_PROMPT (например, ANSWER_PROMPT).
+        decoding - режим из DECODING_MODES (по умолчанию DECODING_MODE).
+        """
         if not self.is_loaded:
             self.load_model()
 
+        mode = decoding or DECODING_MODE
+        if mode != "default" and len(texts) > 1:
+            # Спекулятивное декодирование в transformers работает только
+            # с пачкой из одной строки
+            callbacks = callbacks or [None] * len(texts)
+            return [
+                self.summarize_batch(
+                    [text], max_new_tokens, [callback], prompt, mode
+                )[0]
+                for text, callback in zip(texts, callbacks)
+            ]
+
         try:
-            prompt = f"""
-            <|system|>You are an assistant that creates concise
-            and accurate document summaries.
-            <|user|>Here is a document text.
-            Create a brief summary (1-2 paragraphs)
-            that captures the main topic and key ideas.
-            Use plain text format only, no markdown or HTML tags:
-            {text}
-            Summary:<|assistant|>"""
-            inputs = self._prepare_input(prompt)
+            template = prompt or SUMMARY_PROMPT
+            if PREFIX_CACHE:
+                inputs = self._prepare_prefixed(texts, template)
+            else:
+                inputs = self._prepare_input([
+                    template.format(text=text)
+                    for text in self._fit_texts(texts, template)
+                ])
+            streamer = None
+            if callbacks and any(callbacks):
+                streamer = BatchTokenStreamer(self.tokenizer, callbacks)
+            timing = TimingStreamer(streamer)
 
             # Генерация с настроенным декодированием
             with torch.no_grad():
                 outputs = self.model.generate(
                     **inputs,
                     max_new_tokens=max_new_tokens,
-                    do_sample=True,
-                    temperature=0.7,
-                    top_p=0.9,
-                    repetition_penalty=1.2,
-                    pad_token_id=self.tokenizer.eos_token_id,
+                    pad_token_id=self.tokenizer.pad_token_id,
+                    streamer=timing,
+                    **self.generation_kwargs,
+                    **self._decoding_kwargs(mode),
                 )
+            finished = time.perf_counter()
 
             # Извлечение только сгенерированной части
-            generated_tokens = outputs[0][inputs['input_ids'].shape[1]:]
-            summary = self.tokenizer.decode(
+            # (при левом паддинге все промпты заканчиваются в одной позиции)
+            generated_tokens = outputs[:, inputs['input_ids'].shape[1]:]
+            summaries = self.tokenizer.batch_decode(
                 generated_tokens,
                 skip_special_tokens=True,
             )
+            self._observe(inputs, generated_tokens, timing, finished, mode)
 
-            return summary.strip()
-
-        finally:
             self._clear_cache()
+            return [summary.strip() for summary in summaries]
+
+        except Exception:
+            # После ошибки (например, OOM) память освобождаем всегда
+            self._clear_cache(force=True)
+            raise
+
+    def _observe(self, inputs, generated_tokens, timing, finished, mode):
+        """Метрики вызова generate: токены, prefill/декодирование, память"""
+        input_tokens = inputs["attention_mask"].sum(dim=1).tolist()
+        output_tokens = (
+            generated_tokens != self.tokenizer.pad_token_id
+        ).sum(dim=1).tolist()
+        first_token = timing.first_token or finished
+        prefill = first_token - timing.started
+        decode = finished - first_token
+        metrics.MODEL_BATCH_SIZE.observe(len(input_tokens), mode=mode)
+        metrics.MODEL_PREFILL_SECONDS.observe(prefill, mode=mode)
+        metrics.MODEL_DECODE_SECONDS.observe(decode, mode=mode)
+        for count in input_tokens:
+            metrics.MODEL_INPUT_TOKENS.observe(count, mode=mode)
+        for count in output_tokens:
+            metrics.MODEL_OUTPUT_TOKENS.observe(count, mode=mode)
+        if decode > 0:
+            # Первый токен каждой строки - итог prefill, а не декодирования
+            decoded = sum(output_tokens) - len(output_tokens)
+            metrics.MODEL_TOKENS_PER_SECOND.observe(decoded / decode, mode=mode)
+        metrics.MODEL_MEMORY_BYTES.set(
+            self.backend.memory_used(), backend=self.backend.name
+        )
 
     def unload_model(self):
         """Освобождение ресурсов"""
-        if self.model:
-            del self.model
-        if self.tokenizer:
-            del self.tokenizer
-        self._clear_cache()
+        self.model = None
+        self.tokenizer = None
+        self.draft_model = None
+        self.draft_tokenizer = None
+        self._prefixes.clear()
+        self._clear_cache(force=True)
         self.is_loaded = False
         log.info("Модель выгружена")
 
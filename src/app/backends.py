@@ -0,0 +1,172 @@
+import os
+from abc import ABC, abstractmethod
+
+import torch
+
+from src.logger import log
+
+# auto - CUDA при наличии, иначе CPU; либо явно cuda / cpu
+INFERENCE_DEVICE = os.getenv("INFERENCE_DEVICE", "auto")
+# Точность на CPU: bf16, fp32 или int8 (динамическое квантование Linear)
+CPU_PRECISION = os.getenv("CPU_PRECISION", "bf16")
+# 0 - оставить значение torch по умолчанию
+TORCH_NUM_THREADS = int(os.getenv("TORCH_NUM_THREADS", "0"))
+TORCH_INTEROP_THREADS = int(os.getenv("TORCH_INTEROP_THREADS", "0"))
+
+
+class InferenceBackend(ABC):
+    """Способ загрузки модели под конкретное устройство"""
+
+    name: str = ""
+
+    @property
+    @abstractmethod
+    def device(self) -> str:
+        """Устройство, на которое кладём входные тензоры"""
+
+    @abstractmethod
+    def load(self, model_name: str, cache_dir: str):
+        """Загрузка модели с подходящими для устройства настройками"""
+
+    def clear_cache(self) -> None:
+        """Освобождение кэша аллокатора устройства"""
+
+    def memory_report(self) -> str:
+        """Строка с текущим потреблением памяти для логов"""
+        return ""
+
+    def memory_pressure(self) -> float:
+        """Доля занятой памяти устройства (0..1)"""
+        return 0.0
+
+    def memory_used(self) -> int:
+        """Байт памяти под модель - для метрик"""
+        return 0
+
+
+class CUDABackend(InferenceBackend):
+    """GPU: 4-bit квантование bitsandbytes"""
+
+    name = "cuda"
+
+    @property
+    def device(self) -> str:
+        return "cuda"
+
+    def load(self, model_name: str, cache_dir: str):
+        from transformers import AutoModelForCausalLM, BitsAndBytesConfig
+
+        # Конфигурация квантования
+        bnb_config = BitsAndBytesConfig(
+            load_in_4bit=True,
+            bnb_4bit_use_double_quant=True,
+            bnb_4bit_quant_type="nf4",
+            bnb_4bit_compute_dtype=torch.float16,
+        )
+
+        return AutoModelForCausalLM.from_pretrained(
+            model_name,
+            cache_dir=cache_dir,
+            quantization_config=bnb_config,
+            low_cpu_mem_usage=True,
+            torch_dtype=torch.float16,
+            use_safetensors=True,
+        ).to("cuda")
+
+    def clear_cache(self) -> None:
+        torch.cuda.empty_cache()
+
+    def memory_report(self) -> str:
+        return f"VRAM: {torch.cuda.memory_allocated() / 1024**3:.2f} GB"
+
+    def memory_used(self) -> int:
+        return torch.cuda.memory_allocated()
+
+    def memory_pressure(self) -> float:
+        # Свободная память с точки зрения драйвера: зарезервированное
+        # аллокатором torch считается занятым - его и отдаёт clear_cache
+        free, total = torch.cuda.mem_get_info()
+        return 1 - free / total
+
+
+class CPUBackend(InferenceBackend):
+    """CPU: bf16/fp32 или динамическое int8 квантование"""
+
+    name = "cpu"
+
+    def __init__(
+        self,
+        precision: str = CPU_PRECISION,
+        num_threads: int = TORCH_NUM_THREADS,
+        interop_threads: int = TORCH_INTEROP_THREADS,
+    ):
+        if precision not in ("bf16", "fp32", "int8"):
+            raise ValueError(f"Неизвестная точность для CPU: {precision}")
+        self.precision = precision
+        self.num_threads = num_threads
+        self.interop_threads = interop_threads
+
+    @property
+    def device(self) -> str:
+        return "cpu"
+
+    def _configure_threads(self):
+        if self.num_threads:
+            torch.set_num_threads(self.num_threads)
+        if self.interop_threads:
+            try:
+                torch.set_interop_threads(self.interop_threads)
+            except RuntimeError:
+                # Можно задать только до первого параллельного вызова
+                log.warning("torch interop threads уже инициализированы")
+
+    def load(self, model_name: str, cache_dir: str):
+        from transformers import AutoModelForCausalLM
+
+        self._configure_threads()
+        dtype = torch.bfloat16 if self.precision == "bf16" else torch.float32
+        model = AutoModelForCausalLM.from_pretrained(
+            model_name,
+            cache_dir=cache_dir,
+            low_cpu_mem_usage=True,
+            torch_dtype=dtype,
+            use_safetensors=True,
+        )
+        if self.precision == "int8":
+            model = torch.ao.quantization.quantize_dynamic(
+                model,
+                {torch.nn.Linear},
+                dtype=torch.qint8,
+            )
+        model.eval()
+        return model
+
+    def memory_report(self) -> str:
+        import psutil
+
+        rss = psutil.Process().memory_info().rss
+        return (
+            f"RSS: {rss / 1024**3:.2f} GB, "
+            f"precision={self.precision}, threads={torch.get_num_threads()}"
+        )
+
+    def memory_pressure(self) -> float:
+        import psutil
+
+        return psutil.virtual_memory().percent / 100
+
+    def memory_used(self) -> int:
+        import psutil
+
+        return psutil.Process().memory_info().rss
+
+
+def select_backend(device: str = INFERENCE_DEVICE) -> InferenceBackend:
+    """Выбор бэкенда по настройке или по доступному железу"""
+    if device == "auto":
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+    if device == "cuda":
+        return CUDABackend()
+    if device == "cpu":
+        return CPUBackend()
+    raise ValueError(f"Неизвестное устройство инференса: {device}")
@@ -0,0 +1,391 @@
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+from src.app.metrics import (
+    SCHEDULER_COST_RATIO,
+    SCHEDULER_PENDING,
+    SCHEDULER_WAIT_SECONDS,
+    percentile,
+)
+from src.logger import log
+
+TokenCallback = Callable[[str], None]
+
+# Максимальный размер пачки и время ожидания её наполнения
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "8"))
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "50"))
+# Во сколько раз длинный промпт может превышать короткий в одной пачке,
+# иначе пачка делится на корзины по длине (меньше паддинга)
+BATCH_BUCKET_RATIO = float(os.getenv("BATCH_BUCKET_RATIO", "2.0"))
+# Предел токенов пачки: size * (самый длинный промпт + max_new_tokens),
+# от него зависят память под KV-кэш и время шага декодирования
+BATCH_MAX_TOKENS = int(os.getenv("BATCH_MAX_TOKENS", "16384"))
+# Старение: секунда ожидания уменьшает оценку стоимости запроса на
+# столько токенов, поэтому длинные запросы не голодают за короткими
+SCHEDULER_AGING_TOKENS = float(os.getenv("SCHEDULER_AGING_TOKENS", "200"))
+# Сколько последних пачек храним для метрик
+BATCH_STATS_WINDOW = int(os.getenv("BATCH_STATS_WINDOW", "1000"))
+
+
+@dataclass
+class _Request:
+    text: str
+    max_new_tokens: int
+    on_token: Optional[TokenCallback] = None
+    # Шаблон промпта (None - SUMMARY_PROMPT модели)
+    prompt: Optional[str] = None
+    # Режим декодирования (None - DECODING_MODE модели)
+    decoding: Optional[str] = None
+    future: Future = field(default_factory=Future)
+    submitted_at: float = field(default_factory=time.perf_counter)
+    # Длина промпта в токенах, считается потоком планировщика
+    tokens: int = 0
+
+    @property
+    def cost(self) -> int:
+        """Оценка стоимости в токенах: промпт и максимум генерации"""
+        return self.tokens + self.max_new_tokens
+
+    @property
+    def group(self) -> tuple:
+        # В одну пачку попадают запросы с одинаковым max_new_tokens,
+        # шаблоном и режимом декодирования
+        return (self.max_new_tokens, self.prompt, self.decoding)
+
+
+@dataclass
+class BatchStats:
+    """Метрики одного вызова generate"""
+    size: int
+    prompt_tokens: int
+    padded_tokens: int
+    queue_wait_ms: float
+    inference_ms: float
+    # Прогноз inference_ms по модели стоимости (None - ещё не обучена)
+    predicted_ms: Optional[float] = None
+
+
+class CostModel:
+    """
+    Прогноз времени пачки: a * токены промптов с паддингом (prefill) +
+    b * max_new_tokens (шаги декодирования - на небольших пачках их
+    длительность почти не зависит от размера пачки). Коэффициенты -
+    метод наименьших квадратов с экспоненциальным забыванием
+    """
+
+    def __init__(self, decay: float = 0.95):
+        self.decay = decay
+        self.observations = 0
+        # Суммы x1*x1, x1*x2, x2*x2, x1*y, x2*y
+        self._sums = [0.0] * 5
+
+    def update(self, padded_tokens: int, steps: int, seconds: float):
+        x1, x2 = float(padded_tokens), float(steps)
+        for i, value in enumerate((x1 * x1, x1 * x2, x2 * x2, x1 * seconds,
+                                   x2 * seconds)):
+            self._sums[i] = self._sums[i] * self.decay + value
+        self.observations += 1
+
+    def coefficients(self) -> Optional[tuple[float, float]]:
+        if self.observations < 2:
+            return None
+        s11, s12, s22, s1y, s2y = self._sums
+        # Небольшая регуляризация: при одинаковых пачках система вырождена
+        ridge = 1e-6 * (s11 + s22)
+        s11, s22 = s11 + ridge, s22 + ridge
+        det = s11 * s22 - s12 * s12
+        if det <= 0:
+            return None
+        return (
+            max(0.0, (s1y * s22 - s2y * s12) / det),
+            max(0.0, (s2y * s11 - s1y * s12) / det),
+        )
+
+    def predict(self, padded_tokens: int, steps: int) -> Optional[float]:
+        coefficients = self.coefficients()
+        if coefficients is None:
+            return None
+        per_token, per_step = coefficients
+        return per_token * padded_tokens + per_step * steps
+
+
+class BatchScheduler:
+    """
+    Собирает одиночные запросы в пачки для ModelManager.summarize_batch.
+    Ожидающие запросы копятся в пуле, пока их меньше max_batch_size и
+    самый старый ждёт меньше max_wait_ms. Очередную пачку открывает
+    запрос с наименьшей оценкой - стоимость в токенах минус старение
+    (shortest job first), - к нему добираются совместимые запросы
+    близкой длины в пределах max_batch_tokens.
+    """
+
+    def __init__(
+        self,
+        manager,
+        max_batch_size: int = BATCH_MAX_SIZE,
+        max_wait_ms: float = BATCH_MAX_WAIT_MS,
+        bucket_ratio: float = BATCH_BUCKET_RATIO,
+        max_batch_tokens: int = BATCH_MAX_TOKENS,
+        aging_tokens: float = SCHEDULER_AGING_TOKENS,
+    ):
+        self.manager = manager
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.bucket_ratio = bucket_ratio
+        self.max_batch_tokens = max_batch_tokens
+        self.aging_tokens = aging_tokens
+        self.stats: deque[BatchStats] = deque(maxlen=BATCH_STATS_WINDOW)
+        self._queue: queue.Queue[_Request | None] = queue.Queue()
+        self._pending: list[_Request] = []
+        self._thread: threading.Thread | None = None
+        self.cost_model = CostModel()
+        # Пачки, открытые не самым дешёвым запросом благодаря старению
+        self.aged = 0
+
+    def start(self):
+        """Запуск фонового потока, выполняющего пачки"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(
+            target=self._loop,
+            name="batch-scheduler",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def stop(self):
+        """Остановка после обработки уже поставленных запросов"""
+        if self._thread:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def submit(
+        self,
+        text: str,
+        max_new_tokens: int = 150,
+        on_token: Optional[TokenCallback] = None,
+        prompt: Optional[str] = None,
+        decoding: Optional[str] = None,
+    ) -> Future:
+        """
+        Ставит текст в очередь, результат придёт во Future.
+        on_token вызывается из потока генерации на каждый фрагмент текста.
+        """
+        self.start()
+        request = _Request(text, max_new_tokens, on_token, prompt, decoding)
+        self._queue.put(request)
+        return request.future
+
+    def summarize(self, text: str, max_new_tokens: int = 150) -> str:
+        """Блокирующий вызов с тем же контрактом, что у ModelManager"""
+        return self.submit(text, max_new_tokens).result()
+
+    def _loop(self):
+        stopping = False
+        while True:
+            if not self._pending:
+                if stopping:
+                    return
+                first = self._queue.get()
+                if first is None:
+                    return
+                self._admit([first])
+                if not self._pending:
+                    # Длину не удалось посчитать - future уже с ошибкой
+                    continue
+            if not stopping:
+                stopping = self._collect()
+            SCHEDULER_PENDING.set(len(self._pending))
+            if not self._pending:
+                continue
+            requests = self._select()
+            self._run(requests, *requests[0].group)
+
+    def _collect(self) -> bool:
+        """
+        Принимает новые запросы, пока в пуле меньше max_batch_size и
+        самый старый ждёт меньше max_wait; пришедшие сверх того тоже
+        попадают в пул. Возвращает True, если пора останавливаться
+        """
+        arrived: list[_Request] = []
+        if not self._pending:
+            return False
+        oldest = min(request.submitted_at for request in self._pending)
+        deadline = oldest + self.max_wait
+        stopping = False
+        while True:
+            timeout = deadline - time.perf_counter()
+            wait = len(self._pending) + len(arrived) < self.max_batch_size
+            try:
+                if wait and timeout > 0:
+                    request = self._queue.get(timeout=timeout)
+                else:
+                    request = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if request is None:
+                stopping = True
+                break
+            arrived.append(request)
+        self._admit(arrived)
+        return stopping
+
+    def _admit(self, requests: list[_Request]):
+        """Длины промптов новых запросов и их добавление в пул"""
+        by_prompt: dict[Optional[str], list[_Request]] = {}
+        for request in requests:
+            by_prompt.setdefault(request.prompt, []).append(request)
+        for prompt, group in by_prompt.items():
+            try:
+                lengths = self.manager.count_tokens(
+                    [request.text for request in group], prompt
+                )
+            except Exception as e:
+                for request in group:
+                    request.future.set_exception(e)
+                continue
+            for request, length in zip(group, lengths):
+                request.tokens = length
+                self._pending.append(request)
+
+    def _score(self, request: _Request, now: float) -> float:
+        return request.cost - self.aging_tokens * (now - request.submitted_at)
+
+    def _select(self) -> list[_Request]:
+        """
+        Пачка из пула: первым идёт запрос с наименьшей оценкой, за ним -
+        совместимые запросы в порядке оценки, не длиннее (и не короче)
+        первого больше чем в bucket_ratio раз (меньше паддинга), пока
+        пачка укладывается в max_batch_tokens
+        """
+        now = time.perf_counter()
+        ranked = sorted(self._pending, key=lambda r: self._score(r, now))
+        first = ranked[0]
+        if first.cost > min(request.cost for request in ranked):
+            self.aged += 1
+        batch = [first]
+        longest = first.tokens
+        for request in ranked[1:]:
+            if len(batch) >= self.max_batch_size:
+                break
+            if request.group != first.group:
+                continue
+            shorter, longer = sorted((first.tokens, request.tokens))
+            if longer > max(1, shorter) * self.bucket_ratio:
+                continue
+            batch_tokens = (len(batch) + 1) * (
+                max(longest, request.tokens) + first.max_new_tokens
+            )
+            if batch_tokens > self.max_batch_tokens:
+                continue
+            batch.append(request)
+            longest = max(longest, request.tokens)
+        chosen = set(map(id, batch))
+        self._pending = [r for r in self._pending if id(r) not in chosen]
+        return batch
+
+    def _run(
+        self,
+        requests: list[_Request],
+        max_new_tokens: int,
+        prompt: Optional[str] = None,
+        decoding: Optional[str] = None,
+    ):
+        padded = len(requests) * max(request.tokens for request in requests)
+        predicted = self.cost_model.predict(padded, max_new_tokens)
+        started = time.perf_counter()
+        try:
+            summaries = self.manager.summarize_batch(
+                [request.text for request in requests],
+                max_new_tokens,
+                [request.on_token for request in requests],
+                prompt,
+                decoding,
+            )
+        except Exception as e:
+            log.error(f"Ошибка пакетной генерации: {e}", exc_info=True)
+            for request in requests:
+                request.future.set_exception(e)
+            return
+        finished = time.perf_counter()
+
+        for request, summary in zip(requests, summaries):
+            request.future.set_result(summary)
+        self._record(requests, started, finished, predicted)
+
+    def _record(
+        self,
+        requests: list[_Request],
+        started: float,
+        finished: float,
+        predicted: Optional[float],
+    ):
+        longest = max(request.tokens for request in requests)
+        elapsed = finished - started
+        stats = BatchStats(
+            size=len(requests),
+            prompt_tokens=sum(request.tokens for request in requests),
+            padded_tokens=longest * len(requests),
+            queue_wait_ms=(
+                started - min(request.submitted_at for request in requests)
+            ) * 1000,
+            inference_ms=elapsed * 1000,
+            predicted_ms=None if predicted is None else predicted * 1000,
+        )
+        self.stats.append(stats)
+        for request in requests:
+            SCHEDULER_WAIT_SECONDS.observe(started - request.submitted_at)
+        if predicted:
+            SCHEDULER_COST_RATIO.observe(elapsed / predicted)
+
+        # Модель стоимости учится на каждой пачке
+        self.cost_model.update(
+            stats.padded_tokens, requests[0].max_new_tokens, elapsed
+        )
+        log.info(
+            f"Пачка: size={stats.size}, tokens={stats.prompt_tokens}/"
+            f"{stats.padded_tokens}, wait={stats.queue_wait_ms:.0f}ms, "
+            f"inference={stats.inference_ms:.0f}ms"
+            + (f" (прогноз {stats.predicted_ms:.0f}ms)" if predicted else "")
+        )
+
+    def metrics(self) -> dict:
+        """Сводка по последним пачкам: throughput и перцентили задержки"""
+        if not self.stats:
+            return {"batches": 0}
+        stats = list(self.stats)
+        latencies = sorted(s.queue_wait_ms + s.inference_ms for s in stats)
+        waits = sorted(s.queue_wait_ms for s in stats)
+        total_ms = sum(s.inference_ms for s in stats)
+        # Ошибка прогноза: |факт / прогноз - 1| по пачкам с прогнозом
+        errors = sorted(
+            abs(s.inference_ms / s.predicted_ms - 1)
+            for s in stats if s.predicted_ms
+        )
+
+        return {
+            "batches": len(stats),
+            "avg_batch_size": sum(s.size for s in stats) / len(stats),
+            "padding_ratio": (
+                sum(s.padded_tokens for s in stats)
+                / max(1, sum(s.prompt_tokens for s in stats))
+            ),
+            "docs_per_sec": sum(s.size for s in stats) / (total_ms / 1000)
+            if total_ms else 0.0,
+            "latency_p50_ms": percentile(latencies, 0.5),
+            "latency_p99_ms": percentile(latencies, 0.99),
+            "queue_wait_p50_ms": percentile(waits, 0.5),
+            "queue_wait_p99_ms": percentile(waits, 0.99),
+            "cost_error_p50": percentile(errors, 0.5) if errors else None,
+            "cost_error_p90": percentile(errors, 0.9) if errors else None,
+            "cost_model": self.cost_model.coefficients(),
+            "aged_batches": self.aged,
+            "pending": len(self._pending),
+        }
@@ -0,0 +1,35 @@
+import os
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # zstd необязателен, без него используем zlib
+    zstandard = None
+
+# Уровень сжатия текста документов (zstd: 1-22, zlib: 1-9)
+TEXT_COMPRESSION_LEVEL = int(os.getenv("TEXT_COMPRESSION_LEVEL", "3"))
+
+# Первый байт блоба - кодек, чтобы читать данные, записанные любым из них
+_ZSTD = b"Z"
+_ZLIB = b"z"
+
+
+def compress_text(text: str, level: int = TEXT_COMPRESSION_LEVEL) -> bytes:
+    """Сжатие текста (zstd, если установлен, иначе zlib)"""
+    data = text.encode("utf-8")
+    if zstandard is not None:
+        return _ZSTD + zstandard.ZstdCompressor(level=level).compress(data)
+    return _ZLIB + zlib.compress(data, min(level, 9))
+
+
+def decompress_text(blob: bytes) -> str:
+    codec, payload = blob[:1], blob[1:]
+    if codec == _ZSTD:
+        if zstandard is None:
+            raise RuntimeError("Для чтения данных нужен пакет zstandard")
+        data = zstandard.ZstdDecompressor().decompress(payload)
+    elif codec == _ZLIB:
+        data = zlib.decompress(payload)
+    else:
+        raise ValueError(f"Неизвестный кодек сжатия: {codec!r}")
+    return data.decode("utf-8")
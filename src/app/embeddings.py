@@ -0,0 +1,82 @@
+import os
+import threading
+from typing import List
+
+import numpy as np
+import torch
+from transformers import AutoModel, AutoTokenizer
+
+from src.app.generation_config import MODEL_CACHE_DIR
+from src.logger import log
+
+# Небольшой энкодер, которому хватает CPU
+EMBEDDING_MODEL = os.getenv(
+    "EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2"
+)
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+# Предел длины чанка для энкодера в токенах
+EMBEDDING_MAX_TOKENS = int(os.getenv("EMBEDDING_MAX_TOKENS", "256"))
+
+
+class EmbeddingModel:
+    """
+    Векторизация текста энкодером: mean pooling по токенам и L2-нормировка,
+    поэтому косинусная близость равна скалярному произведению
+    """
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL):
+        self.model_name = model_name
+        self.model = None
+        self.tokenizer = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_loaded(self) -> bool:
+        return self.model is not None
+
+    def load(self):
+        with self._lock:
+            if self.is_loaded:
+                return
+            log.info(f"Загрузка энкодера: {self.model_name}")
+            self.tokenizer = AutoTokenizer.from_pretrained(
+                self.model_name, cache_dir=MODEL_CACHE_DIR
+            )
+            self.model = AutoModel.from_pretrained(
+                self.model_name, cache_dir=MODEL_CACHE_DIR
+            ).eval()
+
+    @property
+    def dim(self) -> int:
+        self.load()
+        return self.model.config.hidden_size
+
+    def encode(
+        self,
+        texts: List[str],
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+    ) -> np.ndarray:
+        """Матрица (len(texts), dim) float32 с нормированными строками"""
+        self.load()
+        vectors = []
+        for start in range(0, len(texts), batch_size):
+            batch = texts[start:start + batch_size]
+            tokens = self.tokenizer(
+                batch,
+                padding=True,
+                truncation=True,
+                max_length=EMBEDDING_MAX_TOKENS,
+                return_tensors="pt",
+            )
+            with torch.no_grad():
+                hidden = self.model(**tokens).last_hidden_state
+            mask = tokens["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+            pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+            pooled = torch.nn.functional.normalize(pooled, dim=-1)
+            vectors.append(pooled.float().numpy())
+        if not vectors:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.concatenate(vectors)
+
+
+embedding_model = EmbeddingModel()
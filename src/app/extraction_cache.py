@@ -0,0 +1,147 @@
+import asyncio
+import os
+import time
+from typing import Optional
+
+from src.app.compression import compress_text, decompress_text
+from src.app.services.processor import DocumentProcessor
+from src.logger import log
+
+# Предел суммарного размера сжатых текстов в кэше, байт; сверх него
+# вытесняются давно не читанные записи (LRU)
+EXTRACT_CACHE_MAX_BYTES = int(
+    os.getenv("EXTRACT_CACHE_MAX_BYTES", str(256 * 1024 * 1024))
+)
+
+KEY_PREFIX = "extract_cache:"
+LRU_KEY = "extract_cache:lru"
+SIZES_KEY = "extract_cache:sizes"
+BYTES_KEY = "extract_cache:bytes"
+STATS_KEY = "extract_cache:stats"
+
+# Запись с учётом размера и вытеснение до укладывания в лимит.
+# KEYS: запись, LRU, размеры записей, суммарный размер;
+# ARGV: сжатый текст, текущее время, лимит байт. Возвращает число вытесненных
+SET_SCRIPT = """
+local old = redis.call('HGET', KEYS[3], KEYS[1])
+if old then
+    redis.call('DECRBY', KEYS[4], old)
+end
+redis.call('SET', KEYS[1], ARGV[1])
+redis.call('ZADD', KEYS[2], ARGV[2], KEYS[1])
+redis.call('HSET', KEYS[3], KEYS[1], #ARGV[1])
+local total = redis.call('INCRBY', KEYS[4], #ARGV[1])
+local evicted = 0
+while total > tonumber(ARGV[3]) do
+    local popped = redis.call('ZPOPMIN', KEYS[2])
+    if #popped == 0 then
+        break
+    end
+    local size = redis.call('HGET', KEYS[3], popped[1])
+    redis.call('HDEL', KEYS[3], popped[1])
+    redis.call('UNLINK', popped[1])
+    if size then
+        total = redis.call('DECRBY', KEYS[4], size)
+    end
+    evicted = evicted + 1
+end
+return evicted
+"""
+
+
+class ExtractionCache:
+    """
+    Кэш извлечённого текста по хэшу исходных байтов файла. В ключ входит
+    версия обработчика: новая версия парсера не читает старые записи.
+    """
+
+    def __init__(
+        self,
+        redis_client,
+        raw_client,
+        max_bytes: int = EXTRACT_CACHE_MAX_BYTES,
+    ):
+        # raw_client - соединение без decode_responses для сжатых данных
+        self.redis = redis_client
+        self.raw = raw_client
+        self.max_bytes = max_bytes
+        self._set = raw_client.register_script(SET_SCRIPT)
+
+    @staticmethod
+    def _key(
+        processor: DocumentProcessor,
+        digest: str,
+        max_pages: Optional[int],
+    ) -> str:
+        pages = max_pages or "all"
+        return (
+            f"{KEY_PREFIX}{type(processor).__name__}:{processor.version}:"
+            f"{pages}:{digest}"
+        )
+
+    async def get(
+        self,
+        processor: DocumentProcessor,
+        digest: str,
+        max_pages: Optional[int] = None,
+    ) -> Optional[str]:
+        key = self._key(processor, digest, max_pages)
+        blob = await self.raw.get(key)
+        pipe = self.redis.pipeline(transaction=False)
+        if blob is None:
+            pipe.hincrby(STATS_KEY, "misses", 1)
+        else:
+            pipe.hincrby(STATS_KEY, "hits", 1)
+            pipe.zadd(LRU_KEY, {key: time.time()}, xx=True)
+        await pipe.execute()
+        if blob is None:
+            return None
+        return await asyncio.to_thread(decompress_text, blob)
+
+    async def set(
+        self,
+        processor: DocumentProcessor,
+        digest: str,
+        text: str,
+        max_pages: Optional[int] = None,
+    ) -> None:
+        blob = await asyncio.to_thread(compress_text, text)
+        if len(blob) > self.max_bytes:
+            return
+        evicted = await self._set(
+            keys=[
+                self._key(processor, digest, max_pages),
+                LRU_KEY,
+                SIZES_KEY,
+                BYTES_KEY,
+            ],
+            args=[blob, time.time(), self.max_bytes],
+        )
+        if evicted:
+            await self.redis.hincrby(STATS_KEY, "evictions", evicted)
+
+    async def invalidate(self) -> int:
+        """Полная очистка кэша"""
+        removed = 0
+        while True:
+            popped = await self.redis.zpopmin(LRU_KEY, 500)
+            if not popped:
+                break
+            removed += await self.redis.delete(*(key for key, _ in popped))
+        await self.redis.delete(SIZES_KEY, BYTES_KEY)
+        log.info(f"Кэш извлечённого текста очищен: {removed} записей")
+        return removed
+
+    async def stats(self) -> dict:
+        raw = await self.redis.hgetall(STATS_KEY)
+        hits = int(raw.get("hits", 0))
+        misses = int(raw.get("misses", 0))
+        return {
+            "entries": await self.redis.zcard(LRU_KEY),
+            "bytes": int(await self.redis.get(BYTES_KEY) or 0),
+            "max_bytes": self.max_bytes,
+            "hits": hits,
+            "misses": misses,
+            "evictions": int(raw.get("evictions", 0)),
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+        }
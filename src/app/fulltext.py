@@ -0,0 +1,291 @@
+import asyncio
+import math
+import os
+import re
+from collections import Counter
+from typing import Optional
+
+import numpy as np
+from redis.exceptions import WatchError
+
+from src.logger import log
+
+# Параметры BM25
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+# Сколько различных слов запроса учитываем
+SEARCH_MAX_TERMS = int(os.getenv("SEARCH_MAX_TERMS", "32"))
+# Длина фрагмента с найденными словами, символов
+SNIPPET_CHARS = int(os.getenv("SNIPPET_CHARS", "240"))
+# Сколько удалённых документов вычищается из списков за проход
+FTS_VACUUM_BATCH = int(os.getenv("FTS_VACUUM_BATCH", "100"))
+# Как часто (сек) удалённые документы вычищаются из списков слов
+FTS_VACUUM_INTERVAL = float(os.getenv("FTS_VACUUM_INTERVAL", "60"))
+
+# Номер документа в индексе - компактная замена uuid в списках
+NEXT_KEY = "fts:next"
+NUMBERS_KEY = "fts:num"  # id -> номер
+IDS_KEY = "fts:ids"  # номер -> id
+DOC_PREFIX = "fts:doc:"  # hash номера: длина и слова (для чистки)
+POSTINGS_PREFIX = "fts:p:"
+STATS_KEY = "fts:stats"
+# Номера удалённых документов, ещё не вычищенных из списков
+DELETED_KEY = "fts:deleted"
+
+# Запись списка вхождений слова: номер документа, частота слова в
+# документе, длина документа в словах. Список слова - одна строка Redis
+# из таких записей подряд, дописывается через APPEND
+POSTING = np.dtype([("doc", "<u4"), ("tf", "<u2"), ("dl", "<u4")])
+
+_WORD = re.compile(r"\w{2,}")
+
+# Tombstone документа: из выдачи сразу, из списков - при чистке.
+# KEYS: id -> номер, статистика, удалённые; ARGV: id, префикс hash номера
+REMOVE_SCRIPT = """
+local number = redis.call('HGET', KEYS[1], ARGV[1])
+if not number then
+    return 0
+end
+redis.call('HDEL', KEYS[1], ARGV[1])
+local length = redis.call('HGET', ARGV[2] .. number, 'length') or 0
+redis.call('HINCRBY', KEYS[2], 'docs', -1)
+redis.call('HINCRBY', KEYS[2], 'tokens', -tonumber(length))
+redis.call('SADD', KEYS[3], number)
+return 1
+"""
+
+
+def tokenize(text: str) -> list[str]:
+    return _WORD.findall(text.lower())
+
+
+def postings_key(term: str) -> str:
+    return f"{POSTINGS_PREFIX}{term}"
+
+
+def doc_key(number: int) -> str:
+    return f"{DOC_PREFIX}{number}"
+
+
+class FullTextIndex:
+    """
+    Инвертированный индекс документов в Redis со скорингом BM25.
+    Строится по мере загрузки: каждый документ дописывает по записи в
+    списки своих слов. Списки читаются целиком и считаются в NumPy,
+    тексты документов для поиска не нужны.
+    """
+
+    def __init__(self, redis_client, raw_client):
+        # raw_client - соединение без decode_responses для списков
+        self.redis = redis_client
+        self.raw = raw_client
+        self._remove = redis_client.register_script(REMOVE_SCRIPT)
+
+    async def add(self, document_id: str, text: str) -> int:
+        """Индексирует текст документа; возвращает число слов"""
+        counts = await asyncio.to_thread(lambda: Counter(tokenize(text)))
+        if not counts:
+            return 0
+        length = sum(counts.values())
+        number = await self.redis.incr(NEXT_KEY)
+
+        pipe = self.raw.pipeline(transaction=True)
+        for term, tf in counts.items():
+            record = np.array([(number, min(tf, 0xFFFF), length)], POSTING)
+            pipe.append(postings_key(term), record.tobytes())
+        pipe.hset(doc_key(number), mapping={
+            "id": document_id,
+            "length": length,
+            "terms": "\n".join(counts),
+        })
+        pipe.hset(NUMBERS_KEY, document_id, number)
+        pipe.hset(IDS_KEY, number, document_id)
+        pipe.hincrby(STATS_KEY, "docs", 1)
+        pipe.hincrby(STATS_KEY, "tokens", length)
+        await pipe.execute()
+        return length
+
+    async def remove(self, document_ids: list[str]) -> int:
+        """Убирает документы из выдачи; списки чистит vacuum"""
+        removed = 0
+        for document_id in document_ids:
+            removed += await self._remove(
+                keys=[NUMBERS_KEY, STATS_KEY, DELETED_KEY],
+                args=[document_id, DOC_PREFIX],
+            )
+        return removed
+
+    async def vacuum(self, batch_size: int = FTS_VACUUM_BATCH) -> int:
+        """
+        Вычищает записи удалённых документов из списков слов пачкой.
+        Списки переписываются с WATCH: параллельная загрузка, дописавшая
+        в список, просто повторяет проход по нему
+        """
+        numbers = [
+            int(n) for n in await self.redis.srandmember(DELETED_KEY, batch_size)
+        ]
+        if not numbers:
+            return 0
+        pipe = self.redis.pipeline(transaction=False)
+        for number in numbers:
+            pipe.hget(doc_key(number), "terms")
+        terms = set()
+        for value in await pipe.execute():
+            terms.update((value or "").split("\n"))
+        terms.discard("")
+
+        dead = np.array(numbers, dtype=np.uint32)
+        for term in terms:
+            await self._rewrite(postings_key(term), dead)
+
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.srem(DELETED_KEY, *numbers)
+        pipe.delete(*(doc_key(number) for number in numbers))
+        pipe.hdel(IDS_KEY, *numbers)
+        await pipe.execute()
+        log.info(
+            f"Полнотекстовый индекс: вычищено {len(numbers)} документов "
+            f"из {len(terms)} списков"
+        )
+        return len(numbers)
+
+    async def vacuum_loop(self, interval: float = FTS_VACUUM_INTERVAL):
+        """Фоновая чистка раз в interval секунд, пока есть удалённые"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                while await self.vacuum() >= FTS_VACUUM_BATCH:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.error(f"Ошибка чистки полнотекстового индекса: {e}")
+
+    async def _rewrite(self, key: str, dead: np.ndarray):
+        async with self.raw.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    await pipe.watch(key)
+                    blob = await pipe.get(key)
+                    if blob is None:
+                        return
+                    postings = np.frombuffer(blob, POSTING)
+                    live = postings[~np.isin(postings["doc"], dead)]
+                    pipe.multi()
+                    if len(live):
+                        pipe.set(key, live.tobytes())
+                    else:
+                        pipe.delete(key)
+                    await pipe.execute()
+                    return
+                except WatchError:
+                    continue
+
+    async def search(self, query: str, limit: int) -> list[dict]:
+        """limit документов с наибольшим BM25 по словам запроса"""
+        terms = list(dict.fromkeys(tokenize(query)))[:SEARCH_MAX_TERMS]
+        if not terms:
+            return []
+        pipe = self.raw.pipeline(transaction=False)
+        for term in terms:
+            pipe.get(postings_key(term))
+        pipe.smembers(DELETED_KEY)
+        pipe.hmget(STATS_KEY, ["docs", "tokens"])
+        *blobs, deleted, (docs, tokens) = await pipe.execute()
+        numbers, scores = await asyncio.to_thread(
+            bm25,
+            blobs,
+            np.array([int(n) for n in deleted], dtype=np.uint32),
+            int(docs or 0),
+            int(tokens or 0),
+            limit,
+        )
+        if not len(numbers):
+            return []
+        ids = await self.redis.hmget(IDS_KEY, [int(n) for n in numbers])
+        return [
+            {"document_id": document_id, "score": float(score)}
+            for document_id, score in zip(ids, scores)
+            if document_id
+        ]
+
+    async def stats(self) -> dict:
+        docs, tokens = await self.redis.hmget(STATS_KEY, ["docs", "tokens"])
+        return {
+            "documents": int(docs or 0),
+            "tokens": int(tokens or 0),
+            "pending_vacuum": await self.redis.scard(DELETED_KEY),
+        }
+
+
+def bm25(
+    blobs: list[Optional[bytes]],
+    deleted: np.ndarray,
+    docs: int,
+    tokens: int,
+    limit: int,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Номера документов и их BM25 (по убыванию) по спискам слов запроса"""
+    if docs <= 0:
+        return np.zeros(0, np.uint32), np.zeros(0)
+    avgdl = max(tokens / docs, 1.0)
+    doc_parts, score_parts = [], []
+    for blob in blobs:
+        if not blob:
+            continue
+        postings = np.frombuffer(blob, POSTING)
+        if len(deleted):
+            postings = postings[~np.isin(postings["doc"], deleted)]
+        df = len(postings)
+        if not df:
+            continue
+        idf = math.log(1 + (docs - df + 0.5) / (df + 0.5))
+        tf = postings["tf"].astype(np.float64)
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * postings["dl"] / avgdl)
+        doc_parts.append(postings["doc"])
+        score_parts.append(idf * tf * (BM25_K1 + 1) / (tf + norm))
+    if not doc_parts:
+        return np.zeros(0, np.uint32), np.zeros(0)
+
+    numbers, inverse = np.unique(np.concatenate(doc_parts), return_inverse=True)
+    scores = np.bincount(inverse, weights=np.concatenate(score_parts))
+    if len(scores) > limit:
+        top = np.argpartition(-scores, limit)[:limit]
+    else:
+        top = np.arange(len(scores))
+    top = top[np.argsort(-scores[top])]
+    return numbers[top], scores[top]
+
+
+def snippet(text: str, query: str, chars: int = SNIPPET_CHARS) -> str:
+    """
+    Фрагмент текста длиной около chars символов с наибольшим числом слов
+    запроса. Ищутся только вхождения слов, текст целиком не разбивается
+    """
+    terms = set(tokenize(query))
+    if not terms:
+        return ""
+    pattern = re.compile(
+        r"(?<!\w)(?:" + "|".join(map(re.escape, terms)) + r")(?!\w)",
+        re.IGNORECASE,
+    )
+    hits = np.array([m.start() for m in pattern.finditer(text)], dtype=np.int64)
+    if len(hits):
+        # Окно, начинающееся с вхождения, в которое попало больше всего
+        # других вхождений
+        covered = np.searchsorted(hits, hits + chars) - np.arange(len(hits))
+        center = int(hits[int(np.argmax(covered))])
+        start = max(0, center - chars // 4)
+    else:
+        start = 0
+    end = min(len(text), start + chars)
+    # Границы фрагмента - по пробелам, чтобы не резать слова
+    if start > 0:
+        space = text.find(" ", start, end)
+        start = space + 1 if space != -1 else start
+    if end < len(text):
+        space = text.rfind(" ", start, end)
+        end = space if space > start else end
+    prefix = "… " if start > 0 else ""
+    suffix = " …" if end < len(text) else ""
+    return f"{prefix}{' '.join(text[start:end].split())}{suffix}"
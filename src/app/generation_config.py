@@ -0,0 +1,81 @@
+"""
+Промпты и параметры генерации без зависимостей от torch и transformers:
+их читают API, планировщик и бенчмарки, которым модель не нужна
+"""
+import os
+from typing import Callable
+
+# TODO: Настройка параметров генерации - длина ответа и стиль
+
+SUMMARY_PROMPT = """
+            <|system|>You are an assistant that creates concise
+            and accurate document summaries.
+            <|user|>Here is a document text.
+            Create a brief summary (1-2 paragraphs)
+            that captures the main topic and key ideas.
+            Use plain text format only, no markdown or HTML tags:
+            {text}
+            Summary:<|assistant|>"""
+
+# Ответ на вопрос по найденным фрагментам документов (src.app.rag)
+ANSWER_PROMPT = """
+            <|system|>You answer questions about documents using only
+            the numbered context fragments below. If the answer is not
+            in the context, say so. Use plain text format only:
+            <|user|>{text}
+            Answer:<|assistant|>"""
+
+MODEL_NAME = os.getenv("MODEL_NAME", "HuggingFaceTB/SmolLM3-3B")
+MODEL_CACHE_DIR = os.getenv("MODEL_CACHE_DIR", "/model_data/smolLM3")
+# Тестовый режим: маленькая модель, чтобы весь путь upload -> generate
+# можно было прогнать на ноутбуке без GPU
+TINY_MODEL = os.getenv("TINY_MODEL", "").lower() in ("1", "true", "yes")
+TINY_MODEL_NAME = os.getenv(
+    "TINY_MODEL_NAME", "HuggingFaceTB/SmolLM2-135M-Instruct"
+)
+
+# Предел длины промпта в токенах; длинные документы режутся на чанки
+# в src.app.summarizer
+MAX_INPUT_TOKENS = int(os.getenv("MAX_INPUT_TOKENS", "2048"))
+
+# Переиспользование KV-кэша неизменной части промпта (текст шаблона до
+# {text}): её prefill выполняется один раз на шаблон, а не на каждый запрос
+PREFIX_CACHE = os.getenv("PREFIX_CACHE", "1").lower() in ("1", "true", "yes")
+# Доля занятой памяти устройства, выше которой после генерации
+# освобождается кэш аллокатора и запускается сборщик мусора
+MEMORY_PRESSURE_THRESHOLD = float(os.getenv("MEMORY_PRESSURE_THRESHOLD", "0.85"))
+
+# Параметры декодирования, общие для одиночной и пакетной генерации
+SAMPLING_KWARGS = {
+    "do_sample": True,
+    "temperature": 0.7,
+    "top_p": 0.9,
+    "repetition_penalty": 1.2,
+}
+# Жадное декодирование: детерминированный текст, одинаковый во всех
+# режимах декодирования (DECODING_MODE)
+GREEDY_KWARGS = {
+    "do_sample": False,
+    "repetition_penalty": 1.2,
+}
+DECODING_GREEDY = os.getenv("DECODING_GREEDY", "").lower() in ("1", "true", "yes")
+GENERATION_KWARGS = GREEDY_KWARGS if DECODING_GREEDY else SAMPLING_KWARGS
+
+# Режим декодирования по умолчанию (запрос может выбрать свой):
+# default - токен за токеном; prompt_lookup - кандидаты из n-грамм
+# самого промпта (summary часто повторяет фразы документа);
+# assisted - кандидаты предлагает маленькая черновая модель.
+# Основная модель проверяет кандидатов за один проход, поэтому при жадном
+# декодировании текст совпадает с default
+DECODING_MODES = ("default", "prompt_lookup", "assisted")
+DECODING_MODE = os.getenv("DECODING_MODE", "default")
+# Сколько токенов-кандидатов берётся из найденной в промпте n-граммы
+PROMPT_LOOKUP_TOKENS = int(os.getenv("PROMPT_LOOKUP_TOKENS", "10"))
+PROMPT_LOOKUP_MAX_NGRAM = int(os.getenv("PROMPT_LOOKUP_MAX_NGRAM", "3"))
+# Черновая модель для assisted; токенизатор может отличаться от основного
+DRAFT_MODEL_NAME = os.getenv(
+    "DRAFT_MODEL_NAME", "HuggingFaceTB/SmolLM2-135M-Instruct"
+)
+
+
+TokenCallback = Callable[[str], None]
@@ -0,0 +1,308 @@
+import asyncio
+import hashlib
+import mimetypes
+import os
+import tempfile
+import zipfile
+from typing import Optional
+
+from fastapi import HTTPException, Request
+from starlette.datastructures import FormData, Headers, UploadFile
+from starlette.formparsers import MultiPartException, MultiPartParser
+from starlette.responses import JSONResponse
+
+# Максимальный размер тела запроса с файлом, байт
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(50 * 1024 * 1024)))
+# Предел всего тела пакетной загрузки; каждый файл пакета по-прежнему
+# не больше UPLOAD_MAX_BYTES
+UPLOAD_BATCH_MAX_BYTES = int(
+    os.getenv("UPLOAD_BATCH_MAX_BYTES", str(4 * UPLOAD_MAX_BYTES))
+)
+# Файлы больше порога multipart-парсер сбрасывает из памяти во временный
+# файл на диске, поэтому память на одну загрузку ограничена этим порогом
+UPLOAD_SPOOL_BYTES = int(os.getenv("UPLOAD_SPOOL_BYTES", str(1024 * 1024)))
+
+# Ограничения zip-архива в пакетной загрузке: число файлов и суммарный
+# распакованный размер (защита от zip-бомб)
+ZIP_MAX_MEMBERS = int(os.getenv("ZIP_MAX_MEMBERS", "200"))
+ZIP_MAX_BYTES = int(os.getenv("ZIP_MAX_BYTES", str(4 * UPLOAD_MAX_BYTES)))
+
+ZIP_TYPES = {"application/zip", "application/x-zip-compressed"}
+
+
+class NamedSpooledTemporaryFile(tempfile.SpooledTemporaryFile):
+    """
+    SpooledTemporaryFile, который при переполнении сбрасывается в
+    именованный временный файл: процессы пула извлечения открывают его
+    по пути, копировать загрузку не нужно (transferable)
+    """
+
+    def rollover(self):
+        if self._rolled:
+            return
+        memory = self._file
+        self._file = tempfile.NamedTemporaryFile(**self._TemporaryFileArgs)
+        del self._TemporaryFileArgs
+        position = memory.tell()
+        self._file.write(memory.getvalue())
+        self._file.seek(position)
+        self._rolled = True
+
+
+class HashingUploadFile(UploadFile):
+    """
+    UploadFile, который считает sha256 содержимого по мере записи
+    парсером. max_size - предел размера файла: запись сверх него
+    прерывает разбор формы с 413
+    """
+
+    def __init__(self, *args, max_size: Optional[int] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.hasher = hashlib.sha256()
+        self.max_size = max_size
+
+    async def write(self, data: bytes) -> None:
+        if self.max_size is not None and self.size + len(data) > self.max_size:
+            raise too_large(self.max_size)
+        self.hasher.update(data)
+        await super().write(data)
+
+
+class HashingMultiPartParser(MultiPartParser):
+    """
+    Разбор multipart-формы загрузки: файлы сбрасываются в именованный
+    временный файл после UPLOAD_SPOOL_BYTES и создаются как
+    HashingUploadFile с пределом UPLOAD_MAX_BYTES на файл. Используется
+    только маршрутами загрузки (upload_files), остальные формы
+    разбираются стандартным парсером
+    """
+
+    spool_max_size = UPLOAD_SPOOL_BYTES
+
+    def on_headers_finished(self) -> None:
+        super().on_headers_finished()
+        part = self._current_part
+        if part.file is not None:
+            # Пустой спул парсера заменяется именованным (его же парсер
+            # закроет при ошибке разбора), файл - подсчётом sha256
+            part.file.file.close()
+            spool = NamedSpooledTemporaryFile(max_size=self.spool_max_size)
+            self._files_to_close_on_error[-1] = spool
+            part.file = HashingUploadFile(
+                file=spool,
+                size=0,
+                filename=part.file.filename,
+                headers=part.file.headers,
+                max_size=UPLOAD_MAX_BYTES,
+            )
+
+
+async def parse_upload_form(request: Request) -> FormData:
+    """Форма запроса загрузки, разобранная HashingMultiPartParser"""
+    content_type = request.headers.get("content-type", "")
+    if not content_type.startswith("multipart/form-data"):
+        raise HTTPException(
+            status_code=400, detail="Ожидается multipart/form-data"
+        )
+    parser = HashingMultiPartParser(request.headers, request.stream())
+    try:
+        return await parser.parse()
+    except MultiPartException as e:
+        raise HTTPException(status_code=400, detail=e.message)
+
+
+def upload_files(field: str):
+    """
+    Зависимость FastAPI вместо File(...): файлы поля field, разобранные
+    HashingMultiPartParser. Файлы закрываются после обработки запроса
+    """
+
+    async def dependency(request: Request):
+        form = await parse_upload_form(request)
+        try:
+            files = [
+                value for value in form.getlist(field)
+                if isinstance(value, UploadFile)
+            ]
+            if not files:
+                raise HTTPException(status_code=400, detail="Файл не загружен")
+            yield files
+        finally:
+            await form.close()
+
+    return dependency
+
+
+def upload_openapi(field: str, many: bool = False) -> dict:
+    """Описание тела запроса для OpenAPI: форму разбирает upload_files"""
+    schema = {"type": "string", "format": "binary"}
+    if many:
+        schema = {"type": "array", "items": schema}
+    return {
+        "requestBody": {
+            "required": True,
+            "content": {
+                "multipart/form-data": {
+                    "schema": {
+                        "type": "object",
+                        "properties": {field: schema},
+                        "required": [field],
+                    }
+                }
+            },
+        }
+    }
+
+
+async def upload_digest(file: UploadFile) -> str:
+    """sha256 исходных байтов загруженного файла"""
+    if isinstance(file, HashingUploadFile):
+        return file.hasher.hexdigest()
+
+    # Файл пришёл не через HashingMultiPartParser - дочитываем сами
+    def digest() -> str:
+        hasher = hashlib.sha256()
+        file.file.seek(0)
+        while chunk := file.file.read(1024 * 1024):
+            hasher.update(chunk)
+        return hasher.hexdigest()
+
+    return await asyncio.to_thread(digest)
+
+
+def is_zip(file: UploadFile) -> bool:
+    return file.content_type in ZIP_TYPES or (
+        (file.filename or "").lower().endswith(".zip")
+    )
+
+
+async def expand_zip(file: UploadFile) -> list[UploadFile]:
+    """
+    Файлы zip-архива как HashingUploadFile: содержимое распаковывается
+    во временные файлы (в памяти до UPLOAD_SPOOL_BYTES) с подсчётом
+    sha256, тип определяется по расширению. Каталоги и служебные файлы
+    пропускаются. Закрывать полученные файлы - на вызывающем
+    """
+
+    def expand() -> list[tuple[str, tempfile.SpooledTemporaryFile, object]]:
+        file.file.seek(0)
+        try:
+            archive = zipfile.ZipFile(file.file)
+        except zipfile.BadZipFile:
+            raise HTTPException(status_code=400, detail="Повреждённый zip-архив")
+        members = [
+            info for info in archive.infolist()
+            if not info.is_dir()
+            and not info.filename.startswith("__MACOSX/")
+            and not os.path.basename(info.filename).startswith(".")
+        ]
+        if len(members) > ZIP_MAX_MEMBERS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"В архиве больше {ZIP_MAX_MEMBERS} файлов",
+            )
+        expanded, total = [], 0
+        try:
+            for info in members:
+                # Размер из заголовка архива не проверяем: считаем байты
+                # по мере распаковки
+                spool = NamedSpooledTemporaryFile(
+                    max_size=UPLOAD_SPOOL_BYTES
+                )
+                hasher = hashlib.sha256()
+                expanded.append((info.filename, spool, hasher))
+                with archive.open(info) as member:
+                    while chunk := member.read(1024 * 1024):
+                        total += len(chunk)
+                        if total > ZIP_MAX_BYTES:
+                            raise too_large(ZIP_MAX_BYTES)
+                        hasher.update(chunk)
+                        spool.write(chunk)
+                spool.seek(0)
+        except Exception:
+            for _, spool, _ in expanded:
+                spool.close()
+            raise
+        return expanded
+
+    files = []
+    for name, spool, hasher in await asyncio.to_thread(expand):
+        content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        spool.seek(0, os.SEEK_END)
+        upload = HashingUploadFile(
+            file=spool,
+            size=spool.tell(),
+            filename=name,
+            headers=Headers({"content-type": content_type}),
+        )
+        spool.seek(0)
+        upload.hasher = hasher
+        files.append(upload)
+    return files
+
+
+def too_large(
+    max_bytes: int = UPLOAD_MAX_BYTES, subject: str = "Файл"
+) -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"{subject} слишком большой (max {max_bytes // 1024 // 1024}MB)",
+    )
+
+
+class UploadLimitMiddleware:
+    """
+    Ограничение размера тела запроса по фактически прочитанным байтам.
+    Заголовок content-length проверяется заранее, но ему не доверяем:
+    тело считается по мере чтения (в том числе chunked), и чтение
+    прерывается с 413, как только лимит превышен.
+    Пакетная загрузка ограничена своим суммарным пределом batch_max_bytes;
+    размер каждого её файла проверяет HashingMultiPartParser при разборе.
+    """
+
+    batch_path = "/upload/batch"
+
+    def __init__(
+        self,
+        app,
+        max_bytes: int = UPLOAD_MAX_BYTES,
+        batch_max_bytes: int = UPLOAD_BATCH_MAX_BYTES,
+    ):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.batch_max_bytes = batch_max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        if scope["path"] == self.batch_path:
+            max_bytes, subject = self.batch_max_bytes, "Пакет"
+        else:
+            max_bytes, subject = self.max_bytes, "Файл"
+
+        headers = dict(scope["headers"])
+        content_length = headers.get(b"content-length")
+        if content_length and int(content_length) > max_bytes:
+            error = too_large(max_bytes, subject)
+            response = JSONResponse(
+                {"detail": error.detail}, status_code=error.status_code
+            )
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_bytes:
+                    # Обработчик FastAPI пробрасывает HTTPException из
+                    # разбора тела как есть, клиент получит 413
+                    raise too_large(max_bytes, subject)
+            return message
+
+        await self.app(scope, limited_receive, send)
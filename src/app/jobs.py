@@ -0,0 +1,146 @@
+import os
+from datetime import datetime
+from typing import Optional
+
+from redis.exceptions import ResponseError
+
+from src.logger import log
+
+# Очередь задач генерации на Redis Streams (consumer groups)
+GENERATE_STREAM = os.getenv("GENERATE_STREAM", "jobs:generate")
+GENERATE_GROUP = os.getenv("GENERATE_GROUP", "summarizers")
+DEAD_LETTER_STREAM = os.getenv("DEAD_LETTER_STREAM", "jobs:generate:dead")
+
+# Сколько раз пробуем задачу, прежде чем отправить в dead letter
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# Через сколько мс простоя задача умершего воркера забирается другим
+JOB_CLAIM_IDLE_MS = int(os.getenv("JOB_CLAIM_IDLE_MS", "300000"))
+# Ограничение длины стрима (приблизительное, через MAXLEN ~)
+STREAM_MAXLEN = int(os.getenv("STREAM_MAXLEN", "100000"))
+
+# Виды задач в стриме (поле kind; без него - суммаризация)
+JOB_SUMMARIZE = "summarize"
+JOB_INDEX = "index"
+JOB_ASK = "ask"
+JOB_UNINDEX = "unindex"
+
+
+async def ensure_group(redis_client) -> None:
+    """Создаёт стрим и группу потребителей, если их ещё нет"""
+    try:
+        await redis_client.xgroup_create(
+            GENERATE_STREAM,
+            GENERATE_GROUP,
+            id="0",
+            mkstream=True,
+        )
+        log.info(f"Создана группа {GENERATE_GROUP} для {GENERATE_STREAM}")
+    except ResponseError as e:
+        # BUSYGROUP - группа уже существует
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+def job_fields(kind: str, attempt: int = 0, **fields) -> dict:
+    return {
+        **fields,
+        "kind": kind,
+        "attempt": attempt,
+        "enqueued_at": datetime.utcnow().isoformat(),
+    }
+
+
+def queue_wait(fields: dict) -> Optional[float]:
+    """Секунды с постановки задачи в очередь (None - время неизвестно)"""
+    enqueued_at = fields.get("enqueued_at")
+    if not enqueued_at:
+        return None
+    try:
+        enqueued = datetime.fromisoformat(enqueued_at)
+    except ValueError:
+        return None
+    return max(0.0, (datetime.utcnow() - enqueued).total_seconds())
+
+
+async def enqueue_job(
+    redis_client,
+    kind: str,
+    attempt: int = 0,
+    **fields,
+) -> str:
+    """Ставит задачу вида kind в очередь, возвращает id сообщения"""
+    return await redis_client.xadd(
+        GENERATE_STREAM,
+        job_fields(kind, attempt, **fields),
+        maxlen=STREAM_MAXLEN,
+        approximate=True,
+    )
+
+
+async def enqueue_jobs(redis_client, jobs: list[tuple[str, dict]]) -> list[str]:
+    """Пачка задач (вид, поля) одним запросом к Redis"""
+    pipe = redis_client.pipeline(transaction=False)
+    for kind, fields in jobs:
+        pipe.xadd(
+            GENERATE_STREAM,
+            job_fields(kind, **fields),
+            maxlen=STREAM_MAXLEN,
+            approximate=True,
+        )
+    return await pipe.execute()
+
+
+async def enqueue_generation(
+    redis_client,
+    document_id: str,
+    attempt: int = 0,
+    decoding: Optional[str] = None,
+) -> str:
+    """Ставит документ в очередь на генерацию, возвращает id сообщения"""
+    fields = {"document_id": document_id}
+    if decoding:
+        fields["decoding"] = decoding
+    return await enqueue_job(redis_client, JOB_SUMMARIZE, attempt, **fields)
+
+
+async def enqueue_indexing(redis_client, document_id: str) -> str:
+    """Ставит документ в очередь на индексацию для поиска (RAG)"""
+    return await enqueue_job(redis_client, JOB_INDEX, document_id=document_id)
+
+
+async def enqueue_question(redis_client, answer_id: str) -> str:
+    """Ставит вопрос (хранится в answer:<id>) в очередь на ответ"""
+    return await enqueue_job(redis_client, JOB_ASK, answer_id=answer_id)
+
+
+async def enqueue_unindexing(redis_client, document_ids: list[str]) -> str:
+    """Ставит удаление чанков документов из векторного индекса"""
+    return await enqueue_job(
+        redis_client, JOB_UNINDEX, document_ids=",".join(document_ids)
+    )
+
+
+def job_kind(fields: dict) -> str:
+    return fields.get("kind") or JOB_SUMMARIZE
+
+
+async def requeue(redis_client, fields: dict, attempt: int) -> str:
+    """Повторная постановка задачи с теми же полями"""
+    payload = {
+        key: value
+        for key, value in fields.items()
+        if key not in ("kind", "attempt", "enqueued_at")
+    }
+    return await enqueue_job(
+        redis_client, job_kind(fields), attempt, **payload
+    )
+
+
+async def dead_letter(redis_client, fields: dict, error: str) -> None:
+    """Откладывает задачу, исчерпавшую попытки, для ручного разбора"""
+    await redis_client.xadd(
+        DEAD_LETTER_STREAM,
+        {**fields, "error": error[:1000]},
+        maxlen=STREAM_MAXLEN,
+        approximate=True,
+    )
@@ -0,0 +1,85 @@
+import asyncio
+import os
+import time
+from typing import Awaitable, Callable
+
+from src.app.storage import EXPIRY_INDEX
+from src.logger import log
+
+# Как часто (сек) sweeper ищет документы с истёкшим сроком
+SWEEP_INTERVAL = float(os.getenv("SWEEP_INTERVAL", "60"))
+# Сколько документов освобождаем за один проход пачки
+SWEEP_BATCH = int(os.getenv("SWEEP_BATCH", "200"))
+
+STATS_KEY = "sweeper:stats"
+
+ReclaimHook = Callable[[list[str]], Awaitable[None]]
+
+
+class RetentionSweeper:
+    """
+    Фоновое освобождение документов с истёкшим сроком хранения и
+    удалённых через DELETE: метаданные, текст, стрим токенов и записи
+    индексов удаляются пачками по SWEEP_BATCH.
+    """
+
+    def __init__(
+        self,
+        store,
+        interval: float = SWEEP_INTERVAL,
+        batch_size: int = SWEEP_BATCH,
+    ):
+        self.store = store
+        self.interval = interval
+        self.batch_size = batch_size
+        # Подписчики на удаление (например, поисковые индексы)
+        self.hooks: list[ReclaimHook] = []
+
+    async def run(self):
+        while True:
+            try:
+                await self.sweep()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.error(f"Ошибка очистки документов: {e}", exc_info=True)
+            await asyncio.sleep(self.interval)
+
+    async def sweep(self) -> int:
+        """Один проход: освобождает всё, что просрочено на данный момент"""
+        started = time.perf_counter()
+        total_docs, total_bytes = 0, 0
+        while True:
+            due = await self.store.due_for_reclaim(self.batch_size)
+            if not due:
+                break
+            reclaimed, freed = await self.store.reclaim(due)
+            for hook in self.hooks:
+                await hook(reclaimed)
+            total_docs += len(reclaimed)
+            total_bytes += freed
+            if len(due) < self.batch_size or not reclaimed:
+                break
+
+        if total_docs:
+            pipe = self.store.redis.pipeline(transaction=False)
+            pipe.hincrby(STATS_KEY, "documents", total_docs)
+            pipe.hincrby(STATS_KEY, "bytes", total_bytes)
+            pipe.hset(STATS_KEY, "last_run_at", time.time())
+            await pipe.execute()
+            log.info(
+                f"Освобождено документов: {total_docs}, "
+                f"~{total_bytes / 1024:.0f} KB за "
+                f"{(time.perf_counter() - started) * 1000:.0f}ms"
+            )
+        return total_docs
+
+    async def stats(self) -> dict:
+        raw = await self.store.redis.hgetall(STATS_KEY)
+        return {
+            "documents_reclaimed": int(raw.get("documents", 0)),
+            "bytes_reclaimed": int(raw.get("bytes", 0)),
+            "last_run_at": float(raw["last_run_at"])
+            if "last_run_at" in raw else None,
+            "scheduled": await self.store.redis.zcard(EXPIRY_INDEX),
+        }
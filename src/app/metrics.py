@@ -0,0 +1,399 @@
+import asyncio
+import os
+import socket
+import threading
+import time
+from typing import Callable, Iterable, Optional
+
+from src.logger import log
+
+# Метрики копятся в памяти процесса и раз в METRICS_FLUSH_INTERVAL секунд
+# сливаются в Redis одним пайплайном: API, воркеры и модельный сервер
+# пишут в общие счётчики, /metrics отдаёт их сумму
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1").lower() in ("1", "true", "yes")
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "5"))
+# Имя процесса для gauge (у каждого процесса своё значение)
+METRICS_INSTANCE = os.getenv(
+    "METRICS_INSTANCE", f"{socket.gethostname()}-{os.getpid()}"
+)
+
+METRICS_PREFIX = "metrics"
+SECONDS_BUCKETS = (
+    0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1, 2.5, 5, 10, 30, 60, 120, 300,
+)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+RATE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+# Команды, которые блокируются в ожидании данных: это не время Redis
+BLOCKING_COMMANDS = {"XREADGROUP", "XREAD", "BLPOP", "BRPOP"}
+
+# Приёмник замера команды Redis: (команда или PIPELINE, секунды)
+RedisObserver = Callable[[str, float], None]
+
+
+def label_string(labels: dict) -> str:
+    """Метки в формате Prometheus: a="x",b="y" (это же - поле хэша в Redis)"""
+    return ",".join(
+        '{}="{}"'.format(
+            key,
+            str(value).replace("\\", "\\\\").replace('"', '\\"')
+            .replace("\n", "\\n"),
+        )
+        for key, value in sorted(labels.items())
+    )
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, registry: "MetricsRegistry", name: str, help: str):
+        self.registry = registry
+        self.name = name
+        self.help = help
+
+    @property
+    def key(self) -> str:
+        return f"{METRICS_PREFIX}:{self.kind}:{self.name}"
+
+
+class Histogram(Metric):
+    """Распределение значений; в Redis - счётчики по корзинам"""
+
+    kind = "histogram"
+
+    def __init__(self, registry, name, help, buckets=SECONDS_BUCKETS):
+        super().__init__(registry, name, help)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        if not METRICS_ENABLED:
+            return
+        # Индекс первой корзины, куда попадает значение (len - +Inf)
+        index = next(
+            (i for i, bound in enumerate(self.buckets) if value <= bound),
+            len(self.buckets),
+        )
+        labels = label_string(labels)
+        with self.registry.lock:
+            pending = self.registry.pending
+            for field, amount in (
+                (f"{labels}|{index}", 1),
+                (f"{labels}|count", 1),
+                (f"{labels}|sum", value),
+            ):
+                pending[(self.key, field)] = pending.get((self.key, field), 0) + amount
+
+    def time(self, **labels) -> "Timer":
+        return Timer(self, labels)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        if not METRICS_ENABLED:
+            return
+        field = label_string(labels)
+        with self.registry.lock:
+            pending = self.registry.pending
+            pending[(self.key, field)] = pending.get((self.key, field), 0) + amount
+
+
+class Gauge(Metric):
+    """Текущее значение в процессе; в отчёте - с меткой instance"""
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        if not METRICS_ENABLED:
+            return
+        with self.registry.lock:
+            self.registry.gauges[(self.name, label_string(labels))] = value
+
+
+class Timer:
+    """with HISTOGRAM.time(label=...): - длительность блока в секундах"""
+
+    def __init__(self, histogram: Histogram, labels: dict):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+
+class MetricsRegistry:
+    """
+    Реестр метрик процесса. Наблюдения (из любых потоков) суммируются
+    в памяти, flush переносит приращения в Redis: HINCRBY/HINCRBYFLOAT
+    по полю "метки|корзина", поэтому процессы не затирают друг друга.
+    Gauge хранятся в хэше процесса со сроком жизни - значения умерших
+    процессов пропадают сами.
+    """
+
+    def __init__(self):
+        self.metrics: dict[str, Metric] = {}
+        self.lock = threading.Lock()
+        self.pending: dict[tuple[str, str], float] = {}
+        self.gauges: dict[tuple[str, str], float] = {}
+
+    def _register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def histogram(self, name, help, buckets=SECONDS_BUCKETS) -> Histogram:
+        return self._register(Histogram(self, name, help, buckets))
+
+    def counter(self, name, help) -> Counter:
+        return self._register(Counter(self, name, help))
+
+    def gauge(self, name, help) -> Gauge:
+        return self._register(Gauge(self, name, help))
+
+    async def flush(self, redis_client) -> None:
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            gauges = dict(self.gauges)
+        if not pending and not gauges:
+            return
+        pipe = redis_client.pipeline(transaction=False)
+        for (key, field), amount in pending.items():
+            if isinstance(amount, int):
+                pipe.hincrby(key, field, amount)
+            else:
+                pipe.hincrbyfloat(key, field, amount)
+        if gauges:
+            key = f"{METRICS_PREFIX}:gauge:{METRICS_INSTANCE}"
+            pipe.hset(key, mapping={
+                f"{name}|{labels}": value
+                for (name, labels), value in gauges.items()
+            })
+            pipe.expire(key, int(METRICS_FLUSH_INTERVAL * 6) + 1)
+        try:
+            await pipe.execute()
+        except Exception:
+            # Приращения не теряем - вернутся со следующим сбросом
+            with self.lock:
+                for item, amount in pending.items():
+                    self.pending[item] = self.pending.get(item, 0) + amount
+            raise
+
+    async def render(self, redis_client, extra: Iterable[str] = ()) -> str:
+        """Все метрики в текстовом формате Prometheus"""
+        metrics = list(self.metrics.values())
+        pipe = redis_client.pipeline(transaction=False)
+        for metric in metrics:
+            if metric.kind != "gauge":
+                pipe.hgetall(metric.key)
+        stored = iter(await pipe.execute())
+        gauge_keys = [
+            key async for key in redis_client.scan_iter(
+                match=f"{METRICS_PREFIX}:gauge:*", count=100
+            )
+        ]
+        gauges: dict[str, list[tuple[str, str]]] = {}
+        for key in gauge_keys:
+            instance = key.rsplit(":", 1)[1]
+            for field, value in (await redis_client.hgetall(key)).items():
+                name, labels = field.split("|", 1)
+                labels = ",".join(filter(None, [
+                    labels, label_string({"instance": instance})
+                ]))
+                gauges.setdefault(name, []).append((labels, value))
+
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            if metric.kind == "gauge":
+                for labels, value in gauges.get(metric.name, []):
+                    lines.append(sample(metric.name, labels, value))
+            elif metric.kind == "counter":
+                for labels, value in sorted(next(stored).items()):
+                    lines.append(sample(metric.name, labels, value))
+            else:
+                lines.extend(render_histogram(metric, next(stored)))
+        lines.extend(extra)
+        return "\n".join(lines) + "\n"
+
+
+def sample(name: str, labels: str, value) -> str:
+    return f"{name}{{{labels}}} {value}" if labels else f"{name} {value}"
+
+
+def render_histogram(metric: Histogram, fields: dict) -> list[str]:
+    series: dict[str, dict[str, str]] = {}
+    for field, value in fields.items():
+        labels, part = field.rsplit("|", 1)
+        series.setdefault(labels, {})[part] = value
+    lines = []
+    for labels, parts in sorted(series.items()):
+        cumulative = 0
+        bounds = [*map(str, metric.buckets), "+Inf"]
+        for index, bound in enumerate(bounds):
+            cumulative += int(parts.get(str(index), 0))
+            le = ",".join(filter(None, [labels, f'le="{bound}"']))
+            lines.append(sample(f"{metric.name}_bucket", le, cumulative))
+        lines.append(sample(f"{metric.name}_sum", labels, parts.get("sum", 0)))
+        lines.append(sample(f"{metric.name}_count", labels, parts.get("count", 0)))
+    return lines
+
+
+def percentile(ordered: list[float], q: float) -> float:
+    """Перцентиль по ближайшему рангу; ordered отсортирован и не пуст"""
+    index = max(0, min(len(ordered) - 1, round(q * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def instrument_redis(client, observe: Optional[RedisObserver] = None) -> None:
+    """
+    Задержка команд и пайплайнов клиента redis. Блокирующее чтение
+    очереди воркером - ожидание, а не задержка Redis, его не считаем.
+    observe - куда писать замеры, по умолчанию гистограмма REDIS_SECONDS
+    """
+    if observe is None:
+        if not METRICS_ENABLED:
+            return
+
+        def observe(command: str, seconds: float):
+            REDIS_SECONDS.observe(seconds, command=command)
+
+    execute_command = client.execute_command
+    pipeline = client.pipeline
+
+    async def timed_command(*args, **options):
+        command = str(args[0]).upper()
+        if command in BLOCKING_COMMANDS:
+            return await execute_command(*args, **options)
+        started = time.perf_counter()
+        try:
+            return await execute_command(*args, **options)
+        finally:
+            observe(command, time.perf_counter() - started)
+
+    def timed_pipeline(*args, **kwargs):
+        pipe = pipeline(*args, **kwargs)
+        execute = pipe.execute
+
+        async def timed_execute(*a, **kw):
+            started = time.perf_counter()
+            try:
+                return await execute(*a, **kw)
+            finally:
+                observe("PIPELINE", time.perf_counter() - started)
+
+        pipe.execute = timed_execute
+        return pipe
+
+    client.execute_command = timed_command
+    client.pipeline = timed_pipeline
+
+
+async def flush_all(redis_client) -> None:
+    """Метрики и спаны трассировки процесса - в Redis"""
+    from src.app import tracing
+
+    try:
+        await registry.flush(redis_client)
+        await tracing.flush(redis_client)
+    except Exception as e:
+        log.warning(f"Не удалось сбросить метрики: {e}")
+
+
+async def flush_loop(redis_client, interval: float = METRICS_FLUSH_INTERVAL):
+    """Фоновый сброс раз в interval секунд"""
+    while True:
+        await asyncio.sleep(interval)
+        await flush_all(redis_client)
+
+
+registry = MetricsRegistry()
+
+HTTP_REQUEST_SECONDS = registry.histogram(
+    "http_request_seconds", "Время обработки HTTP-запроса"
+)
+EXTRACTION_SECONDS = registry.histogram(
+    "extraction_seconds", "Извлечение текста из файла по MIME-типу"
+)
+REDIS_SECONDS = registry.histogram(
+    "redis_command_seconds", "Задержка команд и пайплайнов Redis"
+)
+JOB_QUEUE_SECONDS = registry.histogram(
+    "job_queue_wait_seconds", "Время задачи в очереди до воркера"
+)
+JOB_SECONDS = registry.histogram(
+    "job_seconds", "Обработка задачи воркером"
+)
+MODEL_PREFILL_SECONDS = registry.histogram(
+    "model_prefill_seconds", "Prefill пачки: до первого нового токена"
+)
+MODEL_DECODE_SECONDS = registry.histogram(
+    "model_decode_seconds", "Декодирование пачки после первого токена"
+)
+MODEL_INPUT_TOKENS = registry.histogram(
+    "model_input_tokens", "Токенов промпта на документ", TOKEN_BUCKETS
+)
+MODEL_OUTPUT_TOKENS = registry.histogram(
+    "model_output_tokens", "Сгенерированных токенов на документ", TOKEN_BUCKETS
+)
+MODEL_TOKENS_PER_SECOND = registry.histogram(
+    "model_tokens_per_second", "Скорость декодирования пачки, токенов/с",
+    RATE_BUCKETS,
+)
+MODEL_BATCH_SIZE = registry.histogram(
+    "model_batch_size", "Документов в пачке генерации",
+    (1, 2, 4, 8, 16, 32, 64),
+)
+SCHEDULER_WAIT_SECONDS = registry.histogram(
+    "scheduler_wait_seconds", "Ожидание запроса в планировщике пачек"
+)
+SCHEDULER_COST_RATIO = registry.histogram(
+    "scheduler_cost_ratio", "Время пачки к прогнозу модели стоимости",
+    (0.25, 0.5, 0.75, 0.9, 1.1, 1.25, 1.5, 2, 4),
+)
+SCHEDULER_PENDING = registry.gauge(
+    "scheduler_pending", "Запросов в пуле планировщика пачек"
+)
+ADMISSION_REJECTED = registry.counter(
+    "admission_rejected", "Отказы допуска по маршруту, причине и полосе"
+)
+MODEL_MEMORY_BYTES = registry.gauge(
+    "model_memory_bytes", "Память под модель: VRAM на GPU, RSS на CPU"
+)
+
+
+class MetricsMiddleware:
+    """Время HTTP-запросов по шаблону пути (не по самому пути) и статусу"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            # Маршрут роутер записывает в scope при сопоставлении
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - started,
+                method=scope["method"],
+                route=route,
+                status=status,
+            )
@@ -0,0 +1,233 @@
+import asyncio
+import itertools
+import json
+import os
+import time
+from typing import Callable, List, Optional
+
+from src.app.generation_config import MODEL_CACHE_DIR, SUMMARY_PROMPT
+from src.logger import log
+
+# Путь к сокету модельного сервера (src.model_server). Пусто - модель
+# загружается в процессе воркера, как раньше
+MODEL_SERVER_SOCKET = os.getenv("MODEL_SERVER_SOCKET", "/run/model/model.sock")
+USE_MODEL_SERVER = os.getenv("USE_MODEL_SERVER", "").lower() in ("1", "true", "yes")
+# Сколько ждём готовности сервера при подключении (загрузка и прогрев)
+MODEL_CONNECT_TIMEOUT = float(os.getenv("MODEL_CONNECT_TIMEOUT", "600"))
+# Предел ожидания одного запроса генерации, включая повторы при отказах
+MODEL_REQUEST_TIMEOUT = float(os.getenv("MODEL_REQUEST_TIMEOUT", "600"))
+
+TokenCallback = Callable[[str], None]
+
+
+class ModelServerError(RuntimeError):
+    def __init__(self, detail: str, status: int = 500, retry_after: float = 0):
+        super().__init__(detail)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class ModelClient:
+    """
+    Клиент модельного сервера с интерфейсом пары ModelManager +
+    BatchScheduler, которую использует воркер: submit возвращает future,
+    tokenizer и model_name нужны для разбиения текста на чанки.
+    В процессе клиента загружается только токенизатор.
+    Запросы мультиплексируются в одном соединении по id.
+    """
+
+    def __init__(
+        self,
+        path: str = MODEL_SERVER_SOCKET,
+        request_timeout: float = MODEL_REQUEST_TIMEOUT,
+    ):
+        self.path = path
+        self.request_timeout = request_timeout
+        self.model_name: Optional[str] = None
+        self.tokenizer = None
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._reader_task: Optional[asyncio.Task] = None
+        self._connect_lock = asyncio.Lock()
+        self._ids = itertools.count(1)
+        self._calls: dict[int, tuple[asyncio.Future, Optional[TokenCallback]]] = {}
+
+    @property
+    def is_loaded(self) -> bool:
+        return self.tokenizer is not None
+
+    def load_model(self):
+        """Загрузка токенизатора той модели, что обслуживает сервер"""
+        if self.is_loaded:
+            return
+        if self.model_name is None:
+            raise RuntimeError("Сначала нужно подключиться к модельному серверу")
+        # transformers нужен только клиенту воркера, не API
+        from transformers import AutoTokenizer
+
+        self.tokenizer = AutoTokenizer.from_pretrained(
+            self.model_name, cache_dir=MODEL_CACHE_DIR
+        )
+
+    def count_tokens(
+        self,
+        texts: List[str],
+        prompt: Optional[str] = None,
+    ) -> List[int]:
+        """То же, что ModelManager.count_tokens, по локальному токенизатору"""
+        self.load_model()
+        template = prompt or SUMMARY_PROMPT
+        encoded = self.tokenizer(
+            [template.format(text=text) for text in texts],
+            add_special_tokens=True,
+        )
+        return [len(ids) for ids in encoded["input_ids"]]
+
+    async def connect(self, timeout: float = MODEL_CONNECT_TIMEOUT) -> dict:
+        """Ждёт готовности сервера (прогрева модели); возвращает health"""
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                health = await self.health()
+                if health["ready"]:
+                    self.model_name = health["model"]
+                    log.info(
+                        f"Модельный сервер готов: {health['model']} "
+                        f"на {health['device']}"
+                    )
+                    return health
+            except (ConnectionError, FileNotFoundError, ModelServerError):
+                pass
+            if time.monotonic() > deadline:
+                raise TimeoutError(
+                    f"Модельный сервер {self.path} не готов за {timeout}s"
+                )
+            await asyncio.sleep(1)
+
+    async def health(self) -> dict:
+        return await self._call({"op": "health"})
+
+    def submit(
+        self,
+        text: str,
+        max_new_tokens: int = 150,
+        on_token: Optional[TokenCallback] = None,
+        prompt: Optional[str] = None,
+        decoding: Optional[str] = None,
+    ) -> asyncio.Future:
+        """То же, что BatchScheduler.submit; вызывать из event loop"""
+        return asyncio.ensure_future(
+            self.generate(text, max_new_tokens, on_token, prompt, decoding)
+        )
+
+    async def generate(
+        self,
+        text: str,
+        max_new_tokens: int = 150,
+        on_token: Optional[TokenCallback] = None,
+        prompt: Optional[str] = None,
+        decoding: Optional[str] = None,
+    ) -> str:
+        """
+        Генерация на сервере. Отказ по допуску (503) повторяется через
+        retry_after, пока не истечёт request_timeout
+        """
+        deadline = time.monotonic() + self.request_timeout
+        message = {
+            "op": "generate",
+            "text": text,
+            "max_new_tokens": max_new_tokens,
+            "prompt": prompt,
+            "decoding": decoding,
+            "stream": on_token is not None,
+        }
+        while True:
+            try:
+                return await self._call(
+                    message, on_token, deadline - time.monotonic()
+                )
+            except ModelServerError as e:
+                if e.status != 503 or time.monotonic() + e.retry_after > deadline:
+                    raise
+                await asyncio.sleep(e.retry_after)
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        """Нормированные векторы текстов энкодером поиска на сервере"""
+        return await self._call({"op": "embed", "texts": texts})
+
+    async def close(self):
+        if self._reader_task:
+            self._reader_task.cancel()
+        if self._writer:
+            self._writer.close()
+        self._reader = self._writer = self._reader_task = None
+
+    async def _ensure_connected(self):
+        async with self._connect_lock:
+            if self._writer and not self._writer.is_closing():
+                return
+            self._reader, self._writer = await asyncio.open_unix_connection(
+                self.path
+            )
+            self._reader_task = asyncio.create_task(self._read_loop())
+
+    async def _call(
+        self,
+        message: dict,
+        on_token: Optional[TokenCallback] = None,
+        timeout: Optional[float] = None,
+    ):
+        await self._ensure_connected()
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._calls[request_id] = (future, on_token)
+        try:
+            self._writer.write(
+                (json.dumps({**message, "id": request_id}) + "\n").encode()
+            )
+            await self._writer.drain()
+            return await asyncio.wait_for(future, timeout or self.request_timeout)
+        finally:
+            self._calls.pop(request_id, None)
+
+    async def _read_loop(self):
+        try:
+            while line := await self._reader.readline():
+                message = json.loads(line)
+                call = self._calls.get(message.get("id"))
+                if call is None:
+                    continue
+                future, on_token = call
+                if "token" in message:
+                    if on_token:
+                        on_token(message["token"])
+                elif future.done():
+                    continue
+                elif "error" in message:
+                    future.set_exception(ModelServerError(
+                        message["error"],
+                        message.get("status", 500),
+                        message.get("retry_after", 0),
+                    ))
+                else:
+                    future.set_result(message["result"])
+            error = ConnectionError("Модельный сервер закрыл соединение")
+        except Exception as e:
+            error = ConnectionError(f"Соединение с модельным сервером: {e}")
+        # Ждущие ответа запросы завершаем ошибкой - задача уйдёт на повтор
+        if self._writer:
+            self._writer.close()
+        for future, _ in list(self._calls.values()):
+            if not future.done():
+                future.set_exception(error)
+
+
+async def check_health(path: str = MODEL_SERVER_SOCKET) -> bool:
+    """Готов ли модельный сервер (для healthcheck)"""
+    client = ModelClient(path)
+    try:
+        return (await asyncio.wait_for(client.health(), 5))["ready"]
+    except Exception:
+        return False
+    finally:
+        await client.close()
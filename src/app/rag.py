@@ -0,0 +1,107 @@
+import json
+import os
+from typing import Callable, Optional
+
+from src.app.summarizer import split_into_chunks
+from src.app.vector_index import DEFAULT_COLLECTION, VectorIndex
+
+# Чанки для поиска мельче чанков суммаризации: точнее попадание,
+# компактнее промпт
+RAG_CHUNK_TOKENS = int(os.getenv("RAG_CHUNK_TOKENS", "200"))
+RAG_CHUNK_OVERLAP = int(os.getenv("RAG_CHUNK_OVERLAP", "40"))
+RAG_TOP_K = int(os.getenv("RAG_TOP_K", "4"))
+# Чанки с косинусной близостью ниже порога в промпт не попадают
+RAG_MIN_SCORE = float(os.getenv("RAG_MIN_SCORE", "0.2"))
+# Бюджет найденного контекста в промпте ответа, токенов
+RAG_CONTEXT_TOKENS = int(os.getenv("RAG_CONTEXT_TOKENS", "1024"))
+RAG_ANSWER_TOKENS = int(os.getenv("RAG_ANSWER_TOKENS", "200"))
+# Сколько хранится ответ на вопрос
+ANSWER_TTL = int(os.getenv("ANSWER_TTL", "86400"))
+
+
+def answer_key(answer_id: str) -> str:
+    return f"answer:{answer_id}"
+
+
+class Retriever:
+    """
+    Индексация документов по чанкам и поиск контекста для ответа.
+    Методы синхронные (энкодер работает в потоке вызывающего)
+    """
+
+    def __init__(self, embedder, index: VectorIndex):
+        self.embedder = embedder
+        self.index = index
+
+    def index_document(
+        self,
+        document_id: str,
+        text: str,
+        collection: str = DEFAULT_COLLECTION,
+    ) -> int:
+        """Чанкинг, векторизация пачками и запись в индекс; число чанков"""
+        self.embedder.load()
+        chunks = split_into_chunks(
+            self.embedder.tokenizer,
+            text,
+            RAG_CHUNK_TOKENS,
+            RAG_CHUNK_OVERLAP,
+        )
+        chunks = [chunk for chunk in chunks if chunk.strip()]
+        if not chunks:
+            # Пустой текст после переиндексации - убираем прежние чанки
+            self.index.collection(collection).remove(document_id)
+            return 0
+        return self.index.add(
+            document_id, chunks, self.embedder.encode(chunks), collection
+        )
+
+    def retrieve(
+        self,
+        question: str,
+        top_k: int = RAG_TOP_K,
+        document_id: Optional[str] = None,
+        collection: str = DEFAULT_COLLECTION,
+    ) -> list[dict]:
+        query = self.embedder.encode([question])[0]
+        hits = self.index.search(query, top_k, document_id, collection)
+        return [hit for hit in hits if hit["score"] >= RAG_MIN_SCORE]
+
+    def build_prompt(
+        self,
+        question: str,
+        hits: list[dict],
+        count_tokens: Callable[..., list[int]],
+        max_context_tokens: int = RAG_CONTEXT_TOKENS,
+    ) -> tuple[str, list[dict]]:
+        """
+        Промпт ответа из найденных чанков в пределах бюджета токенов.
+        count_tokens - счётчик токенов генерирующей модели
+        (manager.count_tokens): у энкодера другой словарь.
+        Возвращает промпт и чанки, которые в него вошли
+        """
+        lengths = count_tokens(
+            [hit["text"] for hit in hits], prompt="{text}"
+        ) if hits else []
+        used, sources, spent = [], [], 0
+        for hit, tokens in zip(hits, lengths):
+            if used and spent + tokens > max_context_tokens:
+                break
+            spent += tokens
+            used.append(f"[{len(used) + 1}] {hit['text'].strip()}")
+            sources.append(hit)
+        context = "\n\n".join(used)
+        return f"{context}\n\nQuestion: {question.strip()}", sources
+
+
+def sources_json(sources: list[dict]) -> str:
+    """Источники ответа для хранения в Redis (без полного текста чанков)"""
+    return json.dumps([
+        {
+            "document_id": hit["document_id"],
+            "chunk": hit["chunk"],
+            "score": round(hit["score"], 4),
+            "preview": hit["text"][:200],
+        }
+        for hit in sources
+    ], ensure_ascii=False)
@@ -0,0 +1,77 @@
+import json
+import uuid
+
+from fastapi import APIRouter, Request, HTTPException
+from fastapi.responses import JSONResponse
+
+from src.app.jobs import enqueue_indexing, enqueue_question
+from src.app.rag import ANSWER_TTL, RAG_TOP_K, answer_key
+from src.app.schemas import AskRequest
+from src.app.storage import now_iso
+
+router = APIRouter()
+
+
+@router.post("/ask", response_class=JSONResponse)
+async def ask_question(request: Request, body: AskRequest):
+    """
+    Вопрос по загруженным документам. Воркер находит top_k ближайших
+    чанков, собирает из них компактный промпт и генерирует ответ;
+    результат - GET /ask/{answer_id}.
+    """
+    collection = body.collection
+    if body.document_id:
+        doc = await request.app.state.store.get(body.document_id)
+        if not doc:
+            raise HTTPException(status_code=404, detail="Документ не найден")
+        collection = doc.collection
+
+    redis_client = request.app.state.redis
+    answer_id = str(uuid.uuid4())
+    key = answer_key(answer_id)
+    pipe = redis_client.pipeline(transaction=True)
+    pipe.hset(key, mapping={
+        "question": body.question,
+        "document_id": body.document_id or "",
+        "collection": collection,
+        "top_k": body.top_k or RAG_TOP_K,
+        "status": "processing",
+        "created_at": now_iso(),
+    })
+    pipe.expire(key, ANSWER_TTL)
+    await pipe.execute()
+    await enqueue_question(redis_client, answer_id)
+
+    return JSONResponse(
+        {"answer_id": answer_id, "status": "processing"},
+        status_code=202,
+    )
+
+
+@router.get("/ask/{answer_id}", response_class=JSONResponse)
+async def get_answer(request: Request, answer_id: str):
+    """Ответ и фрагменты документов, по которым он построен"""
+    data = await request.app.state.redis.hgetall(answer_key(answer_id))
+    if not data:
+        raise HTTPException(status_code=404, detail="Ответ не найден")
+    return {
+        "answer_id": answer_id,
+        "question": data.get("question"),
+        "document_id": data.get("document_id") or None,
+        "collection": data.get("collection") or "default",
+        "status": data.get("status"),
+        "answer": data.get("answer"),
+        "sources": json.loads(data.get("sources") or "[]"),
+    }
+
+
+@router.post("/ask/index/{document_id}", response_class=JSONResponse)
+async def index_document(request: Request, document_id: str):
+    """Повторная индексация документа (например, загруженного до RAG)"""
+    if not await request.app.state.store.get(document_id):
+        raise HTTPException(status_code=404, detail="Документ не найден")
+    await enqueue_indexing(request.app.state.redis, document_id)
+    return JSONResponse(
+        {"document_id": document_id, "status": "indexing"},
+        status_code=202,
+    )
@@ -1,11 +1,15 @@
-import asyncio
-from datetime import datetime
-
 from fastapi import APIRouter, Request, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from pathlib import Path
-from src.app.schemas import DocumentDTO
+from src.app import tracing
+from src.app.admission import document_lane
+from src.app.generation_config import DECODING_MODES
+from src.app.jobs import enqueue_generation
+from src.app.schemas import DocumentStatus
+from src.app.storage import now_iso
+from src.app.streaming import stream_tokens
+from src.app.summary_cache import content_hash
 
 router = APIRouter()
 templates = Jinja2Templates(
@@ -13,52 +17,123 @@ templates = Jinja2Templates(
 )
 
 
-async def fake_processing(redis_client, document_id: str):
-    # Имитация обработки celery task
-    await asyncio.sleep(20)
-    raw = await redis_client.hgetall(f'doc:{document_id}')
-    doc = DocumentDTO.from_redis(document_id, raw)
-    doc.status = "done"
-    doc.result = "This is example summary text."
-    # Записываем результат
-    await redis_client.hset(
-        f'doc:{document_id}',
-        mapping=doc.to_redis(),
-    )
-
-
 @router.post("/generate", response_class=JSONResponse)
 async def generate_summary(request: Request):
     """
-    Отправляет документ на генерацию (имитация celery).
+    Ставит документ в очередь на генерацию (обрабатывает src.worker).
+    decoding - режим декодирования (default, prompt_lookup, assisted),
+    без него - DECODING_MODE воркера.
     """
     data = await request.json()
     document_id = data.get("document_id")
     if not document_id:
         raise HTTPException(status_code=400, detail="document_id обязателен")
+    decoding = data.get("decoding")
+    if decoding is not None and decoding not in DECODING_MODES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"decoding: одно из {', '.join(DECODING_MODES)}",
+        )
 
+    tracing.bind(document_id)
     redis_client = request.app.state.redis
-    doc_data = await redis_client.hgetall(f'doc:{document_id}')
-    if not doc_data:
+    store = request.app.state.store
+    doc = await store.get(document_id)
+    if not doc:
         raise HTTPException(status_code=404, detail="Документ не найден")
 
-    doc = DocumentDTO.from_redis(document_id, doc_data)
-
-    if doc.status != "uploaded":
+    if doc.status != DocumentStatus.uploaded:
         raise HTTPException(
             status_code=400,
-            detail=f"Документ в статусе {doc.status}",
+            detail=f"Документ в статусе {doc.status.value}",
+        )
+
+    # Тот же текст уже суммаризировался - отдаём сразу
+    text_hash = doc.content_hash or content_hash(
+        await store.get_text(document_id) or ""
+    )
+    cached = await request.app.state.summary_cache.get(text_hash)
+    if cached is not None:
+        moved = await store.transition(
+            document_id,
+            DocumentStatus.done,
+            expected=DocumentStatus.uploaded,
+            result=cached,
+            content_hash=text_hash,
+            updated_at=now_iso(),
+        )
+        if not moved:
+            # Параллельный запрос уже поставил документ на генерацию,
+            # либо документ удалён
+            raise HTTPException(
+                status_code=400,
+                detail="Документ уже отправлен на генерацию",
+            )
+        return JSONResponse(
+            {
+                "document_id": document_id,
+                "status": DocumentStatus.done.value,
+                "cached": True,
+            },
+            status_code=200,
         )
 
-    # Ставим статус "processing"
-    doc.status = "processing"
-    doc.updated_at = datetime.utcnow()
-    await redis_client.hset(f'doc:{document_id}', mapping=doc.to_redis())
+    # Очередь переполнена - 503 с Retry-After; длинные документы
+    # отсекаются раньше коротких
+    admission = getattr(request.app.state, "admission", None)
+    if admission:
+        await admission.check_queue(document_lane(doc.text_length))
+
+    with tracing.span("generate.enqueue", decoding=decoding):
+        # Ставим статус "processing"; expected защищает от двойной постановки
+        moved = await store.transition(
+            document_id,
+            DocumentStatus.processing,
+            expected=DocumentStatus.uploaded,
+            updated_at=now_iso(),
+        )
+        if not moved:
+            raise HTTPException(
+                status_code=400,
+                detail="Документ уже отправлен на генерацию",
+            )
 
-    # Имитация таски
-    asyncio.create_task(fake_processing(redis_client, doc.document_id))
+        await enqueue_generation(redis_client, document_id, decoding=decoding)
 
     return JSONResponse(
-        {"document_id": doc.document_id, "status": doc.status},
+        {
+            "document_id": document_id,
+            "status": DocumentStatus.processing.value,
+        },
         status_code=202,
     )
+
+
+@router.get("/generate/cache", response_class=JSONResponse)
+async def summary_cache_stats(request: Request):
+    """Счётчики попаданий/промахов кэша summary"""
+    return await request.app.state.summary_cache.stats()
+
+
+@router.delete("/generate/cache", response_class=JSONResponse)
+async def invalidate_summary_cache(request: Request):
+    """Сброс кэша summary (после замены модели или промпта)"""
+    removed = await request.app.state.summary_cache.invalidate()
+    return {"removed": removed}
+
+
+@router.get("/generate/{document_id}/stream")
+async def stream_summary(request: Request, document_id: str):
+    """
+    Server-Sent Events: фрагменты summary по мере генерации.
+    События: token, reset (повтор попытки), done, error.
+    """
+    redis_client = request.app.state.redis
+    if not await redis_client.exists(f'doc:{document_id}'):
+        raise HTTPException(status_code=404, detail="Документ не найден")
+
+    return StreamingResponse(
+        stream_tokens(redis_client, document_id, request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
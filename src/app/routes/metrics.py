@@ -0,0 +1,69 @@
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from src.app import tracing
+from src.app.jobs import DEAD_LETTER_STREAM, GENERATE_GROUP, GENERATE_STREAM
+from src.app.metrics import flush_all, registry, sample
+from src.app.schemas import DocumentStatus
+from src.app.storage import status_index
+
+router = APIRouter()
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+async def queue_gauges(redis_client) -> list[str]:
+    """Значения на момент запроса: очередь задач и документы по статусам"""
+    statuses = list(DocumentStatus)
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.xlen(GENERATE_STREAM)
+    pipe.xlen(DEAD_LETTER_STREAM)
+    for status in statuses:
+        pipe.zcard(status_index(status.value))
+    stream_length, dead_letters, *counts = await pipe.execute()
+    groups = await redis_client.xinfo_groups(GENERATE_STREAM)
+    pending = sum(
+        group["pending"] for group in groups if group["name"] == GENERATE_GROUP
+    )
+
+    lines = [
+        "# HELP job_stream_length Сообщений в потоке задач",
+        "# TYPE job_stream_length gauge",
+        sample("job_stream_length", "", stream_length),
+        "# HELP job_pending Задач, выданных воркерам и ещё не завершённых",
+        "# TYPE job_pending gauge",
+        sample("job_pending", "", pending),
+        "# HELP job_dead_letters Задач, исчерпавших попытки",
+        "# TYPE job_dead_letters gauge",
+        sample("job_dead_letters", "", dead_letters),
+        "# HELP documents Документов по статусам",
+        "# TYPE documents gauge",
+    ]
+    for status, count in zip(statuses, counts):
+        lines.append(sample("documents", f'status="{status.value}"', count))
+    return lines
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics(request: Request):
+    """
+    Метрики в текстовом формате Prometheus: гистограммы всех процессов
+    (из Redis) и текущие глубина очереди и число документов по статусам
+    """
+    redis_client = request.app.state.redis
+    # Свои наблюдения сбрасываем сразу, не дожидаясь фонового сброса
+    await flush_all(redis_client)
+    body = await registry.render(
+        redis_client, await queue_gauges(redis_client)
+    )
+    return PlainTextResponse(body, media_type=PROMETHEUS_CONTENT_TYPE)
+
+
+@router.get("/trace/{document_id}", response_class=JSONResponse)
+async def document_trace(request: Request, document_id: str):
+    """Спаны документа от загрузки до записи результата (TRACING_ENABLED)"""
+    await flush_all(request.app.state.redis)
+    spans = await tracing.get_trace(request.app.state.redis, document_id)
+    if not spans:
+        raise HTTPException(status_code=404, detail="Трасса не найдена")
+    return {"document_id": document_id, "spans": spans}
@@ -0,0 +1,106 @@
+import asyncio
+import os
+
+import numpy as np
+from fastapi import APIRouter, Request, Query
+from fastapi.responses import JSONResponse
+
+from src.app.embeddings import embedding_model
+from src.app.fulltext import snippet
+from src.app.schemas import COLLECTION_PATTERN
+
+# Константа Reciprocal Rank Fusion: чем больше, тем ровнее вклад
+# нижних позиций каждого из списков
+RRF_K = int(os.getenv("RRF_K", "60"))
+# Во сколько раз больше кандидатов берём из каждого списка перед слиянием
+SEARCH_CANDIDATES_FACTOR = int(os.getenv("SEARCH_CANDIDATES_FACTOR", "3"))
+
+router = APIRouter()
+
+
+def fuse(rankings: list[list[str]], k: int = RRF_K) -> list[tuple[str, float]]:
+    """Reciprocal Rank Fusion нескольких ранжированных списков id"""
+    scores: dict[str, float] = {}
+    for ranking in rankings:
+        for rank, document_id in enumerate(ranking):
+            scores[document_id] = scores.get(document_id, 0.0) + 1 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+@router.get("/search", response_class=JSONResponse)
+async def search_documents(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=500),
+    limit: int = Query(10, ge=1, le=50),
+    hybrid: bool = False,
+    collection: str = Query("default", pattern=COLLECTION_PATTERN),
+):
+    """
+    Полнотекстовый поиск по документам (BM25 по инвертированному
+    индексу). hybrid - объединить с близостью векторов чанков коллекции
+    collection (RRF). Тексты читаются только у документов из ответа -
+    для фрагментов с найденными словами
+    """
+    fulltext = request.app.state.fulltext
+    candidates = limit * SEARCH_CANDIDATES_FACTOR if hybrid else limit
+    lexical = await fulltext.search(q, candidates)
+    scores = {hit["document_id"]: hit["score"] for hit in lexical}
+
+    chunks: dict[str, dict] = {}
+    if hybrid:
+        query = await _embed_query(request, q)
+        vector_hits = await asyncio.to_thread(
+            request.app.state.vector_index.search, query, candidates,
+            collection=collection,
+        )
+        # Документ в векторном списке представлен лучшим чанком
+        for hit in vector_hits:
+            chunks.setdefault(hit["document_id"], hit)
+        ranked = fuse([
+            [hit["document_id"] for hit in lexical],
+            list(chunks),
+        ])[:limit]
+    else:
+        ranked = [(hit["document_id"], hit["score"]) for hit in lexical]
+
+    texts = await asyncio.gather(*(
+        request.app.state.store.get_text(document_id)
+        for document_id, _ in ranked
+    ))
+    # Поиск вхождений по длинным текстам - не в event loop
+    snippets = await asyncio.to_thread(
+        lambda: [snippet(text, q) if text else "" for text in texts]
+    )
+    results = []
+    for (document_id, score), text, fragment in zip(ranked, texts, snippets):
+        if text is None:
+            continue  # документ уже удалён
+        result = {
+            "document_id": document_id,
+            "score": round(score, 6),
+            "snippet": fragment,
+        }
+        if hybrid:
+            result["bm25"] = (
+                round(scores[document_id], 6)
+                if document_id in scores else None
+            )
+            result["similarity"] = (
+                round(chunks[document_id]["score"], 4)
+                if document_id in chunks else None
+            )
+        results.append(result)
+    return {"query": q, "hybrid": hybrid, "results": results}
+
+
+async def _embed_query(request: Request, q: str) -> np.ndarray:
+    """
+    Вектор запроса. С модельным сервером энкодер работает там - API не
+    держит свою копию; без него (разработка) энкодер грузится в API
+    """
+    client = request.app.state.model_client
+    if client is not None:
+        vectors = await client.embed([q])
+        return np.asarray(vectors[0], dtype=np.float32)
+    vectors = await asyncio.to_thread(embedding_model.encode, [q])
+    return vectors[0]
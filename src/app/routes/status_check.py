@@ -1,8 +1,15 @@
-from fastapi import APIRouter, Request
+import asyncio
+from typing import Optional
+
+from fastapi import APIRouter, Request, Query
 from fastapi.responses import JSONResponse
 from fastapi.templating import Jinja2Templates
 from pathlib import Path
 
+from src.app.model_client import ModelServerError
+from src.app.schemas import DocumentStatus
+from src.app.services import registry
+
 router = APIRouter()
 templates = Jinja2Templates(
     directory=Path(__file__).parent.parent / "templates"
@@ -10,18 +17,81 @@ templates = Jinja2Templates(
 
 
 @router.get("/status", response_class=JSONResponse)
-async def check_status(request: Request):
-    redis_client = request.app.state.redis
-
-    documents = []
-    async for key in redis_client.scan_iter("doc:*"):
-        status, created_at = await redis_client.hmget(
-            key,
-            ["status", "created_at"],
+async def check_status(
+    request: Request,
+    status: Optional[DocumentStatus] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+):
+    """
+    Список документов от новых к старым по индексам, с фильтром по
+    статусу. Следующая страница - тот же запрос с cursor=next_cursor.
+    """
+    documents, next_cursor = await request.app.state.store.list(
+        status=status,
+        cursor=cursor,
+        limit=limit,
+    )
+    return {"documents": documents, "next_cursor": next_cursor}
+
+
+@router.get("/status/lifecycle", response_class=JSONResponse)
+async def lifecycle_stats(request: Request):
+    """Сколько документов и памяти освободил RetentionSweeper"""
+    return await request.app.state.sweeper.stats()
+
+
+@router.get("/status/extraction", response_class=JSONResponse)
+async def extraction_stats(request: Request):
+    """
+    Загрузка пула извлечения текста (очередь, отказы, таймауты) и
+    попадания в кэш извлечённого текста
+    """
+    return {
+        **registry.executor.metrics(),
+        "cache": await request.app.state.extraction_cache.stats(),
+    }
+
+
+@router.get("/status/admission", response_class=JSONResponse)
+async def admission_stats(request: Request):
+    """
+    Допуск запросов: глубина очереди генерации, измеренная скорость
+    её разбора и занятость полос загрузки в этом процессе
+    """
+    admission = request.app.state.admission
+    return admission.stats() if admission else {"enabled": False}
+
+
+@router.get("/status/vectors", response_class=JSONResponse)
+async def vector_stats(request: Request):
+    """Коллекции векторного индекса: живые и удалённые строки, поколение"""
+    return await asyncio.to_thread(request.app.state.vector_index.stats)
+
+
+@router.get("/status/fulltext", response_class=JSONResponse)
+async def fulltext_stats(request: Request):
+    """Документы в полнотекстовом индексе и ожидающие чистки списков"""
+    return await request.app.state.fulltext.stats()
+
+
+@router.get("/status/model", response_class=JSONResponse)
+async def model_status(request: Request):
+    """
+    Готовность модельного сервера: загрузка, очередь генерации, отказы.
+    503, пока сервер недоступен или прогревается
+    """
+    client = request.app.state.model_client
+    if client is None:
+        return {"mode": "in-process"}
+    try:
+        health = await asyncio.wait_for(client.health(), 5)
+    except (OSError, asyncio.TimeoutError, ModelServerError) as e:
+        return JSONResponse(
+            {"mode": "server", "ready": False, "error": str(e)},
+            status_code=503,
         )
-        documents.append({
-            "document_id": key,
-            "status": status,
-            "created_at": created_at,
-        })
-    return {"documents": documents}
+    return JSONResponse(
+        {"mode": "server", **health},
+        status_code=200 if health["ready"] else 503,
+    )
@@ -1,14 +1,42 @@
+import asyncio
+import os
+import time
 import uuid
 from datetime import datetime
+from typing import List, Optional
 
-from fastapi import APIRouter, Request, UploadFile, File, HTTPException
+from fastapi import APIRouter, Depends, Request, UploadFile, HTTPException, Query
 from fastapi.responses import JSONResponse
 from fastapi.templating import Jinja2Templates
 from pathlib import Path
 
 from src.logger import log
+from src.app import tracing
+from src.app.admission import LANE_LONG
+from src.app.generation_config import DECODING_MODES
+from src.app.ingest import (
+    expand_zip,
+    is_zip,
+    upload_digest,
+    upload_files,
+    upload_openapi,
+)
+from src.app.jobs import (
+    JOB_INDEX,
+    JOB_SUMMARIZE,
+    enqueue_indexing,
+    enqueue_jobs,
+)
+from src.app.metrics import EXTRACTION_SECONDS
 from src.app.services import get_processor, get_supported_types
-from src.app.schemas import DocumentDTO
+from src.app.schemas import COLLECTION_PATTERN, DocumentDTO, DocumentStatus
+from src.app.summary_cache import content_hash
+
+# Сколько файлов пакетной загрузки разбираются одновременно (общий
+# ExtractionExecutor ограничивает процессы, здесь - очередь к нему)
+UPLOAD_BATCH_CONCURRENCY = int(os.getenv("UPLOAD_BATCH_CONCURRENCY", "4"))
+# Максимум файлов в одном пакете, включая распакованные из архивов
+UPLOAD_BATCH_MAX_FILES = int(os.getenv("UPLOAD_BATCH_MAX_FILES", "200"))
 
 router = APIRouter()
 templates = Jinja2Templates(
@@ -16,7 +44,11 @@ templates = Jinja2Templates(
 )
 
 
-async def extract_document_text(file) -> str:
+async def extract_document_text(
+    file,
+    cache,
+    max_pages: Optional[int] = None,
+) -> str:
     # Выбор обработчика по типу файла
     processor = get_processor(file.content_type)
     if not processor:
@@ -26,40 +58,61 @@ async def extract_document_text(file) -> str:
             detail=f"Неподдерживаемый формат. Поддерживаемые: {supported}"
         )
 
+    # Тот же файл уже разбирался - берём текст из кэша (хэш посчитан,
+    # пока файл загружался)
+    digest = await upload_digest(file)
+    text = await cache.get(processor, digest, max_pages)
+    if text is not None:
+        return text
+
     # Извлечение текста
-    text = await processor.extract_text(file)
+    with tracing.span("upload.extract", content_type=file.content_type):
+        with EXTRACTION_SECONDS.time(content_type=file.content_type):
+            text = await processor.extract_text(file, max_pages)
     if not text or not text.strip():
         raise HTTPException(
             status_code=400,
             detail="Не удалось извлечь текст из документа",
         )
+    await cache.set(processor, digest, text, max_pages)
     return text
 
 
-@router.post("/upload", response_class=JSONResponse)
+@router.post(
+    "/upload",
+    response_class=JSONResponse,
+    openapi_extra=upload_openapi("file"),
+)
 async def upload_and_extract(
     request: Request,
-    file: UploadFile = File(...),
+    files: List[UploadFile] = Depends(upload_files("file")),
+    preview_pages: Optional[int] = Query(None, ge=1),
+    collection: str = Query("default", pattern=COLLECTION_PATTERN),
 ):
     """
-    Загружает документ, извлекает текст и возвращает страницу с результатом
+    Загружает документ, извлекает текст и возвращает страницу с результатом.
+    preview_pages - взять только первые страницы PDF для быстрого
+    предварительного summary; collection - коллекция векторного индекса,
+    в которую попадут чанки документа
     """
+    file = files[0]
     try:
         # Валидация файла
         if not file.filename:
             raise HTTPException(status_code=400, detail="Файл не загружен")
 
-        # Валидация размера
-        content_length = request.headers.get("content-length")
-        if content_length and int(content_length) > 10 * 1024 * 1024:  # 10MB
-            raise HTTPException(status_code=400, detail="Файл слишком большой")
-
-        text = await extract_document_text(file)
+        # Размер тела ограничивает UploadLimitMiddleware ещё при чтении,
+        # файл к этому моменту уже в памяти или во временном файле
 
-        # Сохранение в сессию
-        redis_client = request.app.state.redis
+        # Идентификатор заранее - к нему привязаны спаны трассировки
         document_id = str(uuid.uuid4())
+        tracing.bind(document_id)
 
+        text = await extract_document_text(
+            file, request.app.state.extraction_cache, preview_pages
+        )
+
+        # Сохранение в Redis вместе с индексами
         now = datetime.utcnow()
 
         doc = DocumentDTO(
@@ -67,18 +120,28 @@ async def upload_and_extract(
             status="uploaded",
             text=text,
             result=None,
+            content_hash=content_hash(text),
+            collection=collection,
+            text_length=len(text),
+            preview_pages=preview_pages,
             created_at=now,
             updated_at=now
         )
-        await redis_client.hset(
-            f'doc:{document_id}',
-            mapping=doc.to_redis()
-        )
-        # Expire только после определения нагрузки
-        # await redis_client.expire(document_id, 600)
+        with tracing.span("upload.store"):
+            # Срок хранения задаётся RETENTION_* и отслеживается sweeper
+            await request.app.state.store.create(doc)
+            # Полнотекстовый индекс (/search) пополняется сразу
+            await request.app.state.fulltext.add(document_id, text)
+            # Индексация для поиска (/ask) идёт в воркере в фоне: чанки
+            # дописываются в конец коллекции, индекс не перестраивается
+            await enqueue_indexing(request.app.state.redis, document_id)
 
         return JSONResponse(
-            {"document_id": document_id, "status": doc.status},
+            {
+                "document_id": document_id,
+                "status": doc.status,
+                "collection": doc.collection,
+            },
             status_code=201,
         )
 
@@ -87,3 +150,186 @@ async def upload_and_extract(
     except Exception as e:
         log.error(f"Ошибка: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail="Ошибка обработки")
+
+
+@router.post(
+    "/upload/batch",
+    response_class=JSONResponse,
+    openapi_extra=upload_openapi("files", many=True),
+)
+async def upload_batch(
+    request: Request,
+    files: List[UploadFile] = Depends(upload_files("files")),
+    preview_pages: Optional[int] = Query(None, ge=1),
+    collection: str = Query("default", pattern=COLLECTION_PATTERN),
+    generate: bool = False,
+    decoding: Optional[str] = None,
+):
+    """
+    Пакетная загрузка: несколько файлов и/или zip-архивы. Тексты
+    извлекаются параллельно (не больше UPLOAD_BATCH_CONCURRENCY), все
+    документы записываются одной транзакцией. generate - сразу поставить
+    все документы на генерацию. Ошибка одного файла не прерывает пакет:
+    она попадает в errors
+    """
+    if decoding is not None and decoding not in DECODING_MODES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"decoding: одно из {', '.join(DECODING_MODES)}",
+        )
+
+    admission = getattr(request.app.state, "admission", None)
+    if generate and admission:
+        # Пакет целиком - длинная полоса очереди генерации. Здесь - только
+        # быстрый отказ до извлечения; размер пакета учитывается ниже
+        await admission.check_queue(LANE_LONG)
+
+    errors: list[dict] = []
+    expanded: list[UploadFile] = []
+    try:
+        items: list[UploadFile] = []
+        for file in files:
+            if not is_zip(file):
+                items.append(file)
+                continue
+            try:
+                members = await expand_zip(file)
+            except HTTPException as e:
+                errors.append(_batch_error(file.filename, e))
+                continue
+            expanded.extend(members)
+            items.extend(members)
+        if len(items) > UPLOAD_BATCH_MAX_FILES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"В пакете больше {UPLOAD_BATCH_MAX_FILES} файлов",
+            )
+
+        cache = request.app.state.extraction_cache
+        semaphore = asyncio.Semaphore(UPLOAD_BATCH_CONCURRENCY)
+
+        # Идентификаторы заранее - к ним привязаны спаны трассировки
+        document_ids = [str(uuid.uuid4()) for _ in items]
+
+        async def extract(file: UploadFile, document_id: str):
+            # gather запускает отдельную задачу - привязка только к ней
+            tracing.bind(document_id)
+            async with semaphore:
+                try:
+                    if not file.filename:
+                        raise HTTPException(
+                            status_code=400, detail="Файл не загружен"
+                        )
+                    return await extract_document_text(
+                        file, cache, preview_pages
+                    )
+                except HTTPException as e:
+                    return e
+                except Exception as e:
+                    log.error(f"Ошибка ({file.filename}): {e}", exc_info=True)
+                    return HTTPException(
+                        status_code=500, detail="Ошибка обработки"
+                    )
+
+        texts = await asyncio.gather(*(
+            extract(file, document_id)
+            for file, document_id in zip(items, document_ids)
+        ))
+
+        now = datetime.utcnow()
+        docs: list[DocumentDTO] = []
+        names: list[str] = []
+        for file, text, document_id in zip(items, texts, document_ids):
+            if isinstance(text, HTTPException):
+                errors.append(_batch_error(file.filename, text))
+                continue
+            docs.append(DocumentDTO(
+                document_id=document_id,
+                status="uploaded",
+                text=text,
+                result=None,
+                content_hash=content_hash(text),
+                collection=collection,
+                text_length=len(text),
+                preview_pages=preview_pages,
+                created_at=now,
+                updated_at=now,
+            ))
+            names.append(file.filename)
+
+        if generate:
+            # Уже суммаризированные тексты сразу готовы, остальные
+            # создаются в статусе processing - переход из uploaded не нужен
+            cached = await asyncio.gather(*(
+                request.app.state.summary_cache.get(doc.content_hash)
+                for doc in docs
+            ))
+            for doc, summary in zip(docs, cached):
+                if summary is not None:
+                    doc.status = DocumentStatus.done
+                    doc.result = summary
+                else:
+                    doc.status = DocumentStatus.processing
+            pending = sum(
+                doc.status == DocumentStatus.processing for doc in docs
+            )
+            if admission and pending:
+                # Очередь должна вместить все задачи пакета, а не одну
+                await admission.check_queue(LANE_LONG, pending)
+
+        started, clock = time.time(), time.perf_counter()
+        await request.app.state.store.create_many(docs)
+        await asyncio.gather(*(
+            request.app.state.fulltext.add(doc.document_id, doc.text)
+            for doc in docs
+        ))
+        jobs = [
+            (JOB_INDEX, {"document_id": doc.document_id}) for doc in docs
+        ]
+        for doc in docs:
+            if doc.status == DocumentStatus.processing:
+                fields = {"document_id": doc.document_id}
+                if decoding:
+                    fields["decoding"] = decoding
+                jobs.append((JOB_SUMMARIZE, fields))
+        if jobs:
+            await enqueue_jobs(request.app.state.redis, jobs)
+        # Запись общая на пакет - спан у каждого документа один и тот же
+        for doc in docs:
+            tracing.record(
+                "upload.store", started, time.perf_counter() - clock,
+                doc.document_id, batch=len(docs),
+            )
+
+        return JSONResponse(
+            {
+                "documents": [
+                    {
+                        "filename": name,
+                        "document_id": doc.document_id,
+                        "status": DocumentStatus(doc.status).value,
+                    }
+                    for name, doc in zip(names, docs)
+                ],
+                "errors": errors,
+                "collection": collection,
+            },
+            status_code=201 if docs else 400,
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        log.error(f"Ошибка: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Ошибка обработки")
+    finally:
+        for file in expanded:
+            await file.close()
+
+
+def _batch_error(filename: Optional[str], error: HTTPException) -> dict:
+    return {
+        "filename": filename,
+        "status": error.status_code,
+        "error": error.detail,
+    }
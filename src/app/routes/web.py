@@ -1,8 +1,10 @@
 from fastapi import APIRouter, Request, HTTPException
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.templating import Jinja2Templates
 from pathlib import Path
 
+from src.app.jobs import enqueue_unindexing
+
 router = APIRouter()
 templates = Jinja2Templates(
     directory=Path(__file__).parent.parent.parent / "templates"
@@ -30,12 +32,31 @@ async def results_page(request: Request, doc_id: str):
     Страница с итогом ответа конкретного документа
     """
     redis_client = request.app.state.redis
-    doc_data = await redis_client.hgetall(doc_id)
+    # Принимаем и id документа, и ключ Redis вида doc:<id>
+    document_id = doc_id.removeprefix("doc:")
+    doc_data = await redis_client.hgetall(f"doc:{document_id}")
     if not doc_data:
         raise HTTPException(status_code=404, detail="Документ не найден")
     return templates.TemplateResponse(
         "result.html",
-        {"request": request, "doc_data": doc_data},
+        {
+            "request": request,
+            "doc_data": doc_data,
+            "document_id": document_id,
+        },
     )
 
-# TODO - эндпоинт на удаление результатов
+
+@router.delete("/documents/{doc_id}", response_class=JSONResponse)
+async def delete_document(request: Request, doc_id: str):
+    """
+    Удаляет документ из выдачи; память освобождается в фоне
+    (RetentionSweeper)
+    """
+    document_id = doc_id.removeprefix("doc:")
+    if not await request.app.state.store.delete(document_id):
+        raise HTTPException(status_code=404, detail="Документ не найден")
+    # Чанки документа перестают находиться сразу, не дожидаясь sweeper
+    await enqueue_unindexing(request.app.state.redis, [document_id])
+    await request.app.state.fulltext.remove([document_id])
+    return {"document_id": document_id, "deleted": True}
@@ -1,8 +1,11 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional
 from datetime import datetime
 from enum import Enum
 
+# Имя коллекции векторов - это и имя каталога на диске
+COLLECTION_PATTERN = r"^[A-Za-z0-9_-]{1,64}$"
+
 
 class DocumentStatus(str, Enum):
     uploaded = "uploaded"
@@ -14,8 +17,19 @@ class DocumentStatus(str, Enum):
 class DocumentDTO(BaseModel):
     document_id: str
     status: DocumentStatus
-    text: str
+    # Текст хранится отдельно от метаданных (DocumentStore.get_text)
+    text: str = ""
     result: Optional[str] = None
+    # sha256 нормализованного текста (ключ кэша summary)
+    content_hash: Optional[str] = None
+    # Коллекция векторного индекса и число проиндексированных чанков
+    # (None - документ ещё не проиндексирован)
+    collection: str = "default"
+    indexed_chunks: Optional[int] = None
+    # Длина текста в символах (полоса допуска, оценка стоимости генерации)
+    text_length: Optional[int] = None
+    # Из PDF взяты только первые страницы (предварительное summary)
+    preview_pages: Optional[int] = None
     created_at: datetime
     updated_at: datetime
 
@@ -29,20 +43,52 @@ class DocumentDTO(BaseModel):
         return cls(
             document_id=document_id,
             status=data.get("status", ""),
-            text=data.get("text", ""),
             result=data.get("result") or None,
+            content_hash=data.get("content_hash") or None,
+            collection=data.get("collection") or "default",
+            indexed_chunks=(
+                int(data["indexed_chunks"])
+                if data.get("indexed_chunks") else None
+            ),
+            text_length=(
+                int(data["text_length"]) if data.get("text_length") else None
+            ),
+            preview_pages=(
+                int(data["preview_pages"])
+                if data.get("preview_pages") else None
+            ),
             created_at=datetime.fromisoformat(data.get("created_at")),
             updated_at=datetime.fromisoformat(data.get("updated_at")),
         )
 
     def to_redis(self) -> dict:
-        """Готовим данные для Redis"""
+        """Готовим метаданные для Redis (без текста документа)"""
         return {
             "status": self.status,
-            "text": self.text,
             # избегаем None
             "result": self.result or "",
-            # возвращаем строку для redis
-            "created_at": self.created_at.isoformat(),
-            "updated_at": self.updated_at.isoformat(),
+            "content_hash": self.content_hash or "",
+            "collection": self.collection,
+            "indexed_chunks": (
+                "" if self.indexed_chunks is None else self.indexed_chunks
+            ),
+            "text_length": (
+                "" if self.text_length is None else self.text_length
+            ),
+            "preview_pages": (
+                "" if self.preview_pages is None else self.preview_pages
+            ),
+            # возвращаем строку для redis; фиксированный формат с
+            # микросекундами, чтобы строки сортировались хронологически
+            "created_at": self.created_at.isoformat(timespec="microseconds"),
+            "updated_at": self.updated_at.isoformat(timespec="microseconds"),
         }
+
+
+class AskRequest(BaseModel):
+    question: str = Field(min_length=1, max_length=2000)
+    # Искать только в одном документе; без него - по всем
+    document_id: Optional[str] = None
+    top_k: Optional[int] = Field(default=None, ge=1, le=20)
+    # Коллекция для поиска; при document_id берётся коллекция документа
+    collection: str = Field(default="default", pattern=COLLECTION_PATTERN)
@@ -1,14 +1,15 @@
 from typing import Dict, Optional
+from src.app.services.executor import ExtractionExecutor
 from src.app.services.processor import DocumentProcessor
 
-# TODO: doc/docx support
-
 
 class ProcessorRegistry:
     """Реестр обработчиков документов"""
 
     def __init__(self):
         self._processors: Dict[str, DocumentProcessor] = {}
+        # Один исполнитель на все обработчики и запросы
+        self.executor = ExtractionExecutor()
         self._initialize_processors()
 
     def _initialize_processors(self):
@@ -18,9 +19,9 @@ class ProcessorRegistry:
         from .doc_processor import DOCProcessor
 
         processors = [
-            PDFProcessor(),
-            TXTProcessor(),
-            DOCProcessor(),
+            PDFProcessor(self.executor),
+            TXTProcessor(self.executor),
+            DOCProcessor(self.executor),
         ]
 
         for processor in processors:
@@ -35,6 +36,10 @@ class ProcessorRegistry:
         """Получение всех поддерживаемых MIME типов"""
         return list(self._processors.keys())
 
+    def shutdown(self) -> None:
+        """Остановка пула извлечения при остановке приложения"""
+        self.executor.shutdown()
+
 
 # Глобальный реестр
 registry = ProcessorRegistry()
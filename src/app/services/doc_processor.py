@@ -1,14 +1,23 @@
-from src.app.services.processor import DocumentProcessor
+from src.app.services.processor import DocumentProcessor, Payload, open_payload
 from fastapi import UploadFile, HTTPException
-import tempfile
-import asyncio
-from concurrent.futures import ThreadPoolExecutor
-from pathlib import Path
+from typing import BinaryIO, Optional
+import re
+import struct
+import zipfile
+from xml.etree.ElementTree import iterparse
+
+# Сигнатуры форматов: DOCX - zip-архив, DOC - составной файл OLE
+ZIP_MAGIC = b"PK\x03\x04"
+OLE_MAGIC = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"
+
+W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
 
 
 class DOCProcessor(DocumentProcessor):
     """Обработчик DOC/DOCX файлов"""
 
+    version = "2"
+
     def get_supported_types(self) -> list[str]:
         return ["application/msword", "application/vnd.openxmlformats-officedocument.wordprocessingml.document"]
 
@@ -22,58 +31,209 @@ class DOCProcessor(DocumentProcessor):
                 detail="Только DOC/DOCX файлы разрешены",
             )
 
-    async def extract_text(self, file: UploadFile) -> str:
+    async def extract_text(
+        self,
+        file: UploadFile,
+        max_pages: Optional[int] = None,
+    ) -> str:
         """Асинхронное извлечение текста из DOC/DOCX"""
         await self.validate(file)
 
-        # Читаем содержимое файла
-        content = await file.read()
-
-        # CPU-интенсивную работу выполняем в thread pool
-        loop = asyncio.get_event_loop()
-        with ThreadPoolExecutor() as executor:
-            text = await loop.run_in_executor(
-                executor, self._extract_text_sync, content
-            )
+        # Разбор XML - CPU-интенсивная работа, выполняем в пуле процессов
+        text = await self.executor.run(
+            self._extract_text_sync, self.open_source(file)
+        )
 
         return text.strip() if text else ""
 
-    def _extract_text_sync(self, content: bytes) -> str:
-        """Синхронное извлечение текста (выполняется в отдельном потоке)"""
+    @staticmethod
+    def _extract_text_sync(payload: Payload) -> str:
+        """
+        Синхронное извлечение текста (выполняется в отдельном процессе).
+        Формат определяется по сигнатуре, а не по MIME типу: браузеры
+        нередко присылают .docx как application/msword и наоборот
+        """
         try:
-            # Импортируем только при необходимости
-            from docx import Document
-            import docx2txt
-
-            # Создаем временный файл с автоматическим удалением
-            with tempfile.NamedTemporaryFile(
-                delete=False,
-                suffix='.docx',
-            ) as tmp:
-                tmp.write(content)
-                tmp_path = Path(tmp.name)
-
-            # Для DOCX файлов
-            if tmp_path.suffix.lower() == '.docx':
-                doc = Document(str(tmp_path))
-                text = '\n'.join(
-                    [paragraph.text for paragraph in doc.paragraphs]
-                )
-            # Для DOC файлов
-            else:
-                text = docx2txt.process(str(tmp_path))
-
-            tmp_path.unlink(missing_ok=True)
-
-            return text
+            with open_payload(payload) as source:
+                magic = source.read(8)
+                source.seek(0)
+                if magic.startswith(ZIP_MAGIC):
+                    return docx_text(source)
+                if magic == OLE_MAGIC:
+                    return ole_doc_text(source)
+            raise ValueError("файл не является документом Word")
 
         except ImportError:
             raise HTTPException(
                 status_code=500,
                 detail="Не установлены необходимые библиотеки для обработки DOC/DOCX файлов"
             )
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(
                 status_code=400,
                 detail=f"Ошибка извлечения текста из документа: {str(e)}"
             )
+
+
+def docx_text(source: BinaryIO) -> str:
+    """
+    Текст DOCX: колонтитулы и тело документа вместе с таблицами.
+    XML читается потоково прямо из zip-архива, без объектной модели
+    """
+    with zipfile.ZipFile(source) as archive:
+        names = archive.namelist()
+        headers = sorted(n for n in names if re.fullmatch(r"word/header\d*\.xml", n))
+        footers = sorted(n for n in names if re.fullmatch(r"word/footer\d*\.xml", n))
+
+        parts = []
+        for name in [*headers, "word/document.xml", *footers]:
+            if name not in names:
+                continue
+            with archive.open(name) as xml:
+                text = _wordml_text(xml)
+            # Одинаковые колонтитулы разных секций - один раз
+            if text and text not in parts:
+                parts.append(text)
+    return "\n\n".join(parts)
+
+
+def _wordml_text(xml: BinaryIO) -> str:
+    """
+    Текст части WordprocessingML. Ячейки таблицы разделяются табуляцией,
+    строки таблицы и абзацы - переводом строки; вложенные таблицы
+    сводятся в текст своей ячейки через пробел
+    """
+    lines: list[str] = []
+    paragraph: list[str] = []
+    # Строка и ячейка на каждом уровне вложенности таблиц: строки
+    # вложенной таблицы попадают в ячейку родителя, не в его строку
+    tables: list[tuple[list[str], list[str]]] = []  # (row, cells)
+
+    for event, elem in iterparse(xml, events=("start", "end")):
+        tag = elem.tag
+        if event == "start":
+            if tag == f"{W}tbl":
+                tables.append(([], []))
+            continue
+
+        if tag == f"{W}t":
+            paragraph.append(elem.text or "")
+        elif tag == f"{W}tab":
+            paragraph.append("\t")
+        elif tag in (f"{W}br", f"{W}cr"):
+            paragraph.append("\n")
+        elif tag == f"{W}p":
+            text = "".join(paragraph)
+            paragraph.clear()
+            if tables:
+                tables[-1][1].append(text)
+            else:
+                lines.append(text)
+        elif tag == f"{W}tc" and tables:
+            row, cells = tables[-1]
+            row.append(" ".join(c for c in cells if c))
+            cells.clear()
+        elif tag == f"{W}tr" and tables:
+            row = tables[-1][0]
+            if len(tables) > 1:
+                # Вложенная таблица - часть ячейки родителя: табуляция
+                # сдвинула бы его столбцы
+                tables[-2][1].append(" ".join(c for c in row if c))
+            else:
+                lines.append("\t".join(row))
+            row.clear()
+        elif tag == f"{W}tbl" and tables:
+            tables.pop()
+        else:
+            continue
+        # Разобранные элементы не держим в памяти
+        elem.clear()
+
+    return "\n".join(lines).strip()
+
+
+# Символы разметки в тексте DOC: абзац, ячейка/строка таблицы, разрыв
+# строки, колонки, страницы, неразрывный дефис
+_DOC_CONTROL = str.maketrans({
+    "\r": "\n",
+    "\x07": "\t",
+    "\x0b": "\n",
+    "\x0e": "\n",
+    "\x0c": "\n",
+    "\x1e": "-",
+    "\x1f": "",
+})
+# Поле: \x13 код поля \x14 результат \x15; оставляем только результат
+_DOC_FIELD = re.compile(r"\x13[^\x13\x14\x15]*(?:\x14([^\x13\x15]*))?\x15")
+
+
+def ole_doc_text(source: BinaryIO) -> str:
+    """Текст документа Word 97-2003 (составной файл OLE)"""
+    import olefile
+
+    with olefile.OleFileIO(source) as ole:
+        word_document = ole.openstream("WordDocument").read()
+        # Какой из потоков таблиц действует, указывает флаг в FIB
+        flags = struct.unpack_from("<H", word_document, 0x0A)[0]
+        if flags & 0x0100:
+            raise ValueError("документ зашифрован")
+        table_name = "1Table" if flags & 0x0200 else "0Table"
+        table = ole.openstream(table_name).read()
+    return doc_streams_text(word_document, table)
+
+
+def doc_streams_text(word_document: bytes, table: bytes) -> str:
+    """
+    Текст основного документа и колонтитулов по таблице фрагментов (CLX)
+    из FIB потока WordDocument, [MS-DOC] 2.5 и 2.9.38
+    """
+    if struct.unpack_from("<H", word_document, 0)[0] != 0xA5EC:
+        raise ValueError("повреждён заголовок DOC")
+    csw = struct.unpack_from("<H", word_document, 32)[0]
+    offset = 34 + csw * 2
+    cslw = struct.unpack_from("<H", word_document, offset)[0]
+    rg_lw = offset + 2
+    ccp_text, ccp_ftn, ccp_hdd = struct.unpack_from("<3i", word_document, rg_lw + 12)
+    rg_fc_lcb = rg_lw + cslw * 4 + 2
+    # fcClx/lcbClx - 34-я пара FibRgFcLcb97
+    fc_clx, lcb_clx = struct.unpack_from("<II", word_document, rg_fc_lcb + 33 * 8)
+
+    clx = table[fc_clx:fc_clx + lcb_clx]
+    pos = 0
+    while pos < len(clx) and clx[pos] == 0x01:  # Prc - пропускаем
+        pos += 3 + struct.unpack_from("<h", clx, pos + 1)[0]
+    if pos >= len(clx) or clx[pos] != 0x02:
+        raise ValueError("не найдена таблица фрагментов")
+    lcb = struct.unpack_from("<I", clx, pos + 1)[0]
+    plc = clx[pos + 5:pos + 5 + lcb]
+    count = (lcb - 4) // 12
+    cps = struct.unpack_from(f"<{count + 1}I", plc, 0)
+
+    chars: list[str] = []
+    for i in range(count):
+        pcd = 4 * (count + 1) + i * 8
+        fc = struct.unpack_from("<I", plc, pcd + 2)[0]
+        length = cps[i + 1] - cps[i]
+        if fc & 0x40000000:  # 8-битный текст (cp1252)
+            start = (fc & 0x3FFFFFFF) // 2
+            chars.append(word_document[start:start + length].decode("cp1252", "replace"))
+        else:  # UTF-16LE
+            chars.append(word_document[fc:fc + 2 * length].decode("utf-16-le", "replace"))
+    text = "".join(chars)
+
+    header_start = ccp_text + ccp_ftn
+    parts = [
+        text[header_start:header_start + ccp_hdd],
+        text[:ccp_text],
+    ]
+    cleaned = []
+    for part in parts:
+        part = _DOC_FIELD.sub(lambda m: m.group(1) or "", part)
+        # Метка последней ячейки и метка конца строки таблицы
+        part = part.replace("\x07\x07", "\n")
+        part = part.translate(_DOC_CONTROL).strip()
+        if part:
+            cleaned.append(part)
+    return "\n\n".join(cleaned)
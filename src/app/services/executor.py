@@ -0,0 +1,238 @@
+import asyncio
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager
+from typing import Callable, Optional
+
+from fastapi import HTTPException
+
+from src.logger import log
+
+# Процессы для CPU-bound форматов (pypdf держит GIL всё время разбора)
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", str(os.cpu_count() or 2)))
+# Потоки для лёгких форматов (декодирование текста)
+EXTRACT_THREADS = int(os.getenv("EXTRACT_THREADS", "4"))
+# Сколько задач может ждать свободный процесс; сверх - 503
+EXTRACT_MAX_QUEUE = int(os.getenv("EXTRACT_MAX_QUEUE", "32"))
+# Предел времени одной задачи, сек: зависший разбор убивается вместе с
+# процессом
+EXTRACT_TIMEOUT = float(os.getenv("EXTRACT_TIMEOUT", "60"))
+# Перезапуск процесса после N задач (память парсеров растёт)
+EXTRACT_MAX_TASKS_PER_CHILD = int(os.getenv("EXTRACT_MAX_TASKS_PER_CHILD", "200"))
+
+# Сколько секунд советуем клиенту подождать при перегрузке
+RETRY_AFTER = 5
+
+
+class ExtractionExecutor:
+    """
+    Общий исполнитель извлечения текста для всех обработчиков.
+    CPU-bound задачи выполняются в пуле процессов, одновременно не больше
+    workers; ожидающих не больше max_queue, остальные сразу получают 503.
+    Задача дольше timeout прерывается перезапуском пула.
+    """
+
+    def __init__(
+        self,
+        workers: int = EXTRACT_WORKERS,
+        threads: int = EXTRACT_THREADS,
+        max_queue: int = EXTRACT_MAX_QUEUE,
+        timeout: float = EXTRACT_TIMEOUT,
+    ):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._threads = ThreadPoolExecutor(
+            max_workers=threads, thread_name_prefix="extract"
+        )
+        self._slots: Optional[asyncio.Semaphore] = None
+
+        self.running = 0
+        self.queued = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.restarts = 0
+        self._busy_seconds = 0.0
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        # spawn: дочерние процессы не наследуют event loop и потоки
+        # родителя; пул создаётся при первой задаче
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                max_tasks_per_child=EXTRACT_MAX_TASKS_PER_CHILD,
+            )
+        return self._pool
+
+    def _restart(self, pool: ProcessPoolExecutor) -> None:
+        """Убивает процессы пула: иначе зависшая задача держит процесс"""
+        if pool is not self._pool:
+            return  # уже перезапущен
+        self._pool = None
+        processes = list((pool._processes or {}).values())
+        pool.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            process.terminate()
+        self.restarts += 1
+
+    async def run(self, fn: Callable, source, cpu_bound: bool = True):
+        """
+        Выполняет fn(payload) в пуле. source - seekable поток загрузки;
+        в процесс передаются bytes (файл в памяти) или путь к файлу
+        на диске (см. transferable), в поток - сам поток.
+        """
+        if not cpu_bound:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._threads, fn, source)
+
+        self.admit()
+        async with transferable(source) as payload:
+            return await self.submit(fn, payload)
+
+    def admit(self) -> None:
+        """Отказ с 503, если процессы заняты и очередь заполнена"""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+        if self._slots.locked() and self.queued >= self.max_queue:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Сервер перегружен, повторите загрузку позже",
+                headers={"Retry-After": str(RETRY_AFTER)},
+            )
+
+    async def submit(self, fn: Callable, payload):
+        """
+        fn(payload) в пуле процессов, когда освободится процесс. Проверку
+        очереди (admit) вызывающий делает один раз на документ: части уже
+        принятого документа не отклоняются.
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+        self.queued += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.queued -= 1
+        try:
+            return await self._run_in_process(fn, payload)
+        finally:
+            self._slots.release()
+
+    async def _run_in_process(self, fn: Callable, payload):
+        self.running += 1
+        started = time.perf_counter()
+        pool = self._get_pool()
+        future = asyncio.wrap_future(
+            pool.submit(_call_in_process, fn, payload)
+        )
+        try:
+            result = await asyncio.wait_for(future, self.timeout)
+            self.completed += 1
+            return result
+        except ExtractionError as e:
+            self.failed += 1
+            raise HTTPException(status_code=e.status_code, detail=e.detail)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            log.warning(
+                f"Извлечение текста дольше {self.timeout:.0f}s, "
+                f"пул процессов перезапущен"
+            )
+            self._restart(pool)
+            raise HTTPException(
+                status_code=422,
+                detail="Документ обрабатывается слишком долго",
+            )
+        except BrokenProcessPool:
+            # Пул перезапущен из-за чужой зависшей задачи или процесс упал
+            self.failed += 1
+            self._restart(pool)
+            raise HTTPException(
+                status_code=503,
+                detail="Обработчик документов перезапущен, повторите загрузку",
+                headers={"Retry-After": str(RETRY_AFTER)},
+            )
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.running -= 1
+            self._busy_seconds += time.perf_counter() - started
+
+    def metrics(self) -> dict:
+        finished = self.completed + self.failed + self.timeouts
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "running": self.running,
+            "queued": self.queued,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "restarts": self.restarts,
+            "avg_seconds": self._busy_seconds / finished if finished else 0.0,
+        }
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+        self._threads.shutdown(wait=False, cancel_futures=True)
+
+
+class ExtractionError(Exception):
+    """HTTPException из процесса пула: сама она не восстанавливается из pickle"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(status_code, detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def _call_in_process(fn: Callable, payload):
+    try:
+        return fn(payload)
+    except HTTPException as e:
+        raise ExtractionError(e.status_code, e.detail) from None
+
+
+@asynccontextmanager
+async def transferable(source):
+    """
+    Содержимое потока загрузки в виде, который можно передать в процесс:
+    небольшой файл в памяти - bytes, сброшенный в именованный файл -
+    его путь (без копирования), в файл без имени - путь к копии
+    """
+    # SpooledTemporaryFile: BytesIO до сброса на диск, затем файл
+    inner = getattr(source, "_file", source)
+    if hasattr(inner, "getvalue"):
+        yield inner.getvalue()
+        return
+
+    # NamedSpooledTemporaryFile (src.app.ingest) сбрасывается в файл с
+    # именем: процесс пула открывает его сам, пока запрос держит файл
+    name = getattr(inner, "name", None)
+    if isinstance(name, str) and os.path.isfile(name):
+        await asyncio.to_thread(inner.flush)
+        yield name
+        return
+
+    with tempfile.NamedTemporaryFile(suffix=".upload") as tmp:
+        def copy():
+            source.seek(0)
+            shutil.copyfileobj(source, tmp, 1024 * 1024)
+            tmp.flush()
+
+        await asyncio.to_thread(copy)
+        yield tmp.name
@@ -1,14 +1,23 @@
-from src.app.services.processor import DocumentProcessor
+from src.app.services.executor import transferable
+from src.app.services.processor import DocumentProcessor, Payload, open_payload
 from fastapi import UploadFile, HTTPException
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
+import os
+from functools import partial
+from typing import AsyncIterator, Optional
+import pypdf
 from pypdf import PdfReader
-from io import BytesIO
+
+# Страниц в одной задаче пула: каждая задача заново читает xref,
+# поэтому слишком мелкие диапазоны не окупаются
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "16"))
 
 
 class PDFProcessor(DocumentProcessor):
     """Асинхронный обработчик PDF файлов"""
 
+    version = f"1+pypdf{pypdf.__version__}"
+
     def get_supported_types(self) -> list[str]:
         return ["application/pdf"]
 
@@ -22,29 +31,90 @@ class PDFProcessor(DocumentProcessor):
                 detail="Только PDF файлы разрешены",
             )
 
-    async def extract_text(self, file: UploadFile) -> str:
+    async def extract_text(
+        self,
+        file: UploadFile,
+        max_pages: Optional[int] = None,
+    ) -> str:
         """Асинхронное извлечение текста из PDF"""
-        await self.validate(file)
-
-        # Асинхронно читаем содержимое файла
-        content = await file.read()
+        pages = [text async for _, text in self.iter_pages(file, max_pages)]
+        text = "\n".join(pages)
+        return text.strip() if text else ""
 
-        # CPU-работа
-        loop = asyncio.get_event_loop()
-        with ThreadPoolExecutor() as executor:
-            text = await loop.run_in_executor(
-                executor, self._extract_text_sync, content
+    async def iter_pages(
+        self,
+        file: UploadFile,
+        max_pages: Optional[int] = None,
+    ) -> AsyncIterator[tuple[int, str]]:
+        """
+        Текст страниц по порядку, по мере готовности. Диапазоны страниц
+        разбираются параллельно в пуле процессов (не больше workers
+        диапазонов одного документа одновременно), первая страница
+        доступна, не дожидаясь разбора последней.
+        """
+        await self.validate(file)
+        executor = self.executor
+        # CPU-работа: разбор pypdf держит GIL, поэтому в отдельных процессах
+        executor.admit()
+        async with transferable(self.open_source(file)) as payload:
+            # Первый диапазон заодно сообщает число страниц
+            first_stop = PDF_PAGES_PER_TASK
+            if max_pages:
+                first_stop = min(first_stop, max_pages)
+            total, pages = await executor.submit(
+                partial(self._extract_pages_sync, start=0, stop=first_stop),
+                payload,
             )
+            for page in pages:
+                yield page
 
-        return text.strip() if text else ""
+            if max_pages:
+                total = min(total, max_pages)
+            ranges = [
+                (start, min(start + PDF_PAGES_PER_TASK, total))
+                for start in range(first_stop, total, PDF_PAGES_PER_TASK)
+            ]
+            pending: list[asyncio.Task] = []
+            try:
+                while ranges or pending:
+                    # Окно из workers задач: порядок страниц сохраняется,
+                    # а один документ не занимает очередь целиком
+                    while len(pending) < executor.workers and ranges:
+                        start, stop = ranges.pop(0)
+                        pending.append(asyncio.create_task(executor.submit(
+                            partial(
+                                self._extract_pages_sync,
+                                start=start,
+                                stop=stop,
+                            ),
+                            payload,
+                        )))
+                    _, pages = await pending.pop(0)
+                    for page in pages:
+                        yield page
+            finally:
+                for task in pending:
+                    task.cancel()
 
-    def _extract_text_sync(self, content: bytes) -> str:
-        """Синхронное извлечение текста (выполняется в отдельном потоке)"""
+    @staticmethod
+    def _extract_pages_sync(
+        payload: Payload,
+        start: int,
+        stop: int,
+    ) -> tuple[int, list[tuple[int, str]]]:
+        """
+        Синхронное извлечение текста страниц [start, stop) (выполняется
+        в отдельном процессе). Возвращает число страниц документа и
+        пары (номер страницы с 1, текст)
+        """
         try:
-            reader = PdfReader(BytesIO(content))
-            return "\n".join(
-                page.extract_text() or "" for page in reader.pages
-            )
+            with open_payload(payload) as source:
+                reader = PdfReader(source)
+                total = len(reader.pages)
+                return total, [
+                    (number + 1, reader.pages[number].extract_text() or "")
+                    for number in range(start, min(stop, total))
+                ]
         except Exception as e:
             raise HTTPException(
                 status_code=400,
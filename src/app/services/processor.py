@@ -1,11 +1,39 @@
 from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from io import BytesIO
+from typing import AsyncIterator, BinaryIO, Iterator, Optional, Union
 from fastapi import UploadFile, HTTPException
 
+from src.app.ingest import UPLOAD_MAX_BYTES
+
+# Что получает синхронная функция извлечения: bytes или путь к файлу
+# (пул процессов) либо сам поток загрузки (пул потоков)
+Payload = Union[bytes, str, BinaryIO]
+
+
+@contextmanager
+def open_payload(payload: Payload) -> Iterator[BinaryIO]:
+    """Seekable поток для любого вида Payload"""
+    if isinstance(payload, bytes):
+        yield BytesIO(payload)
+    elif isinstance(payload, str):
+        with open(payload, "rb") as f:
+            yield f
+    else:
+        payload.seek(0)
+        yield payload
+
 
 class DocumentProcessor(ABC):
     """Базовый класс для обработки документов"""
 
-    def __init__(self, max_size: int = 50 * 1024 * 1024):
+    # Версия извлечения: меняется вместе с результатом, входит в ключ
+    # кэша извлечённого текста
+    version = "1"
+
+    def __init__(self, executor, max_size: int = UPLOAD_MAX_BYTES):
+        # Общий ExtractionExecutor реестра обработчиков
+        self.executor = executor
         self.max_size = max_size
 
     async def validate(self, file: UploadFile) -> None:
@@ -16,11 +44,38 @@ class DocumentProcessor(ABC):
                 detail=f"Файл слишком большой (max {self.max_size//1024//1024}MB)",
             )
 
+    @staticmethod
+    def open_source(file: UploadFile) -> BinaryIO:
+        """
+        Seekable поток загруженного файла без копирования в bytes:
+        небольшие файлы лежат в памяти, крупные - во временном файле
+        """
+        file.file.seek(0)
+        return file.file
+
     @abstractmethod     # реализация обязательна
-    async def extract_text(self, file: UploadFile) -> str:
-        """Извлечение текста из файла"""
+    async def extract_text(
+        self,
+        file: UploadFile,
+        max_pages: Optional[int] = None,
+    ) -> str:
+        """
+        Извлечение текста из файла. max_pages - только первые страницы
+        (для быстрого предпросмотра), форматы без страниц его игнорируют
+        """
         pass
 
+    async def iter_pages(
+        self,
+        file: UploadFile,
+        max_pages: Optional[int] = None,
+    ) -> AsyncIterator[tuple[int, str]]:
+        """
+        Текст по страницам (номер с 1) по мере извлечения. Форматы без
+        страниц отдают весь текст одной страницей
+        """
+        yield 1, await self.extract_text(file, max_pages)
+
     @abstractmethod
     def get_supported_types(self) -> list[str]:
         """Поддерживаемые MIME типы"""
@@ -1,7 +1,7 @@
 from src.app.services.processor import DocumentProcessor
 from fastapi import UploadFile, HTTPException
-import asyncio
-from concurrent.futures import ThreadPoolExecutor
+import mmap
+from typing import BinaryIO, Optional
 
 
 class TXTProcessor(DocumentProcessor):
@@ -20,33 +20,48 @@ class TXTProcessor(DocumentProcessor):
                 detail="Только TXT/Markdown файлы разрешены",
             )
 
-    async def extract_text(self, file: UploadFile) -> str:
+    async def extract_text(
+        self,
+        file: UploadFile,
+        max_pages: Optional[int] = None,
+    ) -> str:
         """Извлечение текста из TXT файла"""
         await self.validate(file)
 
-        # Читаем содержимое файла напрямую (без CPU-интенсивных операций)
-        content = await file.read()
-
-        # Декодируем в строку в отдельном потоке (на случай больших файлов)
-        loop = asyncio.get_event_loop()
-        with ThreadPoolExecutor() as executor:
-            text = await loop.run_in_executor(
-                executor, self._decode_content, content
-            )
+        # Декодируем в строку в общем пуле потоков (на случай больших
+        # файлов): декодирование в C отпускает GIL, процесс не нужен
+        text = await self.executor.run(
+            self._decode_source, self.open_source(file), cpu_bound=False
+        )
 
         return text.strip()
 
-    def _decode_content(self, content: bytes) -> str:
+    def _decode_source(self, source: BinaryIO) -> str:
+        """
+        Декодирование без промежуточной копии в bytes: файл на диске
+        отображается в память (mmap), файл в памяти читается через его буфер
+        """
+        # SpooledTemporaryFile: BytesIO до сброса на диск, затем файл
+        inner = getattr(source, "_file", source)
+        if hasattr(inner, "getbuffer"):
+            with inner.getbuffer() as content:
+                return self._decode_content(content)
+        if inner.seek(0, 2) == 0:  # пустой файл нельзя отобразить
+            return ""
+        with mmap.mmap(inner.fileno(), 0, access=mmap.ACCESS_READ) as content:
+            return self._decode_content(content)
+
+    def _decode_content(self, content) -> str:
         """Декодирование байтов в строку"""
         try:
             # Пробуем разные кодировки
             for encoding in ['utf-8', 'windows-1251', 'cp866']:
                 try:
-                    return content.decode(encoding)
+                    return str(content, encoding)
                 except UnicodeDecodeError:
                     continue
             # Если ничего не подошло, используем utf-8 с игнорированием ошибок
-            return content.decode('utf-8', errors='ignore')
+            return str(content, 'utf-8', errors='ignore')
         except Exception as e:
             raise HTTPException(
                 status_code=400,
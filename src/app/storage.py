@@ -0,0 +1,390 @@
+import asyncio
+import os
+import time
+from datetime import datetime
+from typing import Optional
+
+from src.app.compression import compress_text, decompress_text
+from src.app.schemas import DocumentDTO, DocumentStatus
+from src.app.streaming import token_stream_key
+from src.logger import log
+
+# Вторичные индексы документов. Все индексы - sorted set с нулевым score
+# и членами вида "<created_at>|<document_id>": лексикографический порядок
+# совпадает с хронологическим, а последний член страницы служит курсором.
+CREATED_INDEX = "docs:by_created"
+STATUS_INDEX_PREFIX = "docs:status:"
+# Когда документ нужно удалить: score - unix time, член - id документа.
+# Удалением занимается src.app.lifecycle.RetentionSweeper
+EXPIRY_INDEX = "docs:expiry"
+
+# Срок хранения документа в каждом статусе, сек (0 - бессрочно).
+# Отсчитывается от последней смены статуса
+RETENTION = {
+    DocumentStatus.uploaded: int(os.getenv("RETENTION_UPLOADED", "86400")),
+    DocumentStatus.processing: int(os.getenv("RETENTION_PROCESSING", "0")),
+    DocumentStatus.done: int(os.getenv("RETENTION_DONE", "604800")),
+    DocumentStatus.error: int(os.getenv("RETENTION_ERROR", "86400")),
+}
+
+# Атомарная смена статуса с переносом между индексами статусов.
+# KEYS[1] - hash документа; ARGV: префикс индекса, id, новый статус,
+# ожидаемый текущий статус (пусто - любой), индекс сроков, срок удаления
+# (пусто - бессрочно), далее пары поле/значение
+TRANSITION_SCRIPT = """
+local current = redis.call('HMGET', KEYS[1], 'status', 'created_at')
+if not current[2] then
+    return 0
+end
+if ARGV[4] ~= '' and current[1] ~= ARGV[4] then
+    return -1
+end
+local member = current[2] .. '|' .. ARGV[2]
+if current[1] and current[1] ~= ARGV[3] then
+    redis.call('ZREM', ARGV[1] .. current[1], member)
+end
+redis.call('ZADD', ARGV[1] .. ARGV[3], 0, member)
+if ARGV[6] ~= '' then
+    redis.call('ZADD', ARGV[5], ARGV[6], ARGV[2])
+else
+    redis.call('ZREM', ARGV[5], ARGV[2])
+end
+redis.call('HSET', KEYS[1], 'status', ARGV[3], unpack(ARGV, 7))
+return 1
+"""
+
+# Обновление полей документа, только если он ещё существует (не создаёт
+# обрывок hash у удалённого документа). KEYS[1] - hash документа;
+# ARGV - пары поле/значение
+UPDATE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+redis.call('HSET', KEYS[1], unpack(ARGV))
+return 1
+"""
+
+# Удаление документа из выдачи: индексы и метаданные сразу, текст
+# освобождает sweeper (срок удаления 0).
+# KEYS[1] - hash документа; ARGV: префикс индекса статусов, индекс по
+# дате создания, индекс сроков, id
+DETACH_SCRIPT = """
+local current = redis.call('HMGET', KEYS[1], 'status', 'created_at')
+if not current[2] then
+    return 0
+end
+local member = current[2] .. '|' .. ARGV[4]
+redis.call('ZREM', ARGV[2], member)
+if current[1] then
+    redis.call('ZREM', ARGV[1] .. current[1], member)
+end
+redis.call('UNLINK', KEYS[1])
+redis.call('ZADD', ARGV[3], 0, ARGV[4])
+return 1
+"""
+
+# Освобождение всех ключей пачки документов, у которых срок всё ещё истёк
+# (мог быть продлён сменой статуса после выборки).
+# KEYS: по три ключа на документ - hash, текст, стрим токенов;
+# ARGV: префикс индекса статусов, индекс по дате создания, индекс сроков,
+# текущее время, далее id документов. Возвращает 1/0 на каждый документ
+RECLAIM_SCRIPT = """
+local result = {}
+for i = 5, #ARGV do
+    local id = ARGV[i]
+    local base = (i - 5) * 3
+    local deadline = redis.call('ZSCORE', ARGV[3], id)
+    if deadline and tonumber(deadline) <= tonumber(ARGV[4]) then
+        local current = redis.call(
+            'HMGET', KEYS[base + 1], 'status', 'created_at'
+        )
+        if current[2] then
+            local member = current[2] .. '|' .. id
+            redis.call('ZREM', ARGV[2], member)
+            if current[1] then
+                redis.call('ZREM', ARGV[1] .. current[1], member)
+            end
+        end
+        redis.call('UNLINK', KEYS[base + 1], KEYS[base + 2], KEYS[base + 3])
+        redis.call('ZREM', ARGV[3], id)
+        result[#result + 1] = 1
+    else
+        result[#result + 1] = 0
+    end
+end
+return result
+"""
+
+
+def now_iso() -> str:
+    """Текущее время в формате полей created_at/updated_at"""
+    return datetime.utcnow().isoformat(timespec="microseconds")
+
+
+def expiry_deadline(status: DocumentStatus) -> Optional[float]:
+    """Момент удаления документа, только что перешедшего в status"""
+    retention = RETENTION.get(status, 0)
+    return time.time() + retention if retention > 0 else None
+
+
+def status_index(status: str) -> str:
+    return f"{STATUS_INDEX_PREFIX}{status}"
+
+
+def index_member(doc: DocumentDTO) -> str:
+    return f"{doc.to_redis()['created_at']}|{doc.document_id}"
+
+
+class DocumentStore:
+    """
+    Хранение документов в Redis с поддержкой вторичных индексов.
+    Метаданные лежат в hash doc:<id>, сжатый текст - в отдельном ключе
+    doc:<id>:text, поэтому смена статуса не гоняет текст по сети.
+    """
+
+    def __init__(self, redis_client, raw_client):
+        # raw_client - соединение без decode_responses для сжатых данных
+        self.redis = redis_client
+        self.raw = raw_client
+        self._transition = redis_client.register_script(TRANSITION_SCRIPT)
+        self._update = redis_client.register_script(UPDATE_SCRIPT)
+        self._detach = redis_client.register_script(DETACH_SCRIPT)
+        self._reclaim = redis_client.register_script(RECLAIM_SCRIPT)
+
+    @staticmethod
+    def key(document_id: str) -> str:
+        return f"doc:{document_id}"
+
+    @staticmethod
+    def text_key(document_id: str) -> str:
+        return f"doc:{document_id}:text"
+
+    async def create(self, doc: DocumentDTO) -> None:
+        """Запись документа вместе с индексами одной транзакцией"""
+        # Сначала текст: метаданные не должны ссылаться на пустоту
+        blob = await asyncio.to_thread(compress_text, doc.text)
+        await self.raw.set(self.text_key(doc.document_id), blob)
+        member = index_member(doc)
+        status = DocumentStatus(doc.status)
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.hset(self.key(doc.document_id), mapping=doc.to_redis())
+        pipe.zadd(CREATED_INDEX, {member: 0})
+        pipe.zadd(status_index(status.value), {member: 0})
+        deadline = expiry_deadline(status)
+        if deadline:
+            pipe.zadd(EXPIRY_INDEX, {doc.document_id: deadline})
+        await pipe.execute()
+
+    async def create_many(self, docs: list[DocumentDTO]) -> None:
+        """
+        Запись пачки документов с индексами одной транзакцией.
+        Всё идёт через raw-соединение, чтобы тексты и метаданные попали
+        в один MULTI
+        """
+        if not docs:
+            return
+        blobs = await asyncio.to_thread(
+            lambda: [compress_text(doc.text) for doc in docs]
+        )
+        pipe = self.raw.pipeline(transaction=True)
+        for doc, blob in zip(docs, blobs):
+            member = index_member(doc)
+            status = DocumentStatus(doc.status)
+            pipe.set(self.text_key(doc.document_id), blob)
+            pipe.hset(self.key(doc.document_id), mapping=doc.to_redis())
+            pipe.zadd(CREATED_INDEX, {member: 0})
+            pipe.zadd(status_index(status.value), {member: 0})
+            deadline = expiry_deadline(status)
+            if deadline:
+                pipe.zadd(EXPIRY_INDEX, {doc.document_id: deadline})
+        await pipe.execute()
+
+    async def get(
+        self,
+        document_id: str,
+        with_text: bool = False,
+    ) -> Optional[DocumentDTO]:
+        """Метаданные документа; текст читается только по with_text"""
+        raw = await self.redis.hgetall(self.key(document_id))
+        if not raw:
+            return None
+        doc = DocumentDTO.from_redis(document_id, raw)
+        if with_text:
+            doc.text = await self.get_text(document_id) or ""
+        return doc
+
+    async def get_text(self, document_id: str) -> Optional[str]:
+        blob = await self.raw.get(self.text_key(document_id))
+        if blob is not None:
+            return decompress_text(blob)
+        # Документы, записанные до выноса текста из hash
+        return await self.redis.hget(self.key(document_id), "text")
+
+    async def transition(
+        self,
+        document_id: str,
+        status: DocumentStatus,
+        expected: Optional[DocumentStatus] = None,
+        **fields,
+    ) -> bool:
+        """
+        Смена статуса (и дополнительных полей) с обновлением индексов.
+        Возвращает False, если документа нет или его статус не expected.
+        """
+        args = [
+            STATUS_INDEX_PREFIX,
+            document_id,
+            status.value,
+            expected.value if expected else "",
+            EXPIRY_INDEX,
+            expiry_deadline(status) or "",
+        ]
+        for field, value in fields.items():
+            args.extend([field, value])
+        result = await self._transition(
+            keys=[self.key(document_id)], args=args
+        )
+        return result == 1
+
+    async def update(self, document_id: str, **fields) -> bool:
+        """Обновляет поля без смены статуса; False, если документа нет"""
+        args = []
+        for field, value in fields.items():
+            args.extend([field, value])
+        result = await self._update(keys=[self.key(document_id)], args=args)
+        return result == 1
+
+    async def delete(self, document_id: str) -> bool:
+        """
+        Убирает документ из выдачи сразу; текст и прочие ключи
+        освобождает RetentionSweeper в фоне
+        """
+        result = await self._detach(
+            keys=[self.key(document_id)],
+            args=[
+                STATUS_INDEX_PREFIX,
+                CREATED_INDEX,
+                EXPIRY_INDEX,
+                document_id,
+            ],
+        )
+        return result == 1
+
+    async def due_for_reclaim(self, limit: int) -> list[str]:
+        """id документов с истёкшим сроком хранения"""
+        return await self.redis.zrangebyscore(
+            EXPIRY_INDEX, "-inf", time.time(), start=0, num=limit
+        )
+
+    async def reclaim(self, document_ids: list[str]) -> tuple[list[str], int]:
+        """
+        Освобождает ключи пачки документов. Возвращает реально удалённые
+        id и оценку освобождённой памяти в байтах (MEMORY USAGE)
+        """
+        pipe = self.redis.pipeline(transaction=False)
+        for document_id in document_ids:
+            pipe.memory_usage(self.key(document_id))
+            pipe.memory_usage(self.text_key(document_id))
+        sizes = [
+            size if isinstance(size, int) else 0
+            for size in await pipe.execute(raise_on_error=False)
+        ]
+
+        keys = []
+        for document_id in document_ids:
+            keys.extend([
+                self.key(document_id),
+                self.text_key(document_id),
+                token_stream_key(document_id),
+            ])
+        results = await self._reclaim(
+            keys=keys,
+            args=[
+                STATUS_INDEX_PREFIX,
+                CREATED_INDEX,
+                EXPIRY_INDEX,
+                time.time(),
+                *document_ids,
+            ],
+        )
+        reclaimed, freed = [], 0
+        for i, (document_id, result) in enumerate(zip(document_ids, results)):
+            if result == 1:
+                reclaimed.append(document_id)
+                freed += sizes[2 * i] + sizes[2 * i + 1]
+        return reclaimed, freed
+
+    async def list(
+        self,
+        status: Optional[DocumentStatus] = None,
+        cursor: Optional[str] = None,
+        limit: int = 50,
+    ) -> tuple[list[dict], Optional[str]]:
+        """
+        Страница документов от новых к старым. cursor - значение
+        next_cursor предыдущей страницы.
+        """
+        index = status_index(status.value) if status else CREATED_INDEX
+        members = await self.redis.zrevrangebylex(
+            index,
+            max=f"({cursor}" if cursor else "+",
+            min="-",
+            start=0,
+            num=limit,
+        )
+        if not members:
+            return [], None
+
+        ids = [member.rsplit("|", 1)[1] for member in members]
+        pipe = self.redis.pipeline(transaction=False)
+        for document_id in ids:
+            pipe.hmget(
+                self.key(document_id),
+                ["status", "created_at", "preview_pages"],
+            )
+        rows = await pipe.execute()
+
+        documents = [
+            {
+                "document_id": document_id,
+                "status": doc_status,
+                "created_at": created_at,
+                # Summary построено по первым страницам, а не по всему PDF
+                "preview_pages": int(preview_pages) if preview_pages else None,
+            }
+            for document_id, (doc_status, created_at, preview_pages)
+            in zip(ids, rows)
+            if doc_status is not None
+        ]
+        next_cursor = members[-1] if len(members) == limit else None
+        return documents, next_cursor
+
+    async def rebuild_indexes(self) -> int:
+        """
+        Однократное построение индексов по уже существующим документам
+        (данные, записанные до появления индексов)
+        """
+        count = 0
+        pipe = self.redis.pipeline(transaction=False)
+        async for key in self.redis.scan_iter("doc:*", count=1000):
+            if key.count(":") != 1:
+                continue
+            doc_status, created_at = await self.redis.hmget(
+                key, ["status", "created_at"]
+            )
+            if not doc_status or not created_at:
+                continue
+            doc = DocumentDTO.from_redis(
+                key.split(":", 1)[1],
+                {"status": doc_status, "created_at": created_at,
+                 "updated_at": created_at},
+            )
+            member = index_member(doc)
+            # created_at приводим к формату, из которого строятся члены
+            pipe.hset(key, "created_at", doc.to_redis()["created_at"])
+            pipe.zadd(CREATED_INDEX, {member: 0})
+            pipe.zadd(status_index(doc.status.value), {member: 0})
+            count += 1
+        await pipe.execute()
+        log.info(f"Индексы документов перестроены: {count}")
+        return count
@@ -0,0 +1,123 @@
+import asyncio
+import json
+import os
+from typing import AsyncIterator
+
+from src.logger import log
+
+# Сколько живёт стрим токенов после завершения генерации
+TOKEN_STREAM_TTL = int(os.getenv("TOKEN_STREAM_TTL", "3600"))
+# Сколько мс SSE-обработчик ждёт новых токенов перед проверкой статуса
+SSE_BLOCK_MS = int(os.getenv("SSE_BLOCK_MS", "15000"))
+
+
+def token_stream_key(document_id: str) -> str:
+    return f"tokens:{document_id}"
+
+
+class TokenRelay:
+    """
+    Передаёт фрагменты текста из потока генерации в Redis Stream,
+    откуда их читает API-процесс. Фрагменты, накопившиеся за время
+    одной записи, отправляются одним XADD.
+    """
+
+    def __init__(self, redis_client, document_id: str):
+        self.redis = redis_client
+        self.key = token_stream_key(document_id)
+        self._loop = asyncio.get_running_loop()
+        self._queue: asyncio.Queue[str | None] = asyncio.Queue()
+        self._task: asyncio.Task | None = None
+
+    async def __aenter__(self):
+        # Стрим мог остаться от предыдущей попытки
+        await self.redis.delete(self.key)
+        self._task = asyncio.create_task(self._pump())
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._queue.put_nowait(None)
+        await self._task
+        # reset - попытка упала, клиент сбрасывает текст и ждёт повтора
+        await self.redis.xadd(
+            self.key, {"event": "reset" if exc_type else "done"}
+        )
+        await self.redis.expire(self.key, TOKEN_STREAM_TTL)
+
+    def __call__(self, chunk: str) -> None:
+        """Колбэк для потока генерации (потокобезопасный)"""
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, chunk)
+
+    async def _pump(self):
+        while True:
+            chunk = await self._queue.get()
+            finished = chunk is None
+            chunks = [] if finished else [chunk]
+            while not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is None:
+                    finished = True
+                    break
+                chunks.append(item)
+            if chunks:
+                try:
+                    await self.redis.xadd(self.key, {"token": "".join(chunks)})
+                except Exception as e:
+                    log.warning(f"Не удалось отправить токены {self.key}: {e}")
+            if finished:
+                return
+
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def stream_tokens(
+    redis_client,
+    document_id: str,
+    request,
+) -> AsyncIterator[str]:
+    """
+    SSE-поток токенов документа. Читает Redis Stream с начала, поэтому
+    клиент, подключившийся посреди генерации, получит весь текст.
+    """
+    doc_key = f"doc:{document_id}"
+    key = token_stream_key(document_id)
+    last_id = "0"
+    check_status = True
+    while not await request.is_disconnected():
+        if check_status:
+            status, result = await redis_client.hmget(
+                doc_key, ["status", "result"]
+            )
+            if status is None:
+                yield sse_event("error", {"detail": "Документ не найден"})
+                return
+            if status == "error":
+                yield sse_event("error", {"document_id": document_id})
+                return
+            if status == "done" and not await redis_client.exists(key):
+                # Готово без стрима (например, ответ из кэша)
+                yield sse_event("token", {"text": result or ""})
+                yield sse_event("done", {"document_id": document_id})
+                return
+
+        response = await redis_client.xread(
+            {key: last_id}, block=SSE_BLOCK_MS, count=100
+        )
+        # Без новых токенов перепроверяем статус документа
+        check_status = not response
+        if not response:
+            yield ": keep-alive\n\n"
+            continue
+
+        for _, messages in response:
+            for entry_id, fields in messages:
+                last_id = entry_id
+                if "token" in fields:
+                    yield sse_event("token", {"text": fields["token"]})
+                    continue
+                event = fields.get("event", "done")
+                yield sse_event(event, {"document_id": document_id})
+                if event != "reset":
+                    return
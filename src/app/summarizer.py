@@ -0,0 +1,211 @@
+import asyncio
+import hashlib
+import os
+from typing import List, Optional
+
+from src.app import tracing
+from src.app.generation_config import (
+    MAX_INPUT_TOKENS,
+    SUMMARY_PROMPT,
+    TokenCallback,
+)
+from src.logger import log
+
+# Размер чанка и перекрытие соседних чанков в токенах
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "1536"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "128"))
+# Сколько частичных summary сводим в одно на шаге reduce
+REDUCE_FAN_OUT = int(os.getenv("REDUCE_FAN_OUT", "8"))
+# Ожидаемая глубина дерева: map по чанкам + уровни reduce (не меньше 2).
+# Ограничение мягкое: при превышении сводим дальше с предупреждением
+REDUCE_MAX_DEPTH = int(os.getenv("REDUCE_MAX_DEPTH", "3"))
+# Время жизни кэша summary чанков
+CHUNK_CACHE_TTL = int(os.getenv("CHUNK_CACHE_TTL", str(7 * 24 * 3600)))
+
+
+def split_into_chunks(
+    tokenizer,
+    text: str,
+    chunk_tokens: int = CHUNK_TOKENS,
+    overlap: int = CHUNK_OVERLAP,
+) -> List[str]:
+    """
+    Делит текст на перекрывающиеся чанки по chunk_tokens токенов.
+    Границы берутся из offset mapping, поэтому чанки - точные подстроки
+    исходного текста.
+    """
+    encoded = tokenizer(
+        text,
+        add_special_tokens=False,
+        return_offsets_mapping=True,
+    )
+    offsets = encoded["offset_mapping"]
+    if len(offsets) <= chunk_tokens:
+        return [text]
+
+    step = max(1, chunk_tokens - overlap)
+    chunks = []
+    for start in range(0, len(offsets), step):
+        end = min(start + chunk_tokens, len(offsets))
+        chunks.append(text[offsets[start][0]:offsets[end - 1][1]])
+        if end == len(offsets):
+            break
+    return chunks
+
+
+class HierarchicalSummarizer:
+    """
+    Map-reduce суммаризация документов длиннее контекста модели:
+    чанки суммаризируются пачкой, затем частичные summary сводятся
+    группами по fan_out, пока не останется одно.
+    Summary каждого узла кэшируется в Redis по хэшу содержимого.
+    """
+
+    def __init__(
+        self,
+        manager,
+        scheduler,
+        redis_client=None,
+        chunk_tokens: int = CHUNK_TOKENS,
+        overlap: int = CHUNK_OVERLAP,
+        fan_out: int = REDUCE_FAN_OUT,
+        max_depth: int = REDUCE_MAX_DEPTH,
+    ):
+        self.manager = manager
+        self.scheduler = scheduler
+        self.redis = redis_client
+        self.overlap = overlap
+        self.fan_out = max(2, fan_out)
+        self.max_depth = max(2, max_depth)
+        self._chunk_tokens = chunk_tokens
+
+    @property
+    def chunk_tokens(self) -> int:
+        """Размер чанка с учётом токенов самого промпта"""
+        prompt_tokens = len(
+            self.manager.tokenizer(
+                SUMMARY_PROMPT.format(text=""),
+                add_special_tokens=True,
+            )["input_ids"]
+        )
+        return min(self._chunk_tokens, MAX_INPUT_TOKENS - prompt_tokens)
+
+    def _cache_key(self, text: str) -> str:
+        digest = hashlib.sha256(
+            f"{self.manager.model_name}\0{SUMMARY_PROMPT}\0{text}".encode()
+        ).hexdigest()
+        return f"chunk_summary:{digest}"
+
+    async def summarize(
+        self,
+        text: str,
+        on_token: Optional[TokenCallback] = None,
+        decoding: Optional[str] = None,
+    ) -> str:
+        """
+        Итоговое summary документа. on_token получает фрагменты только
+        финального шага - именно его текст увидит пользователь.
+        decoding - режим декодирования для всех вызовов модели.
+        """
+        if not self.manager.is_loaded:
+            await asyncio.to_thread(self.manager.load_model)
+
+        chunks = await asyncio.to_thread(
+            split_into_chunks,
+            self.manager.tokenizer,
+            text,
+            self.chunk_tokens,
+            self.overlap,
+        )
+        with tracing.span("summarize.map", chunks=len(chunks)):
+            summaries = await self._summarize_many(
+                chunks, on_token if len(chunks) == 1 else None, decoding
+            )
+
+        depth = 1
+        while len(summaries) > 1:
+            if depth == self.max_depth:
+                # Ограничение глубины мягкое: превышать контекст модели
+                # хуже, чем добавить ещё уровень reduce
+                log.warning(
+                    f"Превышена глубина {self.max_depth}, осталось "
+                    f"{len(summaries)} summary - продолжаем сводить группами"
+                )
+            groups = await asyncio.to_thread(self._reduce_groups, summaries)
+            with tracing.span(
+                "summarize.reduce", level=depth, inputs=len(summaries)
+            ):
+                summaries = await self._summarize_many(
+                    ["\n\n".join(group) for group in groups],
+                    on_token if len(groups) == 1 else None,
+                    decoding,
+                )
+            depth += 1
+
+        log.info(f"Документ: {len(chunks)} чанков, глубина {depth}")
+        return summaries[0]
+
+    def _reduce_groups(self, summaries: List[str]) -> List[List[str]]:
+        """
+        Группы для шага reduce: не больше fan_out summary и не больше
+        chunk_tokens токенов в группе, чтобы промпт влезал в контекст.
+        В группе минимум два summary - иначе свёртка не сходится.
+        """
+        budget = self.chunk_tokens
+        lengths = self.manager.count_tokens(summaries, prompt="{text}")
+        groups: List[List[str]] = []
+        group: List[str] = []
+        used = 0
+        for summary, length in zip(summaries, lengths):
+            if len(group) >= 2 and (
+                len(group) >= self.fan_out or used + length > budget
+            ):
+                groups.append(group)
+                group, used = [], 0
+            group.append(summary)
+            used += length
+        if group:
+            groups.append(group)
+        return groups
+
+    async def _summarize_many(
+        self,
+        texts: List[str],
+        on_token: Optional[TokenCallback] = None,
+        decoding: Optional[str] = None,
+    ) -> List[str]:
+        """Суммаризация пачкой с пропуском закэшированных текстов"""
+        keys = [self._cache_key(text) for text in texts]
+        if self.redis:
+            cached = await self.redis.mget(keys)
+        else:
+            cached = [None] * len(texts)
+
+        missing = [i for i, value in enumerate(cached) if value is None]
+        if missing:
+            # Все чанки уходят в планировщик сразу и попадают в общие пачки
+            computed = await asyncio.gather(*(
+                asyncio.wrap_future(
+                    self.scheduler.submit(
+                        texts[i], on_token=on_token, decoding=decoding
+                    )
+                )
+                for i in missing
+            ))
+            if self.redis:
+                pipe = self.redis.pipeline(transaction=False)
+                for i, summary in zip(missing, computed):
+                    pipe.set(keys[i], summary, ex=CHUNK_CACHE_TTL)
+                await pipe.execute()
+            for i, summary in zip(missing, computed):
+                cached[i] = summary
+        elif on_token:
+            # Из кэша - отдаём текст целиком одним фрагментом
+            on_token(cached[0])
+
+        if len(texts) > 1:
+            log.info(
+                f"Summary чанков: {len(texts) - len(missing)} из кэша, "
+                f"{len(missing)} сгенерировано"
+            )
+        return list(cached)
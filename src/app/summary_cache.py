@@ -0,0 +1,184 @@
+import hashlib
+import json
+import os
+import time
+from typing import Optional
+
+from src.app.generation_config import (
+    GENERATION_KWARGS,
+    MAX_INPUT_TOKENS,
+    SUMMARY_PROMPT,
+)
+from src.app.summarizer import (
+    CHUNK_OVERLAP,
+    CHUNK_TOKENS,
+    REDUCE_FAN_OUT,
+    REDUCE_MAX_DEPTH,
+)
+from src.logger import log
+
+SUMMARY_CACHE_TTL = int(os.getenv("SUMMARY_CACHE_TTL", str(30 * 24 * 3600)))
+# Сколько summary храним; сверх лимита вытесняются давно не читанные (LRU)
+SUMMARY_CACHE_MAX_ENTRIES = int(os.getenv("SUMMARY_CACHE_MAX_ENTRIES", "10000"))
+
+LRU_KEY = "summary_cache:lru"
+STATS_KEY = "summary_cache:stats"
+# Отпечаток, с которым пишет воркер; API читает его, а не считает сам
+FINGERPRINT_KEY = "summary_cache:fingerprint"
+# Как часто API перечитывает опубликованный отпечаток, секунд
+FINGERPRINT_REFRESH = float(os.getenv("SUMMARY_FINGERPRINT_REFRESH", "5"))
+
+
+def normalize_text(text: str) -> str:
+    """Нормализация перед хэшированием: пробелы и переносы не важны"""
+    return " ".join(text.split())
+
+
+def content_hash(text: str) -> str:
+    """Хэш нормализованного текста документа"""
+    return hashlib.sha256(normalize_text(text).encode()).hexdigest()
+
+
+def generation_params() -> dict:
+    """Параметры генерации этого процесса (модельный сервер отдаёт их в health)"""
+    return {
+        "prompt": SUMMARY_PROMPT,
+        "generation": GENERATION_KWARGS,
+        "max_input_tokens": MAX_INPUT_TOKENS,
+    }
+
+
+def generation_fingerprint(
+    model_name: str,
+    max_new_tokens: int = 150,
+    generation: Optional[dict] = None,
+) -> str:
+    """
+    Отпечаток всего, что влияет на результат: модель, промпт и параметры
+    генерации/разбиения. Смена любого из них даёт новое пространство
+    ключей, старые записи уходят по TTL и LRU.
+    generation - параметры процесса, который генерирует (по умолчанию свои).
+    """
+    params = {
+        "model": model_name,
+        **(generation or generation_params()),
+        "max_new_tokens": max_new_tokens,
+        "chunks": [CHUNK_TOKENS, CHUNK_OVERLAP, REDUCE_FAN_OUT,
+                   REDUCE_MAX_DEPTH],
+    }
+    raw = json.dumps(params, sort_keys=True).encode()
+    return hashlib.sha256(raw).hexdigest()[:16]
+
+
+class SummaryCache:
+    """
+    Кэш готовых summary по хэшу содержимого документа.
+    Отпечаток генерации знает только воркер: он создаёт кэш с model_name
+    и публикует отпечаток (publish). API создаёт кэш без model_name и
+    берёт опубликованный - иначе разные env процессов дают разные ключи.
+    """
+
+    def __init__(
+        self,
+        redis_client,
+        model_name: Optional[str] = None,
+        max_new_tokens: int = 150,
+        ttl: int = SUMMARY_CACHE_TTL,
+        max_entries: int = SUMMARY_CACHE_MAX_ENTRIES,
+        generation: Optional[dict] = None,
+    ):
+        self.redis = redis_client
+        self.fingerprint: Optional[str] = None
+        if model_name is not None:
+            self.fingerprint = generation_fingerprint(
+                model_name, max_new_tokens, generation
+            )
+        self._follow = model_name is None
+        self._fetched_at = 0.0
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+    async def publish(self) -> None:
+        """Объявляет отпечаток воркера читателям кэша"""
+        await self.redis.set(FINGERPRINT_KEY, self.fingerprint)
+
+    async def _current(self) -> Optional[str]:
+        """Отпечаток для ключей: свой или опубликованный воркером"""
+        if self._follow and (
+            time.monotonic() - self._fetched_at >= FINGERPRINT_REFRESH
+        ):
+            self.fingerprint = await self.redis.get(FINGERPRINT_KEY)
+            self._fetched_at = time.monotonic()
+        return self.fingerprint
+
+    def _key(self, text_hash: str, fingerprint: str) -> str:
+        return f"summary_cache:{fingerprint}:{text_hash}"
+
+    async def get(self, text_hash: str) -> Optional[str]:
+        fingerprint = await self._current()
+        if fingerprint is None:
+            # Воркер ещё не запускался - кэш пуст
+            await self.redis.hincrby(STATS_KEY, "misses", 1)
+            return None
+        key = self._key(text_hash, fingerprint)
+        summary = await self.redis.get(key)
+        pipe = self.redis.pipeline(transaction=False)
+        if summary is None:
+            pipe.hincrby(STATS_KEY, "misses", 1)
+        else:
+            pipe.hincrby(STATS_KEY, "hits", 1)
+            pipe.zadd(LRU_KEY, {key: time.time()})
+            pipe.expire(key, self.ttl)
+        await pipe.execute()
+        return summary
+
+    async def set(self, text_hash: str, summary: str) -> None:
+        fingerprint = await self._current()
+        if fingerprint is None:
+            return
+        key = self._key(text_hash, fingerprint)
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.set(key, summary, ex=self.ttl)
+        pipe.zadd(LRU_KEY, {key: time.time()})
+        pipe.zcard(LRU_KEY)
+        *_, size = await pipe.execute()
+        if size > self.max_entries:
+            await self._evict(size - self.max_entries)
+
+    async def _evict(self, count: int) -> None:
+        """Вытесняет count давно не читанных записей"""
+        popped = await self.redis.zpopmin(LRU_KEY, count)
+        keys = [key for key, _ in popped]
+        if not keys:
+            return
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.delete(*keys)
+        pipe.hincrby(STATS_KEY, "evictions", len(keys))
+        await pipe.execute()
+
+    async def invalidate(self) -> int:
+        """
+        Полная очистка кэша, например после замены модели или промпта
+        без изменения их идентификаторов (дообучение весов).
+        """
+        removed = 0
+        while True:
+            popped = await self.redis.zpopmin(LRU_KEY, 500)
+            if not popped:
+                break
+            removed += await self.redis.delete(*(key for key, _ in popped))
+        log.info(f"Кэш summary очищен: {removed} записей")
+        return removed
+
+    async def stats(self) -> dict:
+        raw = await self.redis.hgetall(STATS_KEY)
+        hits = int(raw.get("hits", 0))
+        misses = int(raw.get("misses", 0))
+        return {
+            "fingerprint": await self._current(),
+            "entries": await self.redis.zcard(LRU_KEY),
+            "hits": hits,
+            "misses": misses,
+            "evictions": int(raw.get("evictions", 0)),
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+        }
@@ -0,0 +1,112 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from src.app.metrics import METRICS_INSTANCE
+
+# Трассировка по документу: спаны (имя, начало, длительность, процесс)
+# складываются в trace:<document_id> и читаются GET /trace/{document_id}.
+# Выключена по умолчанию; выключенная не обращается к Redis вовсе
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "").lower() in ("1", "true", "yes")
+TRACE_TTL = int(os.getenv("TRACE_TTL", str(24 * 3600)))
+# Спанов на документ (старые обрезаются) и в буфере процесса до сброса
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", "200"))
+TRACE_BUFFER = int(os.getenv("TRACE_BUFFER", "10000"))
+
+# Документ, к которому относятся спаны текущей задачи; наследуется
+# дочерними asyncio-задачами
+current_document: ContextVar[Optional[str]] = ContextVar(
+    "trace_document", default=None
+)
+
+_buffer: deque = deque(maxlen=TRACE_BUFFER)
+_lock = threading.Lock()
+
+
+def trace_key(document_id: str) -> str:
+    return f"trace:{document_id}"
+
+
+def bind(document_id: str):
+    """Привязывает последующие спаны к документу; вернёт токен для reset"""
+    return current_document.set(document_id)
+
+
+def record(
+    name: str,
+    started: float,
+    duration: float,
+    document_id: Optional[str] = None,
+    error: Optional[str] = None,
+    **attrs,
+) -> None:
+    """Готовый спан: started - unix time, duration - секунды"""
+    document_id = document_id or current_document.get()
+    if not TRACING_ENABLED or not document_id:
+        return
+    span = {
+        "name": name,
+        "start": round(started, 6),
+        "duration_ms": round(duration * 1000, 3),
+        "process": METRICS_INSTANCE,
+    }
+    if attrs:
+        span["attrs"] = attrs
+    if error:
+        span["error"] = error
+    with _lock:
+        _buffer.append((document_id, json.dumps(span, ensure_ascii=False)))
+
+
+@contextmanager
+def span(name: str, document_id: Optional[str] = None, **attrs):
+    """with span("upload.extract", content_type=...): - спан блока"""
+    if not TRACING_ENABLED:
+        yield
+        return
+    started = time.time()
+    clock = time.perf_counter()
+    error = None
+    try:
+        yield
+    except Exception as e:
+        error = type(e).__name__
+        raise
+    finally:
+        record(
+            name, started, time.perf_counter() - clock, document_id, error,
+            **attrs,
+        )
+
+
+async def flush(redis_client) -> None:
+    """Накопленные спаны в Redis одним пайплайном"""
+    if not _buffer:
+        return
+    with _lock:
+        spans = list(_buffer)
+        _buffer.clear()
+    by_document: dict[str, list[str]] = {}
+    for document_id, payload in spans:
+        by_document.setdefault(document_id, []).append(payload)
+    pipe = redis_client.pipeline(transaction=False)
+    for document_id, payloads in by_document.items():
+        key = trace_key(document_id)
+        pipe.rpush(key, *payloads)
+        pipe.ltrim(key, -TRACE_MAX_SPANS, -1)
+        pipe.expire(key, TRACE_TTL)
+    await pipe.execute()
+
+
+async def get_trace(redis_client, document_id: str) -> list[dict]:
+    """Спаны документа по времени начала"""
+    spans = [
+        json.loads(payload)
+        for payload in await redis_client.lrange(trace_key(document_id), 0, -1)
+    ]
+    return sorted(spans, key=lambda span: span["start"])
@@ -0,0 +1,541 @@
+import fcntl
+import json
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from src.logger import log
+
+# Каталог индекса; общий для всех воркеров
+RAG_INDEX_DIR = os.getenv("RAG_INDEX_DIR", "/model_data/rag_index")
+# Формат векторов на диске: float16 или int8 (векторы нормированы,
+# поэтому int8 - это round(v * 127) без отдельного масштаба на строку)
+VECTOR_DTYPE = os.getenv("VECTOR_DTYPE", "float16")
+# Доля удалённых строк, после которой коллекция переписывается
+VECTOR_COMPACT_RATIO = float(os.getenv("VECTOR_COMPACT_RATIO", "0.2"))
+# Как часто (сек) воркер проверяет, не пора ли уплотнить коллекции
+VECTOR_COMPACT_INTERVAL = float(os.getenv("VECTOR_COMPACT_INTERVAL", "600"))
+# Строк в одном блоке при полном переборе (ограничивает временную память)
+SEARCH_BLOCK_ROWS = 65536
+
+DEFAULT_COLLECTION = "default"
+
+INT8_SCALE = 127.0
+
+META_FILE = "meta.json"
+LOG_FILE = "log.jsonl"
+
+
+class VectorCollection:
+    """
+    Векторы чанков одной коллекции документов на диске.
+
+    Файлы поколения (gen-<N>/) только дописываются:
+    vectors.bin - строки dim x dtype, docs.u32 - порядковый номер документа
+    строки, offsets.u64 - начало текста строки в texts.jsonl.
+    meta.json - состояние на момент создания поколения: число строк и
+    список документов [id, первая строка, число строк, удалён].
+    log.jsonl - журнал изменений после этого: запись add (документ
+    дописан, возможно вместо прежней версии) или del (tombstone).
+    Запись журнала - точка фиксации: данные сначала дописываются и
+    сбрасываются на диск, затем в журнал добавляется строка. Хвост
+    файлов дальше зафиксированного и недописанная строка журнала
+    считаются мусором от прерванной записи и перезаписываются.
+    Журнал сворачивается в meta.json при уплотнении, которое собирает
+    живые строки в новое поколение и переключает файл CURRENT.
+
+    Чтение идёт через np.memmap: процессы делят страницы page cache,
+    открытие коллекции не читает векторы целиком.
+    """
+
+    def __init__(self, path: Path, dtype: str = VECTOR_DTYPE):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self._lock = threading.Lock()
+        self._version = None
+        self._gen: Optional[Path] = None
+        self.meta: dict = {}
+        self._vectors = None
+        self._docs = None
+        self._offsets = None
+        self._deleted = np.zeros(0, dtype=bool)
+        self._live: dict[str, int] = {}
+        # Сколько байт журнала уже применено к meta
+        self._log_bytes = 0
+
+    # --- файлы и состояние ---
+
+    @contextmanager
+    def _file_lock(self):
+        self.path.mkdir(parents=True, exist_ok=True)
+        with open(self.path / "collection.lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _current_gen(self) -> Optional[Path]:
+        try:
+            name = (self.path / "CURRENT").read_text().strip()
+        except FileNotFoundError:
+            return None
+        return self.path / name
+
+    def _disk_version(self):
+        gen = self._current_gen()
+        if gen is None:
+            return None
+        stat = (gen / META_FILE).stat()
+        try:
+            log_size = (gen / LOG_FILE).stat().st_size
+        except FileNotFoundError:
+            log_size = 0
+        # meta.json заменяется через os.replace - у новой версии новый
+        # inode; журнал только растёт (или обрезается до зафиксированного)
+        return gen.name, stat.st_ino, stat.st_mtime_ns, log_size
+
+    def _refresh(self):
+        """Подхватывает изменения коллекции, сделанные другим процессом"""
+        for attempt in range(3):
+            try:
+                version = self._disk_version()
+                if version == self._version:
+                    return
+                if (
+                    version is not None
+                    and self._version is not None
+                    and version[:3] == self._version[:3]
+                ):
+                    # То же поколение - применяем только новые записи журнала
+                    self._replay(version)
+                else:
+                    self._open(version)
+                return
+            except FileNotFoundError:
+                # Поколение удалено уплотнением между чтением CURRENT и
+                # открытием файлов - читаем CURRENT заново
+                if attempt == 2:
+                    raise
+
+    def _open(self, version):
+        if version is None:
+            self._gen, self.meta = None, {}
+            self._vectors = self._docs = self._offsets = None
+            self._deleted = np.zeros(0, dtype=bool)
+            self._live = {}
+            self._log_bytes = 0
+            self._version = None
+            return
+        gen = self.path / version[0]
+        with open(gen / META_FILE, encoding="utf-8") as f:
+            meta = json.load(f)
+        self._gen, self.meta, self._log_bytes = gen, meta, 0
+        self._live = {
+            doc[0]: number
+            for number, doc in enumerate(meta["documents"])
+            if not doc[3]
+        }
+        self._replay(version)
+
+    def _replay(self, version):
+        """Применяет записи журнала после уже прочитанных и отображает файлы"""
+        try:
+            with open(self._gen / LOG_FILE, "rb") as f:
+                f.seek(self._log_bytes)
+                tail = f.read()
+        except FileNotFoundError:
+            tail = b""
+        for line in tail.splitlines(keepends=True):
+            if not line.endswith(b"\n"):
+                break  # недописанная запись
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            self._apply(record)
+            self._log_bytes += len(line)
+        self._map()
+        self._version = version
+
+    def _apply(self, record: dict):
+        meta, documents = self.meta, self.meta["documents"]
+        if record["op"] == "add":
+            replaces = record.get("replaces")
+            if replaces is not None:
+                documents[replaces][3] = True
+            self._live[record["id"]] = len(documents)
+            documents.append(
+                [record["id"], meta["rows"], record["rows"], False]
+            )
+            meta["rows"] += record["rows"]
+            meta["text_bytes"] += record["text_bytes"]
+        elif record["op"] == "del":
+            doc = documents[record["doc"]]
+            doc[3] = True
+            if self._live.get(doc[0]) == record["doc"]:
+                del self._live[doc[0]]
+
+    def _map(self):
+        gen, meta = self._gen, self.meta
+        rows, dim = meta["rows"], meta["dim"]
+        dtype = np.dtype(meta["dtype"])
+        if rows:
+            self._vectors = np.memmap(
+                gen / "vectors.bin", dtype=dtype, mode="r", shape=(rows, dim)
+            )
+            self._docs = np.memmap(
+                gen / "docs.u32", dtype=np.uint32, mode="r", shape=(rows,)
+            )
+            self._offsets = np.memmap(
+                gen / "offsets.u64", dtype=np.uint64, mode="r", shape=(rows,)
+            )
+        else:
+            self._vectors = self._docs = self._offsets = None
+        self._deleted = np.array(
+            [doc[3] for doc in meta["documents"]], dtype=bool
+        )
+
+    def _write_meta(self, gen: Path, meta: dict):
+        """Полная запись meta.json - только для нового поколения"""
+        tmp = gen / f"{META_FILE}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, gen / META_FILE)
+
+    def _log(self, record: dict):
+        """Фиксирует изменение одной строкой журнала текущего поколения"""
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        self._append(self._gen / LOG_FILE, self._log_bytes, line.encode())
+
+    def _new_generation(
+        self,
+        number: int,
+        dim: int,
+        dtype: np.dtype,
+    ) -> tuple[Path, dict]:
+        gen = self.path / f"gen-{number:06d}"
+        gen.mkdir(parents=True, exist_ok=True)
+        for name in (
+            "vectors.bin", "docs.u32", "offsets.u64", "texts.jsonl", LOG_FILE
+        ):
+            open(gen / name, "wb").close()
+        meta = {
+            "generation": number,
+            "dim": dim,
+            "dtype": dtype.name,
+            "rows": 0,
+            "text_bytes": 0,
+            "documents": [],
+        }
+        self._write_meta(gen, meta)
+        return gen, meta
+
+    def _switch(self, gen: Path):
+        tmp = self.path / "CURRENT.tmp"
+        tmp.write_text(gen.name)
+        os.replace(tmp, self.path / "CURRENT")
+
+    @staticmethod
+    def _encode(vectors: np.ndarray, dtype: np.dtype) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if dtype == np.int8:
+            return np.clip(np.rint(vectors * INT8_SCALE), -127, 127).astype(np.int8)
+        return vectors.astype(dtype)
+
+    # --- запись ---
+
+    def add(self, document_id: str, texts: list[str], vectors: np.ndarray) -> int:
+        """
+        Дописывает чанки документа в конец коллекции. Прежние чанки того
+        же документа (повторная индексация) помечаются удалёнными
+        """
+        with self._lock, self._file_lock():
+            self._refresh()
+            if self._gen is None:
+                gen, _ = self._new_generation(1, vectors.shape[1], self.dtype)
+                self._switch(gen)
+                self._refresh()
+            gen, meta = self._gen, self.meta
+
+            rows, text_bytes = meta["rows"], meta["text_bytes"]
+            # Формат коллекции фиксируется при создании; смена
+            # VECTOR_DTYPE действует на новые коллекции
+            dtype = np.dtype(meta["dtype"])
+            encoded = self._encode(vectors, dtype)
+            lines = [
+                (json.dumps({"chunk": i, "text": text}, ensure_ascii=False)
+                 + "\n").encode("utf-8")
+                for i, text in enumerate(texts)
+            ]
+            offsets = text_bytes + np.concatenate(
+                [[0], np.cumsum([len(line) for line in lines])[:-1]]
+            ).astype(np.uint64)
+            number = len(meta["documents"])
+
+            row_bytes = meta["dim"] * dtype.itemsize
+            self._append(gen / "vectors.bin", rows * row_bytes, encoded.tobytes())
+            self._append(
+                gen / "docs.u32",
+                rows * 4,
+                np.full(len(texts), number, dtype=np.uint32).tobytes(),
+            )
+            self._append(gen / "offsets.u64", rows * 8, offsets.tobytes())
+            self._append(gen / "texts.jsonl", text_bytes, b"".join(lines))
+
+            # Прежние чанки того же документа помечаются удалёнными той же
+            # записью журнала - замена атомарна
+            self._log({
+                "op": "add",
+                "id": document_id,
+                "rows": len(texts),
+                "text_bytes": sum(len(line) for line in lines),
+                "replaces": self._live.get(document_id),
+            })
+            self._refresh()
+            return len(texts)
+
+    @staticmethod
+    def _append(path: Path, committed: int, data: bytes):
+        """Запись после зафиксированной длины (обрезая недописанный хвост)"""
+        # a+b создаёт журнал поколений, записанных до его появления
+        with open(path, "a+b") as f:
+            f.truncate(committed)
+            f.seek(committed)
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def remove(self, document_id: str) -> int:
+        """Tombstone документа; возвращает число его строк"""
+        with self._lock, self._file_lock():
+            self._refresh()
+            number = self._live.get(document_id)
+            if number is None:
+                return 0
+            self._log({"op": "del", "doc": number})
+            self._refresh()
+            return self.meta["documents"][number][2]
+
+    def dead_ratio(self) -> float:
+        rows = self.meta.get("rows", 0)
+        if not rows:
+            return 0.0
+        dead = sum(doc[2] for doc in self.meta["documents"] if doc[3])
+        return dead / rows
+
+    def compact(self, min_ratio: float = VECTOR_COMPACT_RATIO) -> bool:
+        """
+        Переписывает живые строки в новое поколение, если удалённых
+        строк не меньше min_ratio. Старое поколение удаляется: процессы,
+        уже отобразившие его файлы, дочитают их до переоткрытия
+        """
+        with self._lock, self._file_lock():
+            self._refresh()
+            if self._gen is None or self.dead_ratio() < min_ratio:
+                return False
+            old_gen, old = self._gen, self.meta
+            gen, meta = self._new_generation(
+                old["generation"] + 1, old["dim"], np.dtype(old["dtype"])
+            )
+            live = [doc for doc in old["documents"] if not doc[3]]
+
+            with open(old_gen / "texts.jsonl", "rb") as src_texts, \
+                    open(gen / "vectors.bin", "ab") as vectors, \
+                    open(gen / "docs.u32", "ab") as docs, \
+                    open(gen / "offsets.u64", "ab") as offsets, \
+                    open(gen / "texts.jsonl", "ab") as texts:
+                rows, text_bytes = 0, 0
+                for number, (document_id, start, count, _) in enumerate(live):
+                    stop = start + count
+                    vectors.write(np.asarray(self._vectors[start:stop]).tobytes())
+                    docs.write(np.full(count, number, dtype=np.uint32).tobytes())
+                    begin = int(self._offsets[start])
+                    end = self._text_end(stop)
+                    src_texts.seek(begin)
+                    texts.write(src_texts.read(end - begin))
+                    shift = np.asarray(self._offsets[start:stop]) - np.uint64(begin)
+                    offsets.write((shift + np.uint64(text_bytes)).tobytes())
+                    meta["documents"].append([document_id, rows, count, False])
+                    rows += count
+                    text_bytes += end - begin
+                for f in (vectors, docs, offsets, texts):
+                    f.flush()
+                    os.fsync(f.fileno())
+
+            meta["rows"], meta["text_bytes"] = rows, text_bytes
+            self._write_meta(gen, meta)
+            self._switch(gen)
+            shutil.rmtree(old_gen, ignore_errors=True)
+            self._open(self._disk_version())
+            log.info(
+                f"Коллекция {self.path.name} уплотнена: "
+                f"{old['rows']} -> {rows} строк"
+            )
+            return True
+
+    # --- чтение ---
+
+    def _text_end(self, row: int) -> int:
+        if row < self.meta["rows"]:
+            return int(self._offsets[row])
+        return self.meta["text_bytes"]
+
+    def _texts(self, rows: list[int]) -> list[dict]:
+        result = []
+        with open(self._gen / "texts.jsonl", "rb") as f:
+            for row in rows:
+                begin = int(self._offsets[row])
+                f.seek(begin)
+                result.append(json.loads(f.read(self._text_end(row + 1) - begin)))
+        return result
+
+    def search(
+        self,
+        query: np.ndarray,
+        k: int,
+        document_id: Optional[str] = None,
+    ) -> list[dict]:
+        """k ближайших живых чанков к нормированному вектору query"""
+        with self._lock:
+            try:
+                return self._search(query, k, document_id)
+            except FileNotFoundError:
+                # Уплотнение удалило поколение во время поиска
+                self._version = None
+                return self._search(query, k, document_id)
+
+    def _search(
+        self,
+        query: np.ndarray,
+        k: int,
+        document_id: Optional[str],
+    ) -> list[dict]:
+        self._refresh()
+        if self._vectors is None:
+            return []
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        documents = self.meta["documents"]
+
+        if document_id is not None:
+            number = self._live.get(document_id)
+            if number is None:
+                return []
+            _, start, count, _ = documents[number]
+            blocks = [(start, start + count)]
+        else:
+            rows = self.meta["rows"]
+            blocks = [
+                (start, min(start + SEARCH_BLOCK_ROWS, rows))
+                for start in range(0, rows, SEARCH_BLOCK_ROWS)
+            ]
+
+        best_rows = np.zeros(0, dtype=np.int64)
+        best_scores = np.zeros(0, dtype=np.float32)
+        for start, stop in blocks:
+            scores = np.asarray(self._vectors[start:stop], dtype=np.float32) @ query
+            scores[self._deleted[self._docs[start:stop]]] = -np.inf
+            if len(scores) > k:
+                top = np.argpartition(-scores, k)[:k]
+            else:
+                top = np.arange(len(scores))
+            best_rows = np.concatenate([best_rows, top + start])
+            best_scores = np.concatenate([best_scores, scores[top]])
+            if len(best_scores) > k:
+                keep = np.argpartition(-best_scores, k)[:k]
+                best_rows, best_scores = best_rows[keep], best_scores[keep]
+
+        order = [i for i in np.argsort(-best_scores) if np.isfinite(best_scores[i])]
+        rows = [int(best_rows[i]) for i in order]
+        scale = INT8_SCALE if self._vectors.dtype == np.int8 else 1.0
+        return [
+            {
+                "document_id": documents[int(self._docs[row])][0],
+                "chunk": text["chunk"],
+                "text": text["text"],
+                "score": float(best_scores[i]) / scale,
+            }
+            for row, i, text in zip(rows, order, self._texts(rows))
+        ]
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._refresh()
+            documents = self.meta.get("documents", [])
+            live = [doc for doc in documents if not doc[3]]
+            return {
+                "documents": len(live),
+                "rows": self.meta.get("rows", 0),
+                "live_rows": sum(doc[2] for doc in live),
+                "dead_ratio": round(self.dead_ratio(), 4),
+                "dtype": self.meta.get("dtype", self.dtype.name),
+                "generation": self.meta.get("generation"),
+            }
+
+
+class VectorIndex:
+    """Набор коллекций векторов в общем каталоге RAG_INDEX_DIR"""
+
+    def __init__(self, path: str = RAG_INDEX_DIR, dtype: str = VECTOR_DTYPE):
+        self.path = Path(path)
+        self.dtype = dtype
+        self._collections: dict[str, VectorCollection] = {}
+        self._lock = threading.Lock()
+
+    def collection(self, name: str = DEFAULT_COLLECTION) -> VectorCollection:
+        with self._lock:
+            if name not in self._collections:
+                self._collections[name] = VectorCollection(
+                    self.path / name, self.dtype
+                )
+            return self._collections[name]
+
+    def collection_names(self) -> list[str]:
+        if not self.path.exists():
+            return []
+        return sorted(p.name for p in self.path.iterdir() if p.is_dir())
+
+    def add(
+        self,
+        document_id: str,
+        texts: list[str],
+        vectors: np.ndarray,
+        collection: str = DEFAULT_COLLECTION,
+    ) -> int:
+        return self.collection(collection).add(document_id, texts, vectors)
+
+    def remove(self, document_id: str) -> int:
+        """Tombstone документа во всех коллекциях"""
+        return sum(
+            self.collection(name).remove(document_id)
+            for name in self.collection_names()
+        )
+
+    def search(
+        self,
+        query: np.ndarray,
+        k: int,
+        document_id: Optional[str] = None,
+        collection: str = DEFAULT_COLLECTION,
+    ) -> list[dict]:
+        return self.collection(collection).search(query, k, document_id)
+
+    def compact(self) -> int:
+        """Уплотняет коллекции с долей удалённых строк выше порога"""
+        return sum(
+            self.collection(name).compact()
+            for name in self.collection_names()
+        )
+
+    def stats(self) -> dict:
+        return {
+            name: self.collection(name).stats()
+            for name in self.collection_names()
+        }
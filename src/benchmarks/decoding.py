@@ -0,0 +1,108 @@
+"""
+Сравнение режимов декодирования на реальной модели.
+
+    python -m src.benchmarks.decoding --files doc1.txt doc2.txt \
+        --modes default,prompt_lookup,assisted --repeats 3
+
+Генерация жадная (GREEDY_KWARGS), чтобы тексты разных режимов можно было
+сравнить с default: identical - доля совпавших summary. Скорость -
+сгенерированные токены (по токенизатору основной модели) в секунду.
+Результат печатается в JSON.
+"""
+import argparse
+import json
+import statistics
+import time
+from pathlib import Path
+
+from src.app.ai_model import DECODING_MODES, GREEDY_KWARGS, ModelManager
+
+# Документ по умолчанию: summary таких текстов копирует фразы источника,
+# на этом и выигрывает prompt_lookup
+SAMPLE_TEXT = """
+The city council approved a new budget on Tuesday that increases funding
+for public transport by twelve percent and freezes property taxes for the
+second year in a row. The budget also allocates money for repairing the
+northern bridge, which was closed in March after engineers found cracks in
+its supports. Council members who voted against the plan said the transport
+increase relies on optimistic ridership forecasts. The mayor said the bridge
+repairs would begin in the autumn and take about eighteen months, during
+which a temporary ferry service will run between the two districts.
+"""
+
+
+def run_mode(manager, mode, texts, max_new_tokens, repeats) -> dict:
+    """Прогон режима: скорость по каждому повтору и тексты summary"""
+    # Первый вызов не меряем: прогрев ядер, загрузка черновой модели
+    manager.summarize_batch(texts[:1], max_new_tokens, decoding=mode)
+    speeds, latencies, outputs = [], [], []
+    for _ in range(repeats):
+        for text in texts:
+            started = time.perf_counter()
+            summary = manager.summarize_batch(
+                [text], max_new_tokens, decoding=mode
+            )[0]
+            elapsed = time.perf_counter() - started
+            tokens = len(
+                manager.tokenizer(summary, add_special_tokens=False)["input_ids"]
+            )
+            speeds.append(tokens / elapsed if elapsed else 0.0)
+            latencies.append(elapsed * 1000)
+            outputs.append(summary)
+    return {
+        "tokens_per_sec": statistics.mean(speeds),
+        "latency_ms_p50": statistics.median(latencies),
+        "outputs": outputs,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--files", nargs="*", default=[])
+    parser.add_argument("--modes", default=",".join(DECODING_MODES))
+    parser.add_argument("--max-new-tokens", type=int, default=150)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    modes = [mode for mode in args.modes.split(",") if mode]
+    unknown = set(modes) - set(DECODING_MODES)
+    if unknown:
+        parser.error(f"неизвестные режимы: {', '.join(sorted(unknown))}")
+    texts = [Path(name).read_text(encoding="utf-8") for name in args.files]
+    texts = texts or [SAMPLE_TEXT]
+
+    manager = ModelManager()
+    manager.load_model()
+    manager.generation_kwargs = dict(GREEDY_KWARGS)
+
+    results = {
+        mode: run_mode(manager, mode, texts, args.max_new_tokens, args.repeats)
+        for mode in modes
+    }
+    baseline = results.get("default")
+    report = {
+        "model": manager.model_name,
+        "device": str(manager.device),
+        "documents": len(texts),
+        "repeats": args.repeats,
+        "max_new_tokens": args.max_new_tokens,
+        "modes": {},
+    }
+    for mode, result in results.items():
+        entry = {
+            "tokens_per_sec": round(result["tokens_per_sec"], 2),
+            "latency_ms_p50": round(result["latency_ms_p50"], 1),
+        }
+        if baseline and mode != "default":
+            entry["speedup"] = round(
+                result["tokens_per_sec"] / baseline["tokens_per_sec"], 3
+            ) if baseline["tokens_per_sec"] else None
+            pairs = list(zip(result["outputs"], baseline["outputs"]))
+            entry["identical"] = sum(a == b for a, b in pairs) / len(pairs)
+        report["modes"][mode] = entry
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    manager.unload_model()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,748 @@
+"""
+Нагрузочный прогон цепочки upload -> generate -> status без внешних
+сервисов.
+
+    python -m src.benchmarks.pipeline --documents 60 --concurrency 8 \
+        --formats pdf,docx,txt --pages 1,5,20 --output report.json
+
+Всё работает в одном процессе: роуты API через ASGI-транспорт httpx,
+GenerationWorker и BatchScheduler, Redis - fakeredis (или --redis-url,
+тогда лучше отдельная пустая база). Модель - заглушка с задержкой,
+пропорциональной числу токенов (--model stub), или маленькая настоящая
+(--model tiny, TINY_MODEL_NAME). Корпус PDF/DOCX/TXT генерируется
+заново при каждом запуске, поэтому кэши извлечения и summary холодные.
+
+Отчёт в JSON: перцентили по стадиям (HTTP-запросы, извлечение по
+обработчикам, команды Redis, ожидание в очереди, инференс, весь путь
+документа), пики памяти, метрики пачек и пула извлечения. --compare
+сравнивает перцентили с отчётом прошлого запуска.
+Нужны пакеты fakeredis и httpx (в зависимости проекта не входят).
+"""
+import argparse
+import asyncio
+import io
+import json
+import logging
+import os
+import random
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+from collections import defaultdict
+from datetime import datetime
+from typing import Optional
+
+CONTENT_TYPES = {
+    "pdf": "application/pdf",
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "txt": "text/plain",
+}
+
+
+# --- Синтетический корпус -------------------------------------------------
+
+def make_words(rng: random.Random, size: int = 3000) -> list[str]:
+    """Словарь псевдослов из слогов: токенизатор режет их как обычный текст"""
+    syllables = ["ka", "lo", "mi", "ren", "sta", "vo", "dre", "pul", "tin",
+                 "gar", "nes", "hu", "bri", "sol", "ex", "am", "or", "qui"]
+    return [
+        "".join(rng.choice(syllables) for _ in range(rng.randint(1, 4)))
+        for _ in range(size)
+    ]
+
+
+def make_pages(rng: random.Random, words: list[str], pages: int,
+               words_per_page: int) -> list[str]:
+    result = []
+    for _ in range(pages):
+        sentences, count = [], 0
+        while count < words_per_page:
+            length = rng.randint(6, 18)
+            sentence = " ".join(rng.choice(words) for _ in range(length))
+            sentences.append(sentence.capitalize() + ".")
+            count += length
+        result.append(" ".join(sentences))
+    return result
+
+
+def make_pdf(pages: list[str], line_chars: int = 90) -> bytes:
+    """Минимальный PDF: страница на элемент pages, шрифт Helvetica"""
+
+    def escape(line: str) -> str:
+        return (line.replace("\\", "\\\\").replace("(", "\\(")
+                .replace(")", "\\)"))
+
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # дерево страниц, заполняется ниже
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    kids = []
+    for text in pages:
+        lines = [
+            text[i:i + line_chars] for i in range(0, len(text), line_chars)
+        ]
+        stream = (
+            "BT /F1 9 Tf 11 TL 40 800 Td "
+            + " ".join(f"({escape(line)}) Tj T*" for line in lines)
+            + " ET"
+        ).encode("latin-1", "replace")
+        objects.append(
+            b"<< /Length %d >>\nstream\n" % len(stream) + stream
+            + b"\nendstream"
+        )
+        content = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> "
+            b"/Contents %d 0 R >>" % content
+        )
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % kid for kid in kids), len(kids)
+    )
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for offset in offsets:
+        out.write(b"%010d 00000 n \n" % offset)
+    out.write(
+        b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+        % (len(objects) + 1, xref)
+    )
+    return out.getvalue()
+
+
+def make_docx(pages: list[str]) -> bytes:
+    """Минимальный DOCX: абзац на каждые несколько предложений"""
+    paragraphs = []
+    for text in pages:
+        sentences = re.split(r"(?<=\.) ", text)
+        for i in range(0, len(sentences), 5):
+            paragraphs.append(" ".join(sentences[i:i + 5]))
+    body = "".join(
+        f'<w:p><w:r><w:t xml:space="preserve">{paragraph}</w:t></w:r></w:p>'
+        for paragraph in paragraphs
+    )
+    out = io.BytesIO()
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr(
+            "[Content_Types].xml",
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/word/document.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+            "</Types>",
+        )
+        archive.writestr(
+            "_rels/.rels",
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="word/document.xml"/>'
+            "</Relationships>",
+        )
+        archive.writestr(
+            "word/document.xml",
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+            f"<w:body>{body}</w:body></w:document>",
+        )
+    return out.getvalue()
+
+
+def make_corpus(
+    documents: int,
+    formats: list[str],
+    pages: list[int],
+    words_per_page: int,
+    seed: int,
+) -> list[tuple[str, str, bytes]]:
+    """(имя файла, MIME-тип, содержимое); форматы и размеры по кругу"""
+    rng = random.Random(seed)
+    words = make_words(rng)
+    corpus = []
+    for i in range(documents):
+        kind = formats[i % len(formats)]
+        count = pages[(i // len(formats)) % len(pages)]
+        text = make_pages(rng, words, count, words_per_page)
+        if kind == "pdf":
+            data = make_pdf(text)
+        elif kind == "docx":
+            data = make_docx(text)
+        else:
+            data = "\n\n".join(text).encode()
+        corpus.append((f"doc{i:04d}-{count}p.{kind}", CONTENT_TYPES[kind], data))
+    return corpus
+
+
+# --- Замеры ---------------------------------------------------------------
+
+class Recorder:
+    """Длительности по стадиям, в секундах"""
+
+    def __init__(self):
+        self.samples: dict[str, list[float]] = defaultdict(list)
+        self.counters: dict[str, int] = defaultdict(int)
+
+    def reset(self):
+        self.samples.clear()
+        self.counters.clear()
+
+    def add(self, stage: str, seconds: float):
+        self.samples[stage].append(seconds)
+
+    def count(self, name: str, value: int = 1):
+        self.counters[name] += value
+
+    def timed(self, stage: str, func):
+        """Обёртка корутины: время каждого вызова в stage"""
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                self.add(stage, time.perf_counter() - started)
+        return wrapper
+
+    def report(self) -> dict:
+        return {
+            stage: summarize(values)
+            for stage, values in sorted(self.samples.items())
+        }
+
+
+def summarize(values: list[float]) -> dict:
+    from src.app.metrics import percentile
+
+    ordered = sorted(values)
+    return {
+        "count": len(ordered),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3),
+        "p50_ms": round(percentile(ordered, 0.50) * 1000, 3),
+        "p90_ms": round(percentile(ordered, 0.90) * 1000, 3),
+        "p99_ms": round(percentile(ordered, 0.99) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+def redis_observer(recorder: Recorder):
+    """Замеры metrics.instrument_redis - в стадии redis.command/pipeline"""
+    def observe(command: str, seconds: float):
+        stage = "redis.pipeline" if command == "PIPELINE" else "redis.command"
+        recorder.add(stage, seconds)
+    return observe
+
+
+def emulate_block(client, interval: float = 0.01):
+    """
+    fakeredis отвечает на XREADGROUP ... BLOCK сразу, не уступая event
+    loop: цикл воркера крутился бы, не давая выполняться задачам.
+    Пустой ответ превращается в короткое ожидание, как у Redis
+    """
+    xreadgroup = client.xreadgroup
+
+    async def blocking_xreadgroup(*args, block=None, **kwargs):
+        response = await xreadgroup(*args, block=block, **kwargs)
+        if block is not None and not any(
+            messages for _, messages in response or []
+        ):
+            await asyncio.sleep(min(block / 1000, interval))
+        return response
+
+    client.xreadgroup = blocking_xreadgroup
+
+
+class MemorySampler:
+    """Пик RSS процесса вместе с дочерними (пул извлечения)"""
+
+    def __init__(self, interval: float = 0.05):
+        import psutil
+
+        self.process = psutil.Process()
+        self.interval = interval
+        self.peak_rss = 0
+        self.peak_children_rss = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def sample(self):
+        import psutil
+
+        rss = self.process.memory_info().rss
+        children = 0
+        for child in self.process.children(recursive=True):
+            try:
+                children += child.memory_info().rss
+            except psutil.Error:
+                pass  # процесс пула завершился между вызовами
+        self.peak_rss = max(self.peak_rss, rss)
+        self.peak_children_rss = max(self.peak_children_rss, children)
+
+    async def _run(self):
+        while True:
+            self.sample()
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+        self.sample()
+
+
+# --- Модель-заглушка ------------------------------------------------------
+
+class WhitespaceTokenizer:
+    """Токен - слово: нужен summarizer'у для чанков и планировщику для длин"""
+
+    def __call__(self, text, add_special_tokens=True,
+                 return_offsets_mapping=False, **kwargs):
+        if isinstance(text, list):
+            return {"input_ids": [self(t)["input_ids"] for t in text]}
+        spans = [match.span() for match in re.finditer(r"\S+", text)]
+        encoded = {"input_ids": list(range(len(spans)))}
+        if return_offsets_mapping:
+            encoded["offset_mapping"] = spans
+        return encoded
+
+
+class StubModel:
+    """
+    Интерфейс ModelManager без весов: summary - начало текста, время
+    вызова - prefill по самому длинному промпту пачки плюс генерация
+    max_new_tokens шагов, как у настоящей пакетной генерации
+    """
+
+    model_name = "benchmark-stub"
+    device = "stub"
+    is_loaded = True
+
+    def __init__(self, token_ms: float, prefill_ms: float):
+        self.token_ms = token_ms
+        self.prefill_ms = prefill_ms
+        self.tokenizer = WhitespaceTokenizer()
+
+    def load_model(self):
+        pass
+
+    def unload_model(self):
+        pass
+
+    def count_tokens(self, texts, prompt=None):
+        return [len(text.split()) for text in texts]
+
+    def summarize_batch(self, texts, max_new_tokens=150, callbacks=None,
+                        prompt=None, decoding=None):
+        longest = max(len(text.split()) for text in texts)
+        time.sleep(
+            (longest / 1000 * self.prefill_ms
+             + max_new_tokens * self.token_ms) / 1000
+        )
+        summaries = [" ".join(text.split()[:max_new_tokens // 2])
+                     for text in texts]
+        for callback, summary in zip(callbacks or [], summaries):
+            if callback:
+                callback(summary)
+        return summaries
+
+
+# --- Прогон ---------------------------------------------------------------
+
+class PipelineBenchmark:
+    def __init__(self, args, corpus, warmup):
+        self.args = args
+        self.corpus = corpus
+        self.warmup = warmup
+        self.recorder = Recorder()
+        self.memory = MemorySampler()
+        # document_id -> (время загрузки, событие готовности)
+        self.pending: dict[str, tuple[float, asyncio.Event]] = {}
+        self.fake_server = None
+
+    async def run(self) -> dict:
+        # Импорты после разбора аргументов: TINY_MODEL читается при
+        # импорте ai_model
+        import httpx
+        from fastapi import FastAPI
+
+        from src.app.batching import BatchScheduler
+        from src.app.extraction_cache import ExtractionCache
+        from src.app.fulltext import FullTextIndex
+        from src.app.ingest import UploadLimitMiddleware
+        from src.app.jobs import JOB_INDEX, JOB_SUMMARIZE, ensure_group
+        from src.app.rag import Retriever
+        from src.app.routes import generate, status_check, upload
+        from src.app.services import registry
+        from src.app.storage import DocumentStore
+        from src.app.summarizer import HierarchicalSummarizer
+        from src.app.summary_cache import SummaryCache
+        from src.app.vector_index import VectorIndex
+        from src.worker import GenerationWorker
+
+        args, recorder = self.args, self.recorder
+        redis_client, raw_client = self._redis()
+        await ensure_group(redis_client)
+
+        manager = self._model()
+        scheduler = BatchScheduler(manager)
+        summarize_batch = manager.summarize_batch
+
+        def timed_batch(texts, *rest, **kwargs):
+            started = time.perf_counter()
+            try:
+                return summarize_batch(texts, *rest, **kwargs)
+            finally:
+                recorder.add("inference.batch", time.perf_counter() - started)
+                recorder.count("inference.documents", len(texts))
+        manager.summarize_batch = timed_batch
+
+        # Извлечение по обработчикам: обёртка на экземплярах реестра
+        for processor in set(registry._processors.values()):
+            processor.extract_text = recorder.timed(
+                f"extract.{type(processor).__name__}", processor.extract_text
+            )
+
+        app = FastAPI()
+        app.add_middleware(UploadLimitMiddleware)
+        for module in (upload, generate, status_check):
+            app.include_router(module.router)
+        app.state.redis = redis_client
+        app.state.redis_raw = raw_client
+        app.state.store = DocumentStore(redis_client, raw_client)
+        app.state.summary_cache = SummaryCache(redis_client, manager.model_name)
+        app.state.extraction_cache = ExtractionCache(redis_client, raw_client)
+        app.state.fulltext = FullTextIndex(redis_client, raw_client)
+
+        summarizer = HierarchicalSummarizer(manager, scheduler, redis_client)
+        workers = []
+        index_dir = tempfile.TemporaryDirectory()
+        for number in range(args.workers):
+            worker = GenerationWorker(
+                redis_client,
+                raw_client,
+                f"bench-{number}",
+                summarizer,
+                SummaryCache(redis_client, manager.model_name),
+                Retriever(None, VectorIndex(index_dir.name)),
+                scheduler,
+            )
+            # Векторная индексация в прогон не входит
+            worker._handlers[JOB_INDEX] = self._skip
+            worker._handlers[JOB_SUMMARIZE] = self._timed_job(
+                worker._handlers[JOB_SUMMARIZE]
+            )
+            workers.append(worker)
+
+        transport = httpx.ASGITransport(app=app)
+        self.memory.start()
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://bench", timeout=None
+        ) as client:
+            worker_tasks = [asyncio.create_task(w.run()) for w in workers]
+            poller = asyncio.create_task(self._poll_status(client))
+            # Прогрев (процессы пула извлечения, первая пачка) в отчёт
+            # не входит
+            await self._drive(client, self.warmup, 1)
+            recorder.reset()
+            started = time.perf_counter()
+            await self._drive(client, self.corpus, args.concurrency)
+            elapsed = time.perf_counter() - started
+            poller.cancel()
+            for worker in workers:
+                worker.stop()
+            for task in worker_tasks:
+                task.cancel()
+            await asyncio.gather(*worker_tasks, poller, return_exceptions=True)
+        self.memory.stop()
+
+        extraction = registry.executor.metrics()
+        batches = scheduler.metrics()
+        await asyncio.to_thread(scheduler.stop)
+        registry.shutdown()
+        manager.unload_model()
+        index_dir.cleanup()
+        await redis_client.close()
+        await raw_client.close()
+        return self._report(elapsed, extraction, batches)
+
+    def _redis(self):
+        """Пара клиентов (с декодированием и без) с замером команд"""
+        if self.args.redis_url:
+            import redis.asyncio as redis
+
+            clients = (
+                redis.from_url(self.args.redis_url, decode_responses=True),
+                redis.from_url(self.args.redis_url),
+            )
+        else:
+            import fakeredis
+            import fakeredis.aioredis
+
+            if self.fake_server is None:
+                self.fake_server = fakeredis.FakeServer()
+            clients = (
+                fakeredis.aioredis.FakeRedis(
+                    server=self.fake_server, decode_responses=True
+                ),
+                fakeredis.aioredis.FakeRedis(server=self.fake_server),
+            )
+            emulate_block(clients[0])
+        from src.app.metrics import instrument_redis
+
+        for client in clients:
+            instrument_redis(client, redis_observer(self.recorder))
+        return clients
+
+    def _model(self):
+        if self.args.model == "stub":
+            return StubModel(self.args.stub_token_ms, self.args.stub_prefill_ms)
+        from src.app.ai_model import model_manager
+
+        model_manager.load_model()
+        return model_manager
+
+    async def _skip(self, fields: dict):
+        pass
+
+    def _timed_job(self, handler):
+        async def wrapper(fields: dict):
+            enqueued = datetime.fromisoformat(fields["enqueued_at"])
+            self.recorder.add(
+                "queue.wait",
+                max(0.0, (datetime.utcnow() - enqueued).total_seconds()),
+            )
+            started = time.perf_counter()
+            try:
+                return await handler(fields)
+            finally:
+                self.recorder.add("job.summarize", time.perf_counter() - started)
+        return wrapper
+
+    async def _request(self, client, stage: str, method: str, url: str,
+                       **kwargs):
+        """Запрос с повтором при 503/429 (Retry-After)"""
+        while True:
+            started = time.perf_counter()
+            response = await client.request(method, url, **kwargs)
+            self.recorder.add(stage, time.perf_counter() - started)
+            if response.status_code not in (429, 503):
+                return response
+            self.recorder.count(f"{stage}.retries")
+            await asyncio.sleep(
+                float(response.headers.get("Retry-After") or 1)
+            )
+
+    async def _drive(self, client, corpus, concurrency: int):
+        queue: asyncio.Queue = asyncio.Queue()
+        for item in corpus:
+            queue.put_nowait(item)
+        await asyncio.gather(*(
+            self._user(client, queue) for _ in range(concurrency)
+        ))
+
+    async def _user(self, client, queue: asyncio.Queue):
+        """Виртуальный пользователь: загрузка, генерация, ожидание готовности"""
+        while not queue.empty():
+            filename, content_type, data = queue.get_nowait()
+            started = time.perf_counter()
+            response = await self._request(
+                client, "http.upload", "POST", "/upload",
+                files={"file": (filename, data, content_type)},
+            )
+            if response.status_code != 201:
+                self.recorder.count("errors.upload")
+                continue
+            document_id = response.json()["document_id"]
+            done = asyncio.Event()
+            self.pending[document_id] = (started, done)
+            response = await self._request(
+                client, "http.generate", "POST", "/generate",
+                json={"document_id": document_id},
+            )
+            if response.status_code not in (200, 202):
+                self.recorder.count("errors.generate")
+                self.pending.pop(document_id)
+                continue
+            await done.wait()
+
+    async def _poll_status(self, client):
+        """
+        Опрос GET /status: документ готов, когда пропал из списка
+        processing (done или error)
+        """
+        while True:
+            await asyncio.sleep(self.args.poll_interval)
+            processing, cursor = set(), None
+            while True:
+                params = {"status": "processing", "limit": 500}
+                if cursor:
+                    params["cursor"] = cursor
+                response = await self._request(
+                    client, "http.status", "GET", "/status", params=params
+                )
+                page = response.json()
+                processing.update(d["document_id"] for d in page["documents"])
+                cursor = page["next_cursor"]
+                if not cursor:
+                    break
+            now = time.perf_counter()
+            for document_id, (started, done) in list(self.pending.items()):
+                if document_id not in processing:
+                    self.recorder.add("document.end_to_end", now - started)
+                    done.set()
+                    del self.pending[document_id]
+
+    def _report(self, elapsed: float, extraction: dict, batches: dict) -> dict:
+        args = self.args
+        finished = len(self.recorder.samples["document.end_to_end"])
+        corpus_bytes = sum(len(data) for _, _, data in self.corpus)
+        kib = 1024
+        return {
+            "version": git_revision(),
+            "created_at": datetime.utcnow().isoformat(),
+            "config": {
+                "documents": args.documents,
+                "formats": args.formats,
+                "pages": args.pages,
+                "words_per_page": args.words_per_page,
+                "concurrency": args.concurrency,
+                "workers": args.workers,
+                "model": args.model,
+                "redis": "external" if args.redis_url else "fakeredis",
+                "corpus_mb": round(corpus_bytes / kib / kib, 2),
+            },
+            "throughput": {
+                "elapsed_s": round(elapsed, 3),
+                "documents_done": finished,
+                "documents_per_s": round(finished / elapsed, 3) if elapsed else 0,
+                "input_mb_per_s": round(
+                    corpus_bytes / kib / kib / elapsed, 3
+                ) if elapsed else 0,
+            },
+            "stages": self.recorder.report(),
+            "counters": dict(self.recorder.counters),
+            "memory": {
+                "peak_rss_mb": round(self.memory.peak_rss / kib / kib, 1),
+                "peak_children_rss_mb": round(
+                    self.memory.peak_children_rss / kib / kib, 1
+                ),
+                # ru_maxrss в Linux - КиБ; дочерние учитываются после выхода
+                "maxrss_mb": round(
+                    resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / kib, 1
+                ),
+                "children_maxrss_mb": round(
+                    resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / kib,
+                    1,
+                ),
+            },
+            "batches": batches,
+            "extraction": extraction,
+        }
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report: dict, baseline: dict) -> dict:
+    """Отношение перцентилей к прошлому отчёту (> 1 - стало медленнее)"""
+    result = {}
+    for stage, current in report["stages"].items():
+        previous = baseline.get("stages", {}).get(stage)
+        if not previous:
+            continue
+        result[stage] = {
+            key: round(current[key] / previous[key], 3) if previous[key] else None
+            for key in ("p50_ms", "p90_ms", "p99_ms")
+        }
+    old = baseline.get("throughput", {}).get("documents_per_s")
+    if old:
+        result["documents_per_s"] = round(
+            report["throughput"]["documents_per_s"] / old, 3
+        )
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--documents", type=int, default=30)
+    parser.add_argument("--formats", default="pdf,docx,txt")
+    parser.add_argument("--pages", default="1,5,20",
+                        help="размеры документов в страницах, по кругу")
+    parser.add_argument("--words-per-page", type=int, default=350)
+    parser.add_argument("--concurrency", type=int, default=8,
+                        help="одновременных клиентов")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="GenerationWorker в процессе")
+    parser.add_argument("--model", choices=("stub", "tiny"), default="stub")
+    parser.add_argument("--stub-token-ms", type=float, default=2.0,
+                        help="заглушка: мс на шаг генерации пачки")
+    parser.add_argument("--stub-prefill-ms", type=float, default=20.0,
+                        help="заглушка: мс на 1000 токенов промпта")
+    parser.add_argument("--warmup", type=int, default=3,
+                        help="документов для прогрева, не входят в отчёт")
+    parser.add_argument("--redis-url", default=None,
+                        help="настоящий Redis вместо fakeredis")
+    parser.add_argument("--poll-interval", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="файл для JSON-отчёта")
+    parser.add_argument("--compare", default=None,
+                        help="JSON-отчёт прошлого запуска")
+    args = parser.parse_args()
+
+    formats = [kind for kind in args.formats.split(",") if kind]
+    unknown = set(formats) - set(CONTENT_TYPES)
+    if unknown:
+        parser.error(f"неизвестные форматы: {', '.join(sorted(unknown))}")
+    pages = [int(count) for count in args.pages.split(",") if count]
+    args.formats, args.pages = formats, pages
+    if args.model == "tiny":
+        os.environ.setdefault("TINY_MODEL", "1")
+
+    corpus = make_corpus(
+        args.documents, formats, pages, args.words_per_page, args.seed
+    )
+    warmup = make_corpus(
+        args.warmup, formats, [1], args.words_per_page, args.seed + 1
+    )
+    from src.logger import log
+
+    # Логи каждого документа и запроса заглушили бы отчёт
+    log.setLevel("WARNING")
+    logging.getLogger("httpx").setLevel("WARNING")
+    report = asyncio.run(PipelineBenchmark(args, corpus, warmup).run())
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            report["comparison"] = compare(report, json.load(f))
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    print(output)
+    failed = report["counters"].get("errors.upload", 0) + report["counters"].get(
+        "errors.generate", 0
+    )
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
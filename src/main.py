@@ -1,3 +1,4 @@
+import asyncio
 import os
 import secrets
 from pathlib import Path
@@ -7,8 +8,31 @@ from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from starlette.middleware.sessions import SessionMiddleware
 
-from src.app.routes import web, upload, generate, status_check
+from src.app.routes import (
+    web, upload, generate, status_check, ask, search, metrics,
+)
+from src.app.admission import (
+    ADMISSION_ENABLED,
+    AdmissionController,
+    AdmissionMiddleware,
+)
 from src.app.ai_model import model_manager
+from src.app.extraction_cache import ExtractionCache
+from src.app.fulltext import FullTextIndex
+from src.app.ingest import UploadLimitMiddleware
+from src.app.jobs import enqueue_unindexing, ensure_group
+from src.app.lifecycle import RetentionSweeper
+from src.app.metrics import (
+    MetricsMiddleware,
+    flush_all,
+    flush_loop,
+    instrument_redis,
+)
+from src.app.model_client import USE_MODEL_SERVER, ModelClient
+from src.app.services import registry
+from src.app.storage import CREATED_INDEX, DocumentStore
+from src.app.summary_cache import SummaryCache
+from src.app.vector_index import VectorIndex
 from src.logger import log
 
 BASE_DIR = Path(__file__).parent
@@ -20,39 +44,92 @@ app.add_middleware(
     SessionMiddleware,
     secret_key=secrets.token_urlsafe(32)
 )
+app.add_middleware(UploadLimitMiddleware)
+app.add_middleware(AdmissionMiddleware)
+app.add_middleware(MetricsMiddleware)
 
 app.mount("/static", StaticFiles(directory=BASE_DIR / "static"), name="static")
 app.include_router(web.router)
 app.include_router(upload.router)
 app.include_router(generate.router)
 app.include_router(status_check.router)
+app.include_router(ask.router)
+app.include_router(search.router)
+app.include_router(metrics.router)
 
 
 @app.on_event("startup")
 async def startup_event():
     # Инициализация redis
     app.state.redis = redis.from_url(redis_url, decode_responses=True)
+    # Без декодирования - для сжатых текстов документов
+    app.state.redis_raw = redis.from_url(redis_url)
+    instrument_redis(app.state.redis)
+    instrument_redis(app.state.redis_raw)
+    app.state.store = DocumentStore(app.state.redis, app.state.redis_raw)
+    # Отпечаток генерации публикует воркер - свой env API не используется
+    app.state.summary_cache = SummaryCache(app.state.redis)
+    app.state.extraction_cache = ExtractionCache(
+        app.state.redis, app.state.redis_raw
+    )
+    app.state.fulltext = FullTextIndex(app.state.redis, app.state.redis_raw)
+    # Только чтение (поиск и статистика); пишет в индекс воркер
+    app.state.vector_index = VectorIndex()
+    # Допуск /upload и /generate: частота по клиенту, загрузки, очередь
+    app.state.admission = (
+        AdmissionController(app.state.redis) if ADMISSION_ENABLED else None
+    )
     # Проверка подключения
     try:
         await app.state.redis.ping()
         log.info("Подключение к Redis установлено.")
+        await ensure_group(app.state.redis)
+        if not await app.state.redis.exists(CREATED_INDEX):
+            await app.state.store.rebuild_indexes()
     except Exception as e:
         log.error(f"Не удалось подключиться к Redis: {e}")
 
-    # try:
-    #     # TODO: Одно из решений загрузки модели - model server
-    #     model_manager.load_model()
-    # except Exception as e:
-    #     log.error(f"Ошибка запуска: {e}")
+    # Фоновое освобождение просроченных и удалённых документов
+    app.state.sweeper = RetentionSweeper(app.state.store)
+
+    async def unindex_reclaimed(document_ids: list[str]):
+        # Документы с истёкшим сроком - tombstone их чанков в индексе
+        await enqueue_unindexing(app.state.redis, document_ids)
+        await app.state.fulltext.remove(document_ids)
+
+    app.state.sweeper.hooks.append(unindex_reclaimed)
+    app.state.sweeper_task = asyncio.create_task(app.state.sweeper.run())
+    # Списки слов чистятся по таймеру: DELETE /documents тоже оставляет
+    # номера в fts:deleted
+    app.state.vacuum_task = asyncio.create_task(
+        app.state.fulltext.vacuum_loop()
+    )
+    # Метрики и спаны процесса копятся в памяти, в Redis - пачками
+    app.state.metrics_task = asyncio.create_task(flush_loop(app.state.redis))
+
+    # Модель в API-процессе не загружается: генерацию выполняет воркер,
+    # веса держит модельный сервер (src.model_server)
+    app.state.model_client = ModelClient() if USE_MODEL_SERVER else None
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Выгрузка модели при остановке приложения"""
     model_manager.unload_model()
+    registry.shutdown()
+    if hasattr(app.state, 'sweeper_task'):
+        app.state.sweeper_task.cancel()
+    if hasattr(app.state, 'vacuum_task'):
+        app.state.vacuum_task.cancel()
+    if hasattr(app.state, 'metrics_task'):
+        app.state.metrics_task.cancel()
+        await flush_all(app.state.redis)
+    if getattr(app.state, 'model_client', None):
+        await app.state.model_client.close()
     # Отключаем redis
     if hasattr(app.state, 'redis') and app.state.redis:
         await app.state.redis.close()
+        await app.state.redis_raw.close()
         log.info("Подключение к Redis закрыто.")
 
     log.info("Приложение остановлено")
@@ -0,0 +1,241 @@
+import asyncio
+import json
+import os
+import signal
+import sys
+import time
+
+import redis.asyncio as redis
+
+from src.app import metrics
+from src.app.ai_model import model_manager
+from src.app.batching import BatchScheduler
+from src.app.embeddings import embedding_model
+from src.app.model_client import MODEL_SERVER_SOCKET, check_health
+from src.app.summary_cache import generation_params
+from src.logger import log
+
+# Сколько запросов генерации сервер принимает одновременно (в очереди
+# планировщика и в генерации); сверх - отказ с retry_after
+MODEL_SERVER_MAX_PENDING = int(os.getenv("MODEL_SERVER_MAX_PENDING", "64"))
+# Подсказка клиенту, через сколько секунд повторить отклонённый запрос
+MODEL_SERVER_RETRY_AFTER = float(os.getenv("MODEL_SERVER_RETRY_AFTER", "1"))
+# Длина прогревочной генерации, токенов
+MODEL_WARMUP_TOKENS = int(os.getenv("MODEL_WARMUP_TOKENS", "8"))
+# Redis для метрик модели (prefill/декодирование, токены, память);
+# без него метрики сервера не публикуются
+REDIS_URL = os.getenv("REDIS_URL")
+
+
+class ModelServer:
+    """
+    Отдельный процесс с единственной копией весов модели. API и воркеры
+    обращаются к нему через unix socket (src.app.model_client): строки
+    JSON с id запроса, ответы и фрагменты токенов приходят в том же
+    соединении в любом порядке.
+
+    Операции: health - готовность и метрики; embed - векторы текстов
+    энкодером поиска; generate - текст по шаблону промпта через общий
+    BatchScheduler, поэтому запросы разных клиентов попадают в одни пачки.
+    """
+
+    def __init__(
+        self,
+        manager,
+        scheduler: BatchScheduler,
+        path: str = MODEL_SERVER_SOCKET,
+        max_pending: int = MODEL_SERVER_MAX_PENDING,
+    ):
+        self.manager = manager
+        self.scheduler = scheduler
+        self.path = path
+        self.max_pending = max_pending
+        self.ready = False
+        self.pending = 0
+        self.rejected = 0
+        self.served = 0
+        self.started_at = time.time()
+        self._server: asyncio.AbstractServer | None = None
+        self._writers: set[asyncio.StreamWriter] = set()
+
+    async def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)  # сокет от прошлого запуска
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._server = await asyncio.start_unix_server(
+            self._handle, path=self.path
+        )
+        log.info(f"Модельный сервер слушает {self.path}")
+
+    async def warmup(self):
+        """Загрузка весов и короткая генерация до приёма запросов"""
+        started = time.perf_counter()
+        await asyncio.to_thread(self.manager.load_model)
+        await asyncio.wrap_future(
+            self.scheduler.submit("Warmup.", MODEL_WARMUP_TOKENS)
+        )
+        self.ready = True
+        log.info(
+            f"Модель готова за {time.perf_counter() - started:.1f}s"
+        )
+
+    async def close(self):
+        self.ready = False
+        if self._server:
+            self._server.close()
+            # wait_closed ждёт и открытые соединения клиентов
+            for writer in list(self._writers):
+                writer.close()
+            await self._server.wait_closed()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def health(self) -> dict:
+        return {
+            "ready": self.ready,
+            "model": self.manager.model_name,
+            # Для отпечатка кэша summary на стороне воркера
+            "generation": generation_params(),
+            "device": str(self.manager.device),
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "served": self.served,
+            "rejected": self.rejected,
+            "uptime_s": round(time.time() - self.started_at, 1),
+            "batches": self.scheduler.metrics(),
+            "cache_flushes": getattr(self.manager, "cache_flushes", 0),
+        }
+
+    async def _handle(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        tasks: set[asyncio.Task] = set()
+        self._writers.add(writer)
+
+        def send(message: dict):
+            if not writer.is_closing():
+                writer.write(
+                    (json.dumps(message, ensure_ascii=False) + "\n").encode()
+                )
+
+        try:
+            while line := await reader.readline():
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    send({"error": "bad request", "status": 400})
+                    continue
+                task = asyncio.create_task(
+                    self._serve(message, send, loop)
+                )
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except ConnectionError:
+            pass
+        finally:
+            # Генерацию уже отправленных в пачку запросов не прервать,
+            # их результаты просто некому отдать
+            for task in tasks:
+                task.cancel()
+            self._writers.discard(writer)
+            writer.close()
+
+    async def _serve(self, message: dict, send, loop):
+        request_id = message.get("id")
+        op = message.get("op")
+        if op == "health":
+            send({"id": request_id, "result": self.health()})
+            return
+        if op == "embed":
+            await self._embed(message, send)
+            return
+        if op != "generate":
+            send({"id": request_id, "error": f"unknown op {op}", "status": 400})
+            return
+
+        # Допуск: пока модель не прогрета или очередь полна - отказ,
+        # клиент повторит через retry_after
+        if not self.ready or self.pending >= self.max_pending:
+            self.rejected += 1
+            send({
+                "id": request_id,
+                "error": "starting" if not self.ready else "overloaded",
+                "status": 503,
+                "retry_after": MODEL_SERVER_RETRY_AFTER,
+            })
+            return
+
+        on_token = None
+        if message.get("stream"):
+            def on_token(chunk: str):
+                # Вызывается из потока планировщика
+                loop.call_soon_threadsafe(
+                    send, {"id": request_id, "token": chunk}
+                )
+
+        self.pending += 1
+        try:
+            result = await asyncio.wrap_future(self.scheduler.submit(
+                message["text"],
+                int(message.get("max_new_tokens", 150)),
+                on_token,
+                message.get("prompt"),
+                message.get("decoding"),
+            ))
+            self.served += 1
+            send({"id": request_id, "result": result})
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            send({"id": request_id, "error": str(e), "status": 500})
+        finally:
+            self.pending -= 1
+
+    async def _embed(self, message: dict, send):
+        """Векторы запросов поиска: энкодер живёт здесь, а не в API"""
+        request_id = message.get("id")
+        try:
+            vectors = await asyncio.to_thread(
+                embedding_model.encode, message["texts"]
+            )
+            send({"id": request_id, "result": vectors.tolist()})
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            send({"id": request_id, "error": str(e), "status": 500})
+
+
+async def main():
+    scheduler = BatchScheduler(model_manager)
+    server = ModelServer(model_manager, scheduler)
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+
+    redis_client = None
+    flusher = None
+    if REDIS_URL and metrics.METRICS_ENABLED:
+        redis_client = redis.from_url(REDIS_URL, decode_responses=True)
+        flusher = asyncio.create_task(metrics.flush_loop(redis_client))
+
+    # Сокет открываем сразу: health отвечает и во время прогрева
+    await server.start()
+    try:
+        await server.warmup()
+        await stopping.wait()
+    finally:
+        await server.close()
+        if flusher:
+            flusher.cancel()
+            await metrics.flush_all(redis_client)
+            await redis_client.close()
+        await asyncio.to_thread(scheduler.stop)
+        log.info(f"Метрики пачек: {scheduler.metrics()}")
+        model_manager.unload_model()
+
+
+if __name__ == "__main__":
+    if "--check" in sys.argv:
+        # Проверка готовности для healthcheck контейнера
+        sys.exit(0 if asyncio.run(check_health()) else 1)
+    asyncio.run(main())
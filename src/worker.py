@@ -0,0 +1,443 @@
+import asyncio
+import os
+import signal
+import socket
+import time
+
+import redis.asyncio as redis
+
+from src.app import metrics, tracing
+from src.app.batching import BATCH_MAX_SIZE, BatchScheduler
+from src.app.generation_config import ANSWER_PROMPT
+from src.app.jobs import (
+    GENERATE_GROUP,
+    GENERATE_STREAM,
+    JOB_ASK,
+    JOB_CLAIM_IDLE_MS,
+    JOB_INDEX,
+    JOB_MAX_ATTEMPTS,
+    JOB_SUMMARIZE,
+    JOB_UNINDEX,
+    dead_letter,
+    ensure_group,
+    job_kind,
+    queue_wait,
+    requeue,
+)
+from src.app.model_client import USE_MODEL_SERVER, ModelClient
+from src.app.rag import (
+    ANSWER_TTL,
+    RAG_ANSWER_TOKENS,
+    RAG_TOP_K,
+    Retriever,
+    answer_key,
+    sources_json,
+)
+from src.app.schemas import DocumentStatus
+from src.app.storage import DocumentStore, now_iso
+from src.app.streaming import TokenRelay
+from src.app.summarizer import HierarchicalSummarizer
+from src.app.summary_cache import SummaryCache, content_hash
+from src.app.vector_index import (
+    DEFAULT_COLLECTION,
+    VECTOR_COMPACT_INTERVAL,
+    VectorIndex,
+)
+from src.logger import log
+
+redis_url = os.getenv("REDIS_URL", "redis://redis:6379/0")
+
+# Сколько задач воркер обрабатывает одновременно (не меньше размера пачки,
+# иначе пачки не будут наполняться)
+WORKER_CONCURRENCY = int(
+    os.getenv("WORKER_CONCURRENCY", str(BATCH_MAX_SIZE))
+)
+# Сколько мс блокируемся на XREADGROUP в ожидании новых задач
+WORKER_BLOCK_MS = int(os.getenv("WORKER_BLOCK_MS", "5000"))
+# Как часто (сек) проверяем зависшие задачи умерших воркеров
+WORKER_RECOVERY_INTERVAL = float(os.getenv("WORKER_RECOVERY_INTERVAL", "60"))
+
+
+class GenerationWorker:
+    """
+    Воркер, забирающий задачи из Redis Streams: суммаризацию документов,
+    их индексацию для поиска и ответы на вопросы (RAG)
+    """
+
+    def __init__(
+        self,
+        redis_client,
+        raw_client,
+        consumer_name: str,
+        summarizer: HierarchicalSummarizer,
+        summary_cache: SummaryCache,
+        retriever: Retriever,
+        scheduler,
+        concurrency: int = WORKER_CONCURRENCY,
+    ):
+        self.redis = redis_client
+        self.store = DocumentStore(redis_client, raw_client)
+        self.summarizer = summarizer
+        self.summary_cache = summary_cache
+        self.retriever = retriever
+        # BatchScheduler в процессе или ModelClient модельного сервера
+        self.scheduler = scheduler
+        self._handlers = {
+            JOB_SUMMARIZE: self._summarize,
+            JOB_INDEX: self._index,
+            JOB_ASK: self._answer,
+            JOB_UNINDEX: self._unindex,
+        }
+        self.consumer_name = consumer_name
+        self.concurrency = concurrency
+        self._slots = asyncio.Semaphore(concurrency)
+        self._tasks: set[asyncio.Task] = set()
+        self._stopping = asyncio.Event()
+
+    def stop(self):
+        """Останавливает приём новых задач, текущие дорабатывают"""
+        self._stopping.set()
+
+    async def run(self):
+        await ensure_group(self.redis)
+        log.info(
+            f"Воркер {self.consumer_name} запущен "
+            f"(concurrency={self.concurrency})"
+        )
+        # Сначала дорабатываем то, что осталось за нами после рестарта
+        await self._consume(pending=True)
+        recovery = asyncio.create_task(self._recovery_loop())
+        compaction = asyncio.create_task(self._compaction_loop())
+        try:
+            while not self._stopping.is_set():
+                await self._consume(pending=False)
+        finally:
+            recovery.cancel()
+            compaction.cancel()
+            if self._tasks:
+                await asyncio.gather(*self._tasks, return_exceptions=True)
+            log.info(f"Воркер {self.consumer_name} остановлен")
+
+    async def _consume(self, pending: bool):
+        """Читает порцию сообщений: свои незавершённые или новые"""
+        free = await self._wait_free_slot()
+        response = await self.redis.xreadgroup(
+            GENERATE_GROUP,
+            self.consumer_name,
+            {GENERATE_STREAM: "0" if pending else ">"},
+            count=free if not pending else None,
+            block=None if pending else WORKER_BLOCK_MS,
+        )
+        for _, messages in response or []:
+            for entry_id, fields in messages:
+                await self._dispatch(entry_id, fields)
+
+    async def _wait_free_slot(self) -> int:
+        """Ждёт хотя бы один свободный слот, возвращает их число"""
+        await self._slots.acquire()
+        self._slots.release()
+        return max(1, self.concurrency - len(self._tasks))
+
+    async def _dispatch(self, entry_id: str, fields: dict):
+        await self._slots.acquire()
+        task = asyncio.create_task(self._process(entry_id, fields))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        task.add_done_callback(lambda _: self._slots.release())
+
+    async def _recovery_loop(self):
+        """Забирает задачи, зависшие у умерших воркеров (XAUTOCLAIM)"""
+        while not self._stopping.is_set():
+            await asyncio.sleep(WORKER_RECOVERY_INTERVAL)
+            try:
+                await self._recover()
+            except Exception as e:
+                log.error(f"Ошибка восстановления задач: {e}", exc_info=True)
+
+    async def _compaction_loop(self):
+        """Периодически переписывает коллекции с большой долей удалённых"""
+        while not self._stopping.is_set():
+            await asyncio.sleep(VECTOR_COMPACT_INTERVAL)
+            try:
+                await asyncio.to_thread(self.retriever.index.compact)
+            except Exception as e:
+                log.error(f"Ошибка уплотнения индекса: {e}", exc_info=True)
+
+    async def _recover(self):
+        start = "0-0"
+        while True:
+            start, messages, *_ = await self.redis.xautoclaim(
+                GENERATE_STREAM,
+                GENERATE_GROUP,
+                self.consumer_name,
+                min_idle_time=JOB_CLAIM_IDLE_MS,
+                start_id=start,
+                count=self.concurrency,
+            )
+            for entry_id, fields in messages:
+                log.warning(f"Забрали зависшую задачу {entry_id}")
+                if await self._delivered_too_often(entry_id):
+                    # Задача, вероятно, роняет воркер - больше не пробуем
+                    await self._fail(
+                        fields,
+                        JOB_MAX_ATTEMPTS,
+                        "Воркер падал при обработке задачи",
+                    )
+                    await self.redis.xack(
+                        GENERATE_STREAM, GENERATE_GROUP, entry_id
+                    )
+                    continue
+                await self._dispatch(entry_id, fields)
+            if start in ("0-0", b"0-0"):
+                break
+
+    async def _delivered_too_often(self, entry_id: str) -> bool:
+        pending = await self.redis.xpending_range(
+            GENERATE_STREAM,
+            GENERATE_GROUP,
+            min=entry_id,
+            max=entry_id,
+            count=1,
+        )
+        return bool(pending) and (
+            pending[0]["times_delivered"] > JOB_MAX_ATTEMPTS
+        )
+
+    async def _process(self, entry_id: str, fields: dict):
+        kind = job_kind(fields)
+        attempt = int(fields.get("attempt", 0))
+        if fields.get("document_id"):
+            tracing.bind(fields["document_id"])
+        wait = queue_wait(fields)
+        if wait is not None:
+            metrics.JOB_QUEUE_SECONDS.observe(wait, kind=kind)
+            tracing.record(
+                "queue.wait", time.time() - wait, wait,
+                kind=kind, attempt=attempt,
+            )
+        started = time.perf_counter()
+        outcome = "ok"
+        try:
+            try:
+                handler = self._handlers.get(kind)
+                if handler is None:
+                    log.warning(f"Неизвестный вид задачи {kind}, пропускаем")
+                    outcome = "skipped"
+                else:
+                    with tracing.span(f"worker.{kind}", attempt=attempt):
+                        await handler(fields)
+            except Exception as e:
+                outcome = "error"
+                target = fields.get("document_id") or fields.get("answer_id")
+                log.error(
+                    f"Ошибка задачи {kind} {target} "
+                    f"(попытка {attempt + 1}/{JOB_MAX_ATTEMPTS}): {e}",
+                    exc_info=True,
+                )
+                await self._fail(fields, attempt, str(e))
+        except Exception as e:
+            # Повтор или dead letter не записались: без XACK задача
+            # остаётся в PEL, её заберёт _recover
+            outcome = "unacked"
+            log.error(
+                f"Задача {entry_id} оставлена в очереди: {e}", exc_info=True
+            )
+            return
+        finally:
+            metrics.JOB_SECONDS.observe(
+                time.perf_counter() - started, kind=kind, outcome=outcome
+            )
+        # Подтверждаем, только когда задача выполнена или передана дальше
+        await self.redis.xack(GENERATE_STREAM, GENERATE_GROUP, entry_id)
+
+    async def _summarize(self, fields: dict):
+        document_id = fields.get("document_id")
+        doc = await self.store.get(document_id, with_text=True)
+        if not doc:
+            log.warning(f"Документ {document_id} не найден, пропускаем")
+            return
+        if doc.status == DocumentStatus.done:
+            return
+
+        # Инференс идёт в потоке планировщика пачек,
+        # длинные документы - через map-reduce по чанкам.
+        # Токены финального шага транслируются в Redis для SSE; событие
+        # done уходит при выходе из блока - уже после перехода в done,
+        # чтобы клиент, получив его, видел готовый результат в /status
+        async with TokenRelay(self.redis, document_id) as relay:
+            summary = await self.summarizer.summarize(
+                doc.text,
+                on_token=relay,
+                decoding=fields.get("decoding") or None,
+            )
+
+            text_hash = doc.content_hash or content_hash(doc.text)
+            with tracing.span("worker.result"):
+                await self.store.transition(
+                    document_id,
+                    DocumentStatus.done,
+                    result=summary,
+                    content_hash=text_hash,
+                    updated_at=now_iso(),
+                )
+                await self.summary_cache.set(text_hash, summary)
+        log.info(f"Документ {document_id} обработан")
+
+    async def _index(self, fields: dict):
+        """Чанки документа в векторный индекс"""
+        document_id = fields.get("document_id")
+        doc = await self.store.get(document_id, with_text=True)
+        if not doc:
+            log.warning(f"Документ {document_id} не найден, пропускаем")
+            return
+        count = await asyncio.to_thread(
+            self.retriever.index_document,
+            document_id,
+            doc.text,
+            doc.collection,
+        )
+        if not await self.store.update(document_id, indexed_chunks=count):
+            # Документ удалили, пока он индексировался
+            await asyncio.to_thread(self.retriever.index.remove, document_id)
+            return
+        log.info(f"Документ {document_id} проиндексирован: {count} чанков")
+
+    async def _unindex(self, fields: dict):
+        """Tombstone чанков удалённых документов"""
+        document_ids = [
+            document_id
+            for document_id in fields.get("document_ids", "").split(",")
+            if document_id
+        ]
+        for document_id in document_ids:
+            await asyncio.to_thread(self.retriever.index.remove, document_id)
+        log.info(f"Удалены из индекса: {len(document_ids)} документов")
+
+    async def _answer(self, fields: dict):
+        """Ответ на вопрос по найденным чанкам (компактный промпт)"""
+        answer_id = fields.get("answer_id")
+        key = answer_key(answer_id)
+        question = await self.redis.hgetall(key)
+        if not question or question.get("status") == "done":
+            return
+
+        hits = await asyncio.to_thread(
+            self.retriever.retrieve,
+            question["question"],
+            int(question.get("top_k") or RAG_TOP_K),
+            question.get("document_id") or None,
+            question.get("collection") or DEFAULT_COLLECTION,
+        )
+        prompt, sources = await asyncio.to_thread(
+            self.retriever.build_prompt,
+            question["question"],
+            hits,
+            self.summarizer.manager.count_tokens,
+        )
+        if sources:
+            answer = await asyncio.wrap_future(self.scheduler.submit(
+                prompt, RAG_ANSWER_TOKENS, prompt=ANSWER_PROMPT
+            ))
+        else:
+            answer = "No relevant fragments found in the indexed documents."
+
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.hset(key, mapping={
+            "status": "done",
+            "answer": answer,
+            "sources": sources_json(sources),
+            "updated_at": now_iso(),
+        })
+        pipe.expire(key, ANSWER_TTL)
+        await pipe.execute()
+        log.info(f"Ответ {answer_id} готов ({len(sources)} фрагментов)")
+
+    async def _fail(self, fields: dict, attempt: int, error: str):
+        """Повторная постановка в очередь или перевод в статус error"""
+        if attempt + 1 < JOB_MAX_ATTEMPTS:
+            await requeue(self.redis, fields, attempt + 1)
+            return
+        await dead_letter(self.redis, fields, error)
+        kind = job_kind(fields)
+        if kind == JOB_SUMMARIZE:
+            await self.store.transition(
+                fields.get("document_id"),
+                DocumentStatus.error,
+                result="",
+                updated_at=now_iso(),
+            )
+        elif kind == JOB_ASK:
+            await self.redis.hset(
+                answer_key(fields.get("answer_id")),
+                mapping={"status": "error", "updated_at": now_iso()},
+            )
+
+
+async def main():
+    redis_client = redis.from_url(redis_url, decode_responses=True)
+    # Без декодирования - для сжатых текстов документов
+    raw_client = redis.from_url(redis_url)
+    await redis_client.ping()
+    log.info("Подключение к Redis установлено.")
+    metrics.instrument_redis(redis_client)
+    metrics.instrument_redis(raw_client)
+
+    consumer_name = os.getenv(
+        "WORKER_NAME", f"{socket.gethostname()}-{os.getpid()}"
+    )
+    if USE_MODEL_SERVER:
+        # Веса держит src.model_server; ждём, пока он прогреется
+        client = ModelClient()
+        health = await client.connect()
+        manager, scheduler = client, client
+        generation = health.get("generation")
+    else:
+        # Модель в процессе воркера: torch и transformers нужны только здесь
+        from src.app.ai_model import model_manager
+
+        manager = model_manager
+        scheduler = BatchScheduler(model_manager)
+        generation = None
+    summarizer = HierarchicalSummarizer(manager, scheduler, redis_client)
+    # Отпечаток по параметрам процесса, который генерирует; API его читает
+    summary_cache = SummaryCache(
+        redis_client, manager.model_name, generation=generation
+    )
+    await summary_cache.publish()
+    from src.app.embeddings import embedding_model
+
+    retriever = Retriever(embedding_model, VectorIndex())
+    worker = GenerationWorker(
+        redis_client,
+        raw_client,
+        consumer_name,
+        summarizer,
+        summary_cache,
+        retriever,
+        scheduler,
+    )
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, worker.stop)
+
+    # Прогрев: загружаем модель (или токенизатор) до приёма задач
+    await asyncio.to_thread(manager.load_model)
+    flusher = asyncio.create_task(metrics.flush_loop(redis_client))
+    try:
+        await worker.run()
+    finally:
+        flusher.cancel()
+        await metrics.flush_all(redis_client)
+        if USE_MODEL_SERVER:
+            await client.close()
+        else:
+            await asyncio.to_thread(scheduler.stop)
+            log.info(f"Метрики пачек: {scheduler.metrics()}")
+            manager.unload_model()
+        await redis_client.close()
+        await raw_client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,21 @@
+import fakeredis
+import fakeredis.aioredis
+import pytest
+
+
+@pytest.fixture
+def redis_clients():
+    """
+    Фабрика пары клиентов к общему fakeredis: с decode_responses и без
+    (как redis_client и raw_client в приложении). Клиенты привязаны к
+    циклу событий, поэтому создаются внутри asyncio.run теста
+    """
+    server = fakeredis.FakeServer()
+
+    def connect():
+        return (
+            fakeredis.aioredis.FakeRedis(server=server, decode_responses=True),
+            fakeredis.aioredis.FakeRedis(server=server),
+        )
+
+    return connect
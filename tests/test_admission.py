@@ -0,0 +1,61 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from src.app.admission import LANE_LONG, LANE_SHORT, AdmissionController
+from src.app.jobs import GENERATE_GROUP
+
+
+class QueueRedis:
+    """Только то, что нужно контроллеру: скрипт и XINFO GROUPS"""
+
+    def __init__(self, pending: int, lag: int):
+        self.group = {
+            "name": GENERATE_GROUP,
+            "pending": pending,
+            "lag": lag,
+            "entries-read": 0,
+        }
+
+    def register_script(self, script):
+        return None
+
+    async def xinfo_groups(self, stream):
+        return [self.group]
+
+
+def controller(depth: int) -> AdmissionController:
+    return AdmissionController(
+        QueueRedis(pending=depth, lag=0),
+        max_depth=10,
+        max_wait=0,
+        long_share=0.5,
+    )
+
+
+def check(admission, lane, jobs=1):
+    asyncio.run(admission.check_queue(lane, jobs))
+
+
+def test_single_job_admitted_below_limit():
+    check(controller(9), LANE_SHORT)
+
+
+def test_single_job_rejected_at_limit():
+    with pytest.raises(HTTPException) as error:
+        check(controller(10), LANE_SHORT)
+    assert error.value.status_code == 503
+    assert "Retry-After" in error.value.headers
+
+
+def test_batch_counts_all_jobs():
+    check(controller(2), LANE_LONG, jobs=3)
+    with pytest.raises(HTTPException):
+        check(controller(2), LANE_LONG, jobs=4)
+
+
+def test_long_lane_uses_its_share():
+    check(controller(5), LANE_SHORT)
+    with pytest.raises(HTTPException):
+        check(controller(5), LANE_LONG)
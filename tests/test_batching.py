@@ -0,0 +1,151 @@
+import time
+
+import pytest
+
+from src.app.batching import BatchScheduler, CostModel, _Request
+
+
+class StubManager:
+    """Длина промпта - число слов; summary - сам текст"""
+
+    def count_tokens(self, texts, prompt=None):
+        return [len(text.split()) for text in texts]
+
+    def summarize_batch(self, texts, max_new_tokens, callbacks, prompt, decoding):
+        return list(texts)
+
+
+def scheduler(**kwargs) -> BatchScheduler:
+    options = {
+        "max_batch_size": 8,
+        "bucket_ratio": 100.0,
+        "max_batch_tokens": 100_000,
+        "aging_tokens": 0.0,
+    }
+    options.update(kwargs)
+    return BatchScheduler(StubManager(), **options)
+
+
+def request(words: int, age: float = 0.0, max_new_tokens: int = 10, **kwargs):
+    return _Request(
+        " ".join(["w"] * words),
+        max_new_tokens,
+        submitted_at=time.perf_counter() - age,
+        **kwargs,
+    )
+
+
+def admit(batches: BatchScheduler, *requests: _Request) -> list[_Request]:
+    batches._admit(list(requests))
+    return list(requests)
+
+
+def test_shortest_job_opens_batch():
+    batches = scheduler(max_batch_size=1)
+    long, short, medium = admit(batches, request(50), request(5), request(20))
+    order = [batches._select()[0] for _ in range(3)]
+    assert order == [short, medium, long]
+    assert batches.aged == 0
+
+
+def test_aging_lets_old_long_request_overtake():
+    batches = scheduler(max_batch_size=1, aging_tokens=100.0)
+    long, short = admit(batches, request(300, age=5.0), request(5))
+    assert batches._select() == [long]
+    assert batches.aged == 1
+    assert batches._select() == [short]
+
+
+def test_batch_tokens_limit_cuts_batch():
+    # (prompt + max_new_tokens) * size: 2 * (40 + 10) = 100
+    batches = scheduler(max_batch_tokens=100)
+    first, second, third = admit(
+        batches, request(40), request(40), request(40)
+    )
+    assert batches._select() == [first, second]
+    assert batches._select() == [third]
+
+
+def test_batch_keeps_groups_and_length_buckets():
+    batches = scheduler(bucket_ratio=2.0)
+    short, other_prompt, too_long, close = admit(
+        batches,
+        request(10),
+        request(10, prompt="{text}"),
+        request(30),
+        request(15),
+    )
+    assert batches._select() == [short, close]
+    assert batches._select() == [other_prompt]
+    assert batches._select() == [too_long]
+
+
+def test_admit_failure_rejects_only_its_prompt_group():
+    class FailingManager(StubManager):
+        def count_tokens(self, texts, prompt=None):
+            if prompt:
+                raise ValueError("tokenizer")
+            return super().count_tokens(texts)
+
+    batches = BatchScheduler(FailingManager())
+    ok, bad = request(3), request(3, prompt="{text}")
+    batches._admit([ok, bad])
+    assert batches._pending == [ok]
+    with pytest.raises(ValueError):
+        bad.future.result(timeout=0)
+
+
+def test_cost_model_recovers_coefficients():
+    model = CostModel(decay=1.0)
+    assert model.coefficients() is None
+    for padded, steps in [(100, 10), (400, 10), (800, 50), (200, 100), (50, 30)]:
+        model.update(padded, steps, 0.001 * padded + 0.02 * steps)
+    per_token, per_step = model.coefficients()
+    assert per_token == pytest.approx(0.001, rel=1e-3)
+    assert per_step == pytest.approx(0.02, rel=1e-3)
+    assert model.predict(1000, 20) == pytest.approx(1.4, rel=1e-3)
+
+
+def test_cost_model_forgets_old_observations():
+    model = CostModel(decay=0.5)
+    for _ in range(20):
+        model.update(100, 10, 1.0)
+        model.update(200, 40, 2.0)
+    for _ in range(20):
+        model.update(100, 10, 3.0)
+        model.update(200, 40, 6.0)
+    assert model.predict(100, 10) == pytest.approx(3.0, rel=0.05)
+
+
+def test_run_records_stats_and_trains_cost_model():
+    batches = scheduler()
+    for words in (10, 30, 60):
+        requests = admit(batches, request(words), request(words // 2))
+        batches._run(batches._select(), 10)
+        assert [r.future.result(timeout=0) for r in requests] == [
+            r.text for r in requests
+        ]
+    metrics = batches.metrics()
+    assert metrics["batches"] == 3
+    assert metrics["avg_batch_size"] == 2
+    assert metrics["cost_model"] is not None
+    assert metrics["cost_error_p50"] is not None
+    assert metrics["pending"] == 0
+
+
+def test_loop_survives_token_counting_failure():
+    class FlakyManager(StubManager):
+        def count_tokens(self, texts, prompt=None):
+            if any("boom" in text for text in texts):
+                raise ValueError("tokenizer")
+            return super().count_tokens(texts)
+
+    batches = BatchScheduler(FlakyManager(), max_wait_ms=1)
+    try:
+        failed = batches.submit("boom")
+        with pytest.raises(ValueError):
+            failed.result(timeout=5)
+        # Поток планировщика жив и обслуживает следующие запросы
+        assert batches.submit("still works").result(timeout=5) == "still works"
+    finally:
+        batches.stop()
@@ -0,0 +1,130 @@
+import io
+import struct
+import zipfile
+
+import pytest
+
+from src.app.services.doc_processor import doc_streams_text, docx_text
+
+NS = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+
+
+def paragraph(text: str) -> str:
+    return f"<w:p><w:r><w:t>{text}</w:t></w:r></w:p>"
+
+
+def table(*rows: list[str]) -> str:
+    body = "".join(
+        "<w:tr>" + "".join(f"<w:tc>{cell}</w:tc>" for cell in row) + "</w:tr>"
+        for row in rows
+    )
+    return f"<w:tbl>{body}</w:tbl>"
+
+
+def make_docx(body: str, **parts: str) -> io.BytesIO:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        archive.writestr(
+            "word/document.xml",
+            f"<w:document {NS}><w:body>{body}</w:body></w:document>",
+        )
+        for name, xml in parts.items():
+            archive.writestr(f"word/{name}.xml", f"<w:hdr {NS}>{xml}</w:hdr>")
+    buffer.seek(0)
+    return buffer
+
+
+def test_docx_paragraphs_and_table():
+    body = paragraph("Title") + table(
+        [paragraph("a"), paragraph("b")],
+        [paragraph("c"), paragraph("d")],
+    )
+    assert docx_text(make_docx(body)) == "Title\na\tb\nc\td"
+
+
+def test_docx_nested_table_stays_in_parent_cell():
+    inner = table([paragraph("x"), paragraph("y")], [paragraph("z"), ""])
+    body = table(
+        [paragraph("left"), paragraph("mid") + inner, paragraph("right")],
+        [paragraph("next"), paragraph("row"), ""],
+    ) + paragraph("after")
+    assert docx_text(make_docx(body)) == (
+        "left\tmid x y z\tright\nnext\trow\t\nafter"
+    )
+
+
+def test_docx_repeated_headers_once():
+    source = make_docx(
+        paragraph("Body"),
+        header1=paragraph("Head"),
+        header2=paragraph("Head"),
+        footer1=paragraph("Foot"),
+    )
+    assert docx_text(source) == "Head\n\nBody\n\nFoot"
+
+
+def make_word_document(
+    pieces: list[tuple[str, bool]],
+    ccp_text: int,
+    ccp_hdd: int = 0,
+) -> tuple[bytes, bytes]:
+    """
+    Минимальный FIB и таблица фрагментов: pieces - (текст, 8-битный ли),
+    тексты фрагментов лежат в WordDocument после FIB
+    """
+    cslw = 22
+    rg_lw = 36
+    rg_fc_lcb = rg_lw + cslw * 4 + 2
+    fib_size = rg_fc_lcb + 34 * 8
+    header = bytearray(fib_size)
+    struct.pack_into("<H", header, 0, 0xA5EC)
+    struct.pack_into("<H", header, 32, 0)
+    struct.pack_into("<H", header, 34, cslw)
+    struct.pack_into("<3i", header, rg_lw + 12, ccp_text, 0, ccp_hdd)
+
+    data = bytearray()
+    cps, fcs = [0], []
+    for text, compressed in pieces:
+        offset = fib_size + len(data)
+        if compressed:
+            data += text.encode("cp1252")
+            fcs.append((offset * 2) | 0x40000000)
+        else:
+            data += text.encode("utf-16-le")
+            fcs.append(offset)
+        cps.append(cps[-1] + len(text))
+
+    plc = struct.pack(f"<{len(cps)}I", *cps) + b"".join(
+        struct.pack("<HIH", 0, fc, 0) for fc in fcs
+    )
+    clx = b"\x01" + struct.pack("<h", 2) + b"\x00\x00"  # Prc
+    clx += b"\x02" + struct.pack("<I", len(plc)) + plc
+    table_stream = b"\xff" * 16 + clx
+    struct.pack_into("<II", header, rg_fc_lcb + 33 * 8, 16, len(clx))
+    return bytes(header + data), table_stream
+
+
+def test_doc_pieces_mixed_encodings():
+    word_document, table_stream = make_word_document(
+        [("Hello\r", True), ("Привет\r", False)],
+        ccp_text=13,
+    )
+    assert doc_streams_text(word_document, table_stream) == "Hello\nПривет"
+
+
+def test_doc_fields_tables_and_headers():
+    body = "\x13 HYPERLINK x \x14link\x15 a\x07b\x07\x07end\r"
+    header = "Top\r"
+    word_document, table_stream = make_word_document(
+        [(body + header, False)],
+        ccp_text=len(body),
+        ccp_hdd=len(header),
+    )
+    assert doc_streams_text(word_document, table_stream) == (
+        "Top\n\nlink a\tb\nend"
+    )
+
+
+def test_doc_bad_magic():
+    with pytest.raises(ValueError):
+        doc_streams_text(b"\x00" * 512, b"")
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from src.app.fulltext import POSTING, bm25, snippet, tokenize
+
+
+def postings(*records: tuple[int, int, int]) -> bytes:
+    return np.array(list(records), POSTING).tobytes()
+
+
+def test_tokenize_lowercases_and_skips_short_words():
+    assert tokenize("A Quick, quick fox!") == ["quick", "quick", "fox"]
+
+
+def test_bm25_ranks_by_term_frequency():
+    blob = postings((1, 1, 10), (2, 5, 10), (3, 2, 10))
+    numbers, scores = bm25([blob], np.zeros(0, np.uint32), 3, 30, 10)
+    assert numbers.tolist() == [2, 3, 1]
+    assert np.all(np.diff(scores) < 0)
+
+
+def test_bm25_sums_terms_and_prefers_rare_ones():
+    common = postings((1, 1, 10), (2, 1, 10), (3, 1, 10))
+    rare = postings((3, 1, 10))
+    numbers, scores = bm25([common, rare, None], np.zeros(0, np.uint32), 4, 40, 10)
+    assert numbers[0] == 3
+    assert scores[0] > scores[1]
+
+
+def test_bm25_skips_deleted_and_limits():
+    blob = postings((1, 3, 10), (2, 2, 10), (3, 1, 10))
+    deleted = np.array([1], np.uint32)
+    numbers, _ = bm25([blob], deleted, 3, 30, 1)
+    assert numbers.tolist() == [2]
+
+
+def test_bm25_empty_index():
+    numbers, scores = bm25([postings((1, 1, 1))], np.zeros(0, np.uint32), 0, 0, 5)
+    assert len(numbers) == 0 and len(scores) == 0
+
+
+def test_snippet_window_with_most_matches():
+    text = "intro " * 50 + "alpha beta alpha " + "filler " * 50 + "beta"
+    result = snippet(text, "alpha beta", chars=40)
+    assert result.startswith("… ") and result.endswith(" …")
+    assert result.count("alpha") == 2
+
+
+def test_snippet_whole_words_only():
+    assert snippet("cats and a cat", "cat", chars=100) == "cats and a cat"
+    assert "cat" in snippet("concatenate " * 30 + "cat", "cat", chars=30)
+
+
+@pytest.mark.parametrize("query", ["", "a ! ?"])
+def test_snippet_without_terms(query):
+    assert snippet("some text", query) == ""
+
+
+def test_snippet_without_matches_starts_at_beginning():
+    assert snippet("one two three four", "zebra", chars=9) == "one two …"
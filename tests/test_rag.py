@@ -0,0 +1,37 @@
+import pytest
+
+# rag импортирует модель суммаризации (torch, transformers)
+pytest.importorskip("transformers")
+
+from src.app.rag import Retriever  # noqa: E402
+
+
+def count_words(texts, prompt=None):
+    return [len(text.split()) for text in texts]
+
+
+def hit(text: str) -> dict:
+    return {"document_id": "d", "chunk": 0, "score": 1.0, "text": text}
+
+
+def test_build_prompt_uses_model_token_budget():
+    retriever = Retriever(None, None)
+    hits = [hit("one two three"), hit("four five"), hit("six seven eight")]
+    prompt, sources = retriever.build_prompt(
+        "What?", hits, count_words, max_context_tokens=5
+    )
+    assert sources == hits[:2]
+    assert prompt == "[1] one two three\n\n[2] four five\n\nQuestion: What?"
+
+
+def test_build_prompt_keeps_first_hit_over_budget():
+    retriever = Retriever(None, None)
+    hits = [hit("a b c d e f"), hit("g")]
+    _, sources = retriever.build_prompt("q", hits, count_words, 3)
+    assert sources == hits[:1]
+
+
+def test_build_prompt_without_hits():
+    prompt, sources = Retriever(None, None).build_prompt("q", [], count_words)
+    assert sources == []
+    assert prompt.endswith("Question: q")
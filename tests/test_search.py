@@ -0,0 +1,21 @@
+import pytest
+
+# Маршрут поиска импортирует энкодер (torch, transformers)
+pytest.importorskip("transformers")
+
+from src.app.routes.search import fuse  # noqa: E402
+
+
+def test_fuse_rewards_agreement():
+    ranked = fuse([["a", "b", "c"], ["b", "c", "d"]], k=60)
+    assert [document_id for document_id, _ in ranked] == ["b", "c", "a", "d"]
+
+
+def test_fuse_single_list_keeps_order():
+    ranked = fuse([["x", "y", "z"]], k=1)
+    assert [document_id for document_id, _ in ranked] == ["x", "y", "z"]
+    assert ranked[0][1] == pytest.approx(1 / 2)
+
+
+def test_fuse_empty():
+    assert fuse([[], []]) == []
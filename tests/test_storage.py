@@ -0,0 +1,148 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.app.schemas import DocumentDTO, DocumentStatus
+from src.app.storage import (
+    CREATED_INDEX,
+    EXPIRY_INDEX,
+    RETENTION,
+    DocumentStore,
+    status_index,
+)
+
+START = datetime(2024, 1, 1)
+
+
+def document(number: int, status=DocumentStatus.uploaded) -> DocumentDTO:
+    created = START + timedelta(seconds=number)
+    return DocumentDTO(
+        document_id=f"doc-{number}",
+        status=status,
+        text=f"text {number}",
+        created_at=created,
+        updated_at=created,
+    )
+
+
+async def members(redis, index: str) -> list[str]:
+    return [member.rsplit("|", 1)[1] for member in await redis.zrange(index, 0, -1)]
+
+
+def run(redis_clients, scenario):
+    async def main():
+        redis, raw = redis_clients()
+        await scenario(redis, DocumentStore(redis, raw))
+
+    asyncio.run(main())
+
+
+def test_create_writes_indexes_and_retention(redis_clients):
+    async def scenario(redis, store):
+        await store.create(document(1))
+        await store.create_many([document(2), document(3, DocumentStatus.done)])
+
+        assert await members(redis, CREATED_INDEX) == ["doc-1", "doc-2", "doc-3"]
+        assert await members(redis, status_index("uploaded")) == ["doc-1", "doc-2"]
+        assert await members(redis, status_index("done")) == ["doc-3"]
+        deadline = await redis.zscore(EXPIRY_INDEX, "doc-1")
+        expected = time.time() + RETENTION[DocumentStatus.uploaded]
+        assert deadline == pytest.approx(expected, abs=5)
+        doc = await store.get("doc-3", with_text=True)
+        assert doc.status == DocumentStatus.done and doc.text == "text 3"
+
+    run(redis_clients, scenario)
+
+
+def test_transition_moves_document_between_indexes(redis_clients):
+    async def scenario(redis, store):
+        await store.create(document(1))
+        assert await store.transition(
+            "doc-1",
+            DocumentStatus.processing,
+            expected=DocumentStatus.uploaded,
+            updated_at="2024-01-02T00:00:00",
+        )
+        assert await members(redis, status_index("uploaded")) == []
+        assert await members(redis, status_index("processing")) == ["doc-1"]
+        # processing хранится бессрочно
+        assert await redis.zscore(EXPIRY_INDEX, "doc-1") is None
+
+        assert await store.transition("doc-1", DocumentStatus.done, result="ok")
+        doc = await store.get("doc-1")
+        assert doc.status == DocumentStatus.done and doc.result == "ok"
+        assert await members(redis, status_index("done")) == ["doc-1"]
+        assert await redis.zscore(EXPIRY_INDEX, "doc-1") is not None
+
+    run(redis_clients, scenario)
+
+
+def test_transition_rejects_unexpected_or_missing_document(redis_clients):
+    async def scenario(redis, store):
+        await store.create(document(1, DocumentStatus.processing))
+        assert not await store.transition(
+            "doc-1", DocumentStatus.processing, expected=DocumentStatus.uploaded
+        )
+        assert not await store.transition("missing", DocumentStatus.done)
+        assert not await redis.exists(store.key("missing"))
+        assert await members(redis, status_index("processing")) == ["doc-1"]
+
+    run(redis_clients, scenario)
+
+
+def test_list_pages_newest_first(redis_clients):
+    async def scenario(redis, store):
+        await store.create_many([document(number) for number in range(5)])
+        await store.transition("doc-3", DocumentStatus.done)
+
+        pages, cursor = [], None
+        while True:
+            page, cursor = await store.list(cursor=cursor, limit=2)
+            pages.append([item["document_id"] for item in page])
+            if cursor is None:
+                break
+        assert pages == [["doc-4", "doc-3"], ["doc-2", "doc-1"], ["doc-0"]]
+
+        done, cursor = await store.list(status=DocumentStatus.done)
+        assert [item["document_id"] for item in done] == ["doc-3"]
+        assert cursor is None
+
+    run(redis_clients, scenario)
+
+
+def test_delete_hides_document_and_reclaim_frees_keys(redis_clients):
+    async def scenario(redis, store):
+        await store.create(document(1))
+        assert await store.delete("doc-1")
+        assert not await store.update("doc-1", indexed_chunks=3)
+        assert not await redis.exists(store.key("doc-1"))
+        assert await store.list() == ([], None)
+        # Текст освобождает sweeper
+        assert await redis.exists(store.text_key("doc-1"))
+
+        due = await store.due_for_reclaim(10)
+        assert due == ["doc-1"]
+        reclaimed, _ = await store.reclaim(due)
+        assert reclaimed == ["doc-1"]
+        assert not await redis.exists(store.text_key("doc-1"))
+        assert await redis.zcard(EXPIRY_INDEX) == 0
+
+    run(redis_clients, scenario)
+
+
+def test_reclaim_skips_document_with_extended_deadline(redis_clients):
+    async def scenario(redis, store):
+        await store.create(document(1))
+        await redis.zadd(EXPIRY_INDEX, {"doc-1": time.time() - 1})
+        due = await store.due_for_reclaim(10)
+        # Между выборкой и удалением документ сменил статус
+        await store.transition("doc-1", DocumentStatus.done)
+
+        reclaimed, _ = await store.reclaim(due)
+        assert reclaimed == []
+        assert (await store.get("doc-1")).status == DocumentStatus.done
+        assert await members(redis, CREATED_INDEX) == ["doc-1"]
+
+    run(redis_clients, scenario)
@@ -0,0 +1,93 @@
+import asyncio
+from datetime import datetime
+
+from src.app import streaming
+from src.app.schemas import DocumentDTO, DocumentStatus
+from src.app.streaming import stream_tokens
+from src.app.summary_cache import SummaryCache
+from src.worker import GenerationWorker
+
+
+class StubSummarizer:
+    def __init__(self, error: Exception = None):
+        self.error = error
+
+    async def summarize(self, text, on_token=None, decoding=None):
+        for chunk in ("first ", "second"):
+            on_token(chunk)
+            await asyncio.sleep(0.01)
+        if self.error:
+            raise self.error
+        return "first second"
+
+
+class Client:
+    async def is_disconnected(self) -> bool:
+        return False
+
+
+async def setup(redis_clients, summarizer) -> GenerationWorker:
+    redis, raw = redis_clients()
+    worker = GenerationWorker(
+        redis, raw, "test", summarizer, SummaryCache(redis, "stub"), None, None
+    )
+    now = datetime.utcnow()
+    await worker.store.create(DocumentDTO(
+        document_id="doc-1",
+        status=DocumentStatus.processing,
+        text="some text",
+        created_at=now,
+        updated_at=now,
+    ))
+    return worker
+
+
+def test_done_event_follows_status_change(redis_clients, monkeypatch):
+    monkeypatch.setattr(streaming, "SSE_BLOCK_MS", 10)
+
+    async def scenario():
+        worker = await setup(redis_clients, StubSummarizer())
+        transition = worker.store.transition
+
+        async def slow_transition(*args, **kwargs):
+            # Клиент успел бы прочитать done, пока статус ещё processing
+            await asyncio.sleep(0.1)
+            return await transition(*args, **kwargs)
+
+        worker.store.transition = slow_transition
+
+        async def listen():
+            events = []
+            async for event in stream_tokens(worker.redis, "doc-1", Client()):
+                events.append(event.split("\n", 1)[0])
+                if event.startswith("event: done"):
+                    doc = await worker.store.get("doc-1")
+                    return events, doc.status, doc.result
+
+        (events, status, result), _ = await asyncio.gather(
+            listen(), worker._summarize({"document_id": "doc-1"})
+        )
+        assert events[-1] == "event: done"
+        assert "event: token" in events
+        assert status == DocumentStatus.done
+        assert result == "first second"
+
+    asyncio.run(scenario())
+
+
+def test_failed_attempt_emits_reset(redis_clients):
+    async def scenario():
+        worker = await setup(
+            redis_clients, StubSummarizer(RuntimeError("inference failed"))
+        )
+        try:
+            await worker._summarize({"document_id": "doc-1"})
+        except RuntimeError:
+            pass
+        entries = await worker.redis.xrange(streaming.token_stream_key("doc-1"))
+        assert [fields for _, fields in entries][-1] == {"event": "reset"}
+        assert (await worker.store.get("doc-1")).status == (
+            DocumentStatus.processing
+        )
+
+    asyncio.run(scenario())
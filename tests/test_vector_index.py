@@ -0,0 +1,98 @@
+import json
+
+import numpy as np
+import pytest
+
+from src.app.vector_index import LOG_FILE, META_FILE, VectorCollection
+
+
+def vectors(count: int, seed: int) -> np.ndarray:
+    values = np.random.default_rng(seed).normal(size=(count, 8))
+    return (values / np.linalg.norm(values, axis=1, keepdims=True)).astype(
+        np.float32
+    )
+
+
+def generation(collection: VectorCollection):
+    return collection.path / (collection.path / "CURRENT").read_text()
+
+
+def texts(collection: VectorCollection, query: np.ndarray, k: int = 10):
+    return [hit["text"] for hit in collection.search(query, k)]
+
+
+@pytest.fixture
+def collections(tmp_path):
+    """Писатель и читатель одной коллекции (как два процесса)"""
+    path = tmp_path / "default"
+    return VectorCollection(path), VectorCollection(path)
+
+
+def test_reader_sees_appends_replacements_and_tombstones(collections):
+    writer, reader = collections
+    first, second = vectors(2, 1), vectors(1, 2)
+    writer.add("doc-1", ["a", "b"], first)
+    writer.add("doc-2", ["c"], second)
+    assert texts(reader, first[1], 1) == ["b"]
+
+    # Повторная индексация заменяет прежние чанки документа
+    replaced = vectors(1, 3)
+    writer.add("doc-1", ["a2"], replaced)
+    assert sorted(texts(reader, replaced[0])) == ["a2", "c"]
+
+    assert writer.remove("doc-2") == 1
+    assert writer.remove("doc-2") == 0
+    assert texts(reader, second[0]) == ["a2"]
+    assert reader.dead_ratio() == pytest.approx(3 / 4)
+
+
+def test_changes_are_logged_without_rewriting_meta(collections):
+    writer, _ = collections
+    writer.add("doc-1", ["a"], vectors(1, 1))
+    gen = generation(writer)
+    before = (gen / META_FILE).stat()
+
+    writer.add("doc-2", ["b"], vectors(1, 2))
+    writer.remove("doc-1")
+
+    after = (gen / META_FILE).stat()
+    assert (after.st_ino, after.st_mtime_ns) == (before.st_ino, before.st_mtime_ns)
+    records = [
+        json.loads(line) for line in (gen / LOG_FILE).read_text().splitlines()
+    ]
+    assert [record["op"] for record in records] == ["add", "add", "del"]
+
+
+def test_torn_log_record_is_ignored_and_overwritten(collections):
+    writer, _ = collections
+    first = vectors(1, 1)
+    writer.add("doc-1", ["a"], first)
+    with open(generation(writer) / LOG_FILE, "ab") as log:
+        log.write(b'{"op": "del", "doc"')
+
+    reader = VectorCollection(writer.path)
+    assert texts(reader, first[0]) == ["a"]
+
+    second = vectors(1, 2)
+    writer.add("doc-2", ["b"], second)
+    assert sorted(texts(reader, second[0])) == ["a", "b"]
+
+
+def test_compact_folds_log_into_new_generation(collections):
+    writer, reader = collections
+    for number in range(4):
+        writer.add(f"doc-{number}", [f"t{number}"], vectors(1, number))
+    writer.remove("doc-0")
+    writer.remove("doc-2")
+    old = generation(writer)
+
+    assert not writer.compact(min_ratio=0.9)
+    assert writer.compact(min_ratio=0.5)
+    gen = generation(writer)
+    assert gen != old and not old.exists()
+    meta = json.loads((gen / META_FILE).read_text())
+    assert [doc[0] for doc in meta["documents"]] == ["doc-1", "doc-3"]
+    assert meta["rows"] == 2
+    assert (gen / LOG_FILE).stat().st_size == 0
+    assert sorted(texts(reader, vectors(1, 3)[0])) == ["t1", "t3"]
+    assert reader.dead_ratio() == 0
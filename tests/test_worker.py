@@ -0,0 +1,158 @@
+import asyncio
+from datetime import datetime
+
+from src import worker as worker_module
+from src.app.jobs import (
+    DEAD_LETTER_STREAM,
+    GENERATE_GROUP,
+    GENERATE_STREAM,
+    JOB_MAX_ATTEMPTS,
+    JOB_SUMMARIZE,
+    enqueue_generation,
+    ensure_group,
+)
+from src.app.schemas import DocumentDTO, DocumentStatus
+from src.app.storage import DocumentStore
+from src.worker import GenerationWorker
+
+
+async def failing(fields: dict):
+    raise RuntimeError("inference failed")
+
+
+async def setup(redis_clients, handler=failing) -> GenerationWorker:
+    redis, raw = redis_clients()
+    await ensure_group(redis)
+    worker = GenerationWorker(redis, raw, "test", None, None, None, None)
+    worker._handlers[JOB_SUMMARIZE] = handler
+    return worker
+
+
+async def deliver(worker: GenerationWorker, stream_id: str = ">"):
+    response = await worker.redis.xreadgroup(
+        GENERATE_GROUP, worker.consumer_name, {GENERATE_STREAM: stream_id}
+    )
+    [(_, [(entry_id, fields)])] = response
+    return entry_id, fields
+
+
+async def pending(worker: GenerationWorker) -> int:
+    return (await worker.redis.xpending(GENERATE_STREAM, GENERATE_GROUP))[
+        "pending"
+    ]
+
+
+def test_failed_job_is_requeued_with_next_attempt(redis_clients):
+    async def scenario():
+        worker = await setup(redis_clients)
+        await enqueue_generation(worker.redis, "doc-1", decoding="assisted")
+        await worker._process(*await deliver(worker))
+
+        assert await pending(worker) == 0
+        entries = await worker.redis.xrange(GENERATE_STREAM)
+        assert len(entries) == 2
+        retry = entries[-1][1]
+        assert retry["attempt"] == "1"
+        assert retry["document_id"] == "doc-1"
+        assert retry["decoding"] == "assisted"
+        assert await worker.redis.xlen(DEAD_LETTER_STREAM) == 0
+
+    asyncio.run(scenario())
+
+
+def test_last_attempt_goes_to_dead_letter_and_marks_error(redis_clients):
+    async def scenario():
+        worker = await setup(redis_clients)
+        now = datetime.utcnow()
+        await worker.store.create(DocumentDTO(
+            document_id="doc-1",
+            status=DocumentStatus.processing,
+            text="text",
+            created_at=now,
+            updated_at=now,
+        ))
+        await enqueue_generation(
+            worker.redis, "doc-1", attempt=JOB_MAX_ATTEMPTS - 1
+        )
+        await worker._process(*await deliver(worker))
+
+        assert await pending(worker) == 0
+        assert await worker.redis.xlen(GENERATE_STREAM) == 1
+        [(_, dead)] = await worker.redis.xrange(DEAD_LETTER_STREAM)
+        assert dead["document_id"] == "doc-1"
+        assert dead["error"] == "inference failed"
+        doc = await worker.store.get("doc-1")
+        assert doc.status == DocumentStatus.error
+        listed, _ = await worker.store.list(status=DocumentStatus.error)
+        assert [item["document_id"] for item in listed] == ["doc-1"]
+
+    asyncio.run(scenario())
+
+
+def test_job_stays_pending_when_failure_is_not_recorded(redis_clients):
+    async def scenario():
+        worker = await setup(redis_clients)
+
+        async def broken_fail(fields, attempt, error):
+            raise ConnectionError("redis is gone")
+
+        worker._fail = broken_fail
+        await enqueue_generation(worker.redis, "doc-1")
+        entry_id, fields = await deliver(worker)
+        await worker._process(entry_id, fields)
+
+        # Ни повтора, ни XACK: задачу заберёт _recover
+        assert await pending(worker) == 1
+        assert await worker.redis.xlen(GENERATE_STREAM) == 1
+
+    asyncio.run(scenario())
+
+
+def test_recover_redispatches_stalled_job(redis_clients, monkeypatch):
+    monkeypatch.setattr(worker_module, "JOB_CLAIM_IDLE_MS", 0)
+    handled = []
+
+    async def handler(fields: dict):
+        handled.append(fields["document_id"])
+
+    async def scenario():
+        worker = await setup(redis_clients, handler)
+        await enqueue_generation(worker.redis, "doc-1")
+        # Забрал умерший воркер
+        await worker.redis.xreadgroup(
+            GENERATE_GROUP, "dead", {GENERATE_STREAM: ">"}
+        )
+        await worker._recover()
+        await asyncio.gather(*worker._tasks)
+
+        assert handled == ["doc-1"]
+        assert await pending(worker) == 0
+
+    asyncio.run(scenario())
+
+
+def test_recover_dead_letters_job_that_keeps_crashing(
+    redis_clients, monkeypatch
+):
+    monkeypatch.setattr(worker_module, "JOB_CLAIM_IDLE_MS", 0)
+    handled = []
+
+    async def handler(fields: dict):
+        handled.append(fields["document_id"])
+
+    async def scenario():
+        worker = await setup(redis_clients, handler)
+        await enqueue_generation(worker.redis, "doc-1")
+        await deliver(worker)
+        # Каждое чтение своих незавершённых - ещё одна доставка
+        for _ in range(JOB_MAX_ATTEMPTS - 1):
+            await deliver(worker, "0")
+        await worker._recover()
+        await asyncio.gather(*worker._tasks)
+
+        assert handled == []
+        assert await pending(worker) == 0
+        [(_, dead)] = await worker.redis.xrange(DEAD_LETTER_STREAM)
+        assert dead["document_id"] == "doc-1"
+
+    asyncio.run(scenario())